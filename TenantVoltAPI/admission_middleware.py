@@ -0,0 +1,216 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from TenantVoltAPI.utils import verify_firebase_token
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by (endpoint, client), refilled continuously at `rate` per second up to `burst`.
+
+    At most max_keys buckets are kept. The least recently used are dropped
+    first, and by then they have usually refilled anyway.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def acquire(self, key, rate, burst):
+        """Take one token; return 0 if admitted, else the seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / rate
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds load with fast 429/503 responses instead of letting requests queue behind slow upstream calls.
+
+    Each named endpoint gets a concurrency limit. A request over it is
+    answered 503 at once rather than waiting for a slot. Token buckets
+    limit the rate per client IP and, on endpoints that set uid_rate, per
+    Firebase uid of a valid bearer token. A request over either limit is
+    answered 429.
+    Both responses carry Retry-After. Limits come from
+    settings.ADMISSION_CONTROL: 'default' applies to every endpoint, and
+    'endpoints' overrides it per URL name. They are enforced per worker
+    process.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'ADMISSION_CONTROL', {})
+        self.enabled = config.get('enabled', True)
+        self.default = config.get('default', {})
+        self.endpoints = config.get('endpoints', {})
+        self.exempt_paths = tuple(config.get('exempt_paths', ()))
+        self.trust_forwarded_for = config.get('trust_forwarded_for', False)
+        self.rate_limiter = RateLimiter(config.get('max_clients', 100000))
+        self._semaphores = {}  # url_name -> BoundedSemaphore
+        self._semaphores_lock = threading.Lock()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # The checks run on the event loop; only verifying a token for uid_rate goes to a thread
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.admission_slot = None
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self._release(request)
+            raise
+        return self._hold_slot(request, response)
+
+    async def __acall__(self, request):
+        request.admission_slot = None
+        try:
+            response = await self.get_response(request)
+        except Exception:
+            self._release(request)
+            raise
+        return self._hold_slot(request, response)
+
+    def _hold_slot(self, request, response):
+        if request.admission_slot is not None and response.streaming:
+            # Hold the slot until the body has been streamed, not just until the view returned
+            if response.is_async:
+                response.streaming_content = self._arelease_after(request, response.streaming_content)
+            else:
+                response.streaming_content = self._release_after(request, response.streaming_content)
+        else:
+            self._release(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Return a 429/503 response for a request over its limits, or None and take its concurrency slot"""
+        url_name, limits = self._limits(request)
+        if limits is None:
+            return None
+
+        rejection = self._check_ip(request, url_name, limits)
+        # Only after the IP check, so an unverifiable token cannot buy a signature check per request
+        if rejection is None and limits.get('uid_rate'):
+            rejection = self._check_uid(url_name, limits, self._uid(request))
+        return rejection or self._take_slot(request, url_name, limits)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        url_name, limits = self._limits(request)
+        if limits is None:
+            return None
+
+        rejection = self._check_ip(request, url_name, limits)
+        if rejection is None and limits.get('uid_rate'):
+            # A token not in the cache costs an RSA verification, and maybe a certificate fetch
+            uid = await sync_to_async(self._uid, thread_sensitive=False)(request)
+            rejection = self._check_uid(url_name, limits, uid)
+        return rejection or self._take_slot(request, url_name, limits)
+
+    def _limits(self, request):
+        """Return (url_name, limits) for a request, with limits None if it is not admission controlled"""
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if not self.enabled or url_name is None or request.path.startswith(self.exempt_paths):
+            return url_name, None
+        return url_name, {**self.default, **self.endpoints.get(url_name, {})}
+
+    def _check_ip(self, request, url_name, limits):
+        if limits.get('ip_rate'):
+            retry_after = self.rate_limiter.acquire(
+                (url_name, 'ip', self._client_ip(request)), limits['ip_rate'], limits.get('ip_burst', 1))
+            if retry_after:
+                return self._reject(429, 'Too many requests', retry_after)
+        return None
+
+    def _check_uid(self, url_name, limits, uid):
+        if uid is not None:
+            retry_after = self.rate_limiter.acquire(
+                (url_name, 'uid', uid), limits['uid_rate'], limits.get('uid_burst', 1))
+            if retry_after:
+                return self._reject(429, 'Too many requests', retry_after)
+        return None
+
+    def _take_slot(self, request, url_name, limits):
+        if limits.get('concurrency'):
+            semaphore = self._semaphore(url_name, limits['concurrency'])
+            if not semaphore.acquire(blocking=False):
+                return self._reject(503, 'Server busy', limits.get('busy_retry_after', 1))
+            request.admission_slot = semaphore
+
+        return None
+
+    def _semaphore(self, url_name, concurrency):
+        semaphore = self._semaphores.get(url_name)
+        if semaphore is None:
+            with self._semaphores_lock:
+                semaphore = self._semaphores.setdefault(url_name, threading.BoundedSemaphore(concurrency))
+        return semaphore
+
+    @staticmethod
+    def _release(request):
+        slot = getattr(request, 'admission_slot', None)
+        if slot is not None:
+            request.admission_slot = None
+            slot.release()
+
+    def _release_after(self, request, streaming_content):
+        try:
+            yield from streaming_content
+        finally:
+            self._release(request)
+
+    async def _arelease_after(self, request, streaming_content):
+        try:
+            async for chunk in streaming_content:
+                yield chunk
+        finally:
+            self._release(request)
+
+    def _client_ip(self, request):
+        if self.trust_forwarded_for:
+            # The proxy in front of us appends the address it saw, so the last entry is the one to trust
+            forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+            if forwarded_for:
+                return forwarded_for.split(',')[-1].strip()
+        return request.META.get('REMOTE_ADDR', '')
+
+    @staticmethod
+    def _uid(request):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not auth_header.startswith('Bearer '):
+            return None
+        # Verified claims are cached, so login_required in the view does not verify the token again
+        user_data = verify_firebase_token(auth_header.split('Bearer ')[1])
+        return user_data.get('uid') if user_data else None
+
+    @staticmethod
+    def _reject(status, error, retry_after):
+        response = JsonResponse({'success': False, 'error': error}, status=status)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
@@ -1,20 +1,44 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponse
 
 class CorsMiddleware:
+    # Runs in the ASGI worker's event loop too, so async views are not pushed onto a thread
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if request.method == "OPTIONS":
+            return self._preflight()
+        return self._add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
         if request.method == "OPTIONS":
-            response = HttpResponse()
-            response["Access-Control-Allow-Origin"] = "*"  # For production, use your frontend domain
-            response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-            response["Access-Control-Max-Age"] = "86400"  # 24 hours
-            return response
+            return self._preflight()
+        return self._add_headers(await self.get_response(request))
+
+    @staticmethod
+    def _preflight():
+        response = HttpResponse()
+        response["Access-Control-Allow-Origin"] = "*"  # For production, use your frontend domain
+        response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, If-None-Match"
+        response["Access-Control-Max-Age"] = "86400"  # 24 hours
+        return response
 
-        response = self.get_response(request)
+    @staticmethod
+    def _add_headers(response):
         response["Access-Control-Allow-Origin"] = "*"
-        response["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+        response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, If-None-Match"
         response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response["Access-Control-Expose-Headers"] = "ETag, Last-Modified, Retry-After"
+        # Lets browser dev tools and the Resource Timing API show the Server-Timing breakdown
+        response["Timing-Allow-Origin"] = "*"
         return response
\ No newline at end of file
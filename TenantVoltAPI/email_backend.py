@@ -0,0 +1,203 @@
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+from TenantVoltAPI.metrics import timed
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """An authenticated SMTP connection plus the bookkeeping the pool needs"""
+
+    __slots__ = ('smtp', 'created_at', 'last_used', 'messages_sent')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    A bounded pool of authenticated SMTP connections shared by a worker's threads.
+
+    At most `size` connections exist at once. Idle connections are health checked
+    with NOOP before reuse and recycled after `max_messages` sends.
+    """
+
+    def __init__(self, size, health_check_interval, max_messages, acquire_timeout):
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.max_messages = max_messages
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def acquire(self, connect):
+        """Check out a healthy connection, opening one with `connect()` if none is idle"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise smtplib.SMTPException(f'No SMTP connection available after {self.acquire_timeout}s')
+
+        try:
+            while True:
+                with self._lock:
+                    pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    return PooledConnection(connect())
+                if self._is_healthy(pooled):
+                    return pooled
+                self._discard(pooled)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, pooled, reusable=True):
+        """Return a checked-out connection; broken or worn-out connections are closed"""
+        try:
+            pooled.last_used = time.monotonic()
+            if reusable and pooled.messages_sent < self.max_messages:
+                with self._lock:
+                    self._idle.append(pooled)
+            else:
+                self._discard(pooled)
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        try:
+            status, _ = pooled.smtp.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return status == 250
+
+    def _discard(self, pooled):
+        try:
+            pooled.smtp.quit()
+        except (smtplib.SMTPException, ssl.SSLError, OSError):
+            pooled.smtp.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key):
+    """Return the connection pool for a server/account key, creating it on first use"""
+    with _pools_lock:
+        pool = _pools.get(key)
+        # Sockets inherited across a fork belong to the parent, so each worker starts its own pool
+        if pool is None or pool._pid != os.getpid():
+            pool = SMTPConnectionPool(
+                size=getattr(settings, 'EMAIL_POOL_SIZE', 4),
+                health_check_interval=getattr(settings, 'EMAIL_POOL_HEALTH_CHECK_INTERVAL', 30),
+                max_messages=getattr(settings, 'EMAIL_POOL_MAX_MESSAGES', 100),
+                acquire_timeout=getattr(settings, 'EMAIL_POOL_ACQUIRE_TIMEOUT', 30),
+            )
+            _pools[key] = pool
+        return pool
+
+
+class PooledEmailBackend(EmailBackend):
+    """
+    SMTP backend that borrows authenticated connections from a per-worker pool
+    instead of doing a TLS handshake and AUTH for every email.
+
+    Configured through the usual EMAIL_* settings plus EMAIL_POOL_SIZE,
+    EMAIL_POOL_HEALTH_CHECK_INTERVAL, EMAIL_POOL_MAX_MESSAGES and
+    EMAIL_POOL_ACQUIRE_TIMEOUT.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = get_pool((self.host, self.port, self.username, self.use_ssl, self.use_tls))
+        self._pooled = None
+        self._broken = False
+
+    def _connect(self):
+        """Open a new authenticated connection using the stock SMTP backend logic"""
+        self.connection = None
+        try:
+            super().open()
+            if self.connection is None:
+                raise smtplib.SMTPServerDisconnected(f'Could not connect to {self.host}:{self.port}')
+            return self.connection
+        finally:
+            self.connection = None
+
+    def open(self):
+        if self.connection:
+            return False
+
+        try:
+            self._pooled = self.pool.acquire(self._connect)
+        except (smtplib.SMTPException, OSError):
+            if not self.fail_silently:
+                raise
+            return None
+
+        self.connection = self._pooled.smtp
+        self._broken = False
+        return True
+
+    def close(self):
+        """Hand the connection back to the pool rather than logging out"""
+        if self._pooled is None:
+            return
+        try:
+            self.pool.release(self._pooled, reusable=not self._broken)
+        finally:
+            self._pooled = None
+            self.connection = None
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        # Timed from the wait for a pooled connection to the last message sent
+        with self._lock, timed('smtp'):
+            new_conn_created = self.open()
+            if not self.connection or new_conn_created is None:
+                return 0
+            num_sent = 0
+            try:
+                for message in email_messages:
+                    try:
+                        sent = self._send(message)
+                    except smtplib.SMTPServerDisconnected:
+                        # The server dropped a pooled connection; reconnect once and retry
+                        logger.info("Pooled SMTP connection dropped, reconnecting")
+                        self.connection.close()
+                        self._pooled.smtp = self.connection = self._connect()
+                        self._pooled.messages_sent = 0
+                        sent = self._send(message)
+                    if sent:
+                        num_sent += 1
+                        self._pooled.messages_sent += 1
+            except BaseException:
+                # Don't hand a connection in an unknown protocol state to the next sender
+                self._broken = True
+                raise
+            finally:
+                if new_conn_created:
+                    self.close()
+        return num_sent
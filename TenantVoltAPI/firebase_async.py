@@ -0,0 +1,145 @@
+"""
+Async counterparts of firebase_config for views served on the ASGI worker.
+
+gRPC and httpx async clients are bound to the event loop they first run on,
+so one of each is kept per loop. Under uvicorn that is one per worker
+process.
+"""
+import asyncio
+import logging
+import weakref
+
+import httpx
+from google.cloud.firestore import AsyncClient
+
+from TenantVoltAPI import firebase_config
+from TenantVoltAPI.firebase_config import HTTP_POOL_SIZE, HTTP_TIMEOUT, initialize_firebase
+from TenantVoltAPI.metrics import instrument_firestore, timed
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# httpx logs every request at INFO; requests, used by the sync views, does not
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+# Responses worth another try; sign-in has no side effects, so it may be resent
+RETRY_STATUSES = (502, 503, 504)
+SIGN_IN_RETRIES = 2
+RETRY_BACKOFF = 0.2
+
+_firestore_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient
+_http_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+def get_async_firestore():
+    """Return the Firestore AsyncClient for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _firestore_clients.get(loop)
+    if client is None:
+        firebase_app, _ = initialize_firebase()
+        factory = firebase_config.get_async_client_factory()
+        if factory is not None:
+            client = factory()
+        else:
+            client = AsyncClient(project=firebase_app.project_id,
+                                 credentials=firebase_app.credential.get_credential())
+        client = _firestore_clients[loop] = instrument_firestore(client)
+    return client
+
+
+def get_async_http_client():
+    """
+    Return the shared httpx.AsyncClient for the running event loop
+
+    Keeps up to HTTP_POOL_SIZE connections alive and applies HTTP_TIMEOUT.
+    The transport retries failed connection attempts, which never reached
+    the server. Anything else is left to the caller.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        connect_timeout, read_timeout = HTTP_TIMEOUT
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_SIZE, max_connections=HTTP_POOL_SIZE * 10),
+            transport=httpx.AsyncHTTPTransport(retries=3),
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def async_sign_in_with_email_password(email, password):
+    """
+    Authenticates a user with email and password using Firebase Authentication REST API
+    Returns: (id_token, uid, error_message)
+    """
+    try:
+        # Firebase Auth REST API endpoint
+        sign_in_url = (f"{firebase_config.IDENTITY_TOOLKIT_URL}/accounts:signInWithPassword"
+                       f"?key={firebase_config.FIREBASE_WEB_API_KEY}")
+
+        # Payload for authentication
+        payload = {
+            "email": email,
+            "password": password,
+            "returnSecureToken": True
+        }
+
+        # Make the request to Firebase Auth API, retrying gateway errors
+        for attempt in range(SIGN_IN_RETRIES + 1):
+            with timed('identity_toolkit'):
+                response = await get_async_http_client().post(sign_in_url, json=payload)
+            if response.status_code not in RETRY_STATUSES or attempt == SIGN_IN_RETRIES:
+                break
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+        # Check if request was successful
+        if response.status_code == 200:
+            auth_data = response.json()
+            return auth_data.get('idToken'), auth_data.get('localId'), None
+
+        # Authentication failed
+        error_message = response.json().get('error', {}).get('message', 'Authentication failed')
+        logger.error(f"Authentication error: {error_message}")
+        return None, None, error_message
+
+    except Exception as e:
+        # httpx transport errors can have an empty message, which callers would read as success
+        error_message = str(e) or type(e).__name__
+        logger.error(f"Exception during authentication: {error_message}")
+        return None, None, error_message
+
+
+async def async_create_user_with_email_password(email, password):
+    """
+    Creates a new user with email and password using Firebase Authentication REST API
+    Returns: (uid, error_message)
+    """
+    try:
+        # Firebase Auth REST API endpoint for sign up; never resent, it is not idempotent
+        sign_up_url = f"{firebase_config.IDENTITY_TOOLKIT_URL}/accounts:signUp?key={firebase_config.FIREBASE_WEB_API_KEY}"
+
+        # Payload for authentication
+        payload = {
+            "email": email,
+            "password": password
+        }
+
+        # Make the request to Firebase Auth API
+        with timed('identity_toolkit'):
+            response = await get_async_http_client().post(sign_up_url, json=payload)
+
+        # Check if request was successful
+        if response.status_code == 200:
+            return response.json().get('localId'), None
+
+        # User creation failed
+        error_message = response.json().get('error', {}).get('message', 'User creation failed')
+        logger.error(f"User creation error: {error_message}")
+        return None, error_message
+
+    except Exception as e:
+        error_message = str(e) or type(e).__name__
+        logger.error(f"Exception during user creation: {error_message}")
+        return None, error_message
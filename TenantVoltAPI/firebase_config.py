@@ -1,10 +1,14 @@
 import json
 import os
+import threading
 import firebase_admin
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from firebase_admin import credentials, auth, firestore
 import logging
 from dotenv import load_dotenv
+from TenantVoltAPI.metrics import instrument_firestore, timed
 
 load_dotenv()
 
@@ -14,6 +18,16 @@ logger = logging.getLogger(__name__)
 
 FIREBASE_WEB_API_KEY = os.getenv("FIREBASE_WEB_API_KEY")
 
+# Base URL of the Firebase Auth REST API; override to point at a local stub
+IDENTITY_TOOLKIT_URL = os.getenv("IDENTITY_TOOLKIT_URL", "https://identitytoolkit.googleapis.com/v1").rstrip('/')
+
+# Outbound HTTP: (connect, read) timeouts in seconds and keep-alive connections per host
+HTTP_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05)), float(os.getenv("HTTP_READ_TIMEOUT", 10)))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# (app, client, async client factory) set by use_firestore_backend(); None means the Firebase project
+_firestore_backend = None
+
 # Get Firebase credentials from environment variable as JSON
 def get_firebase_credentials():
     firebase_credentials_json = os.getenv("FIREBASE_CREDENTIALS_JSON")
@@ -26,32 +40,128 @@ def get_firebase_credentials():
     except json.JSONDecodeError:
         raise ValueError("Invalid FIREBASE_CREDENTIALS_JSON format")
 
+def _retry(allowed_methods):
+    """
+    Bounded retry with backoff for connection failures and gateway errors
+
+    Failures to connect are always retried, because the request never left.
+    Read timeouts and 502/503/504 responses are retried only for
+    allowed_methods, the requests that are safe to send twice.
+    """
+    return Retry(
+        total=3, connect=3, read=1, status=2,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=allowed_methods,
+        raise_on_status=False,
+    )
+
+
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Return this process's shared requests.Session for outbound HTTP calls
+
+    The session keeps up to HTTP_POOL_SIZE connections per host alive, so
+    repeated calls skip the TCP and TLS handshakes. Pass timeout=HTTP_TIMEOUT
+    on every call. A forked worker builds its own session instead of sharing
+    the parent's sockets.
+    """
+    global _http_session, _http_session_pid
+
+    if _http_session is None or _http_session_pid != os.getpid():
+        with _http_session_lock:
+            if _http_session is None or _http_session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE,
+                                      max_retries=_retry(Retry.DEFAULT_ALLOWED_METHODS))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                # Signing in has no side effects, so its POST may be retried too; signUp must not be
+                session.mount(f"{IDENTITY_TOOLKIT_URL}/accounts:signInWithPassword", HTTPAdapter(
+                    pool_connections=1, pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=_retry(Retry.DEFAULT_ALLOWED_METHODS | {'POST'})))
+                _http_session = session
+                _http_session_pid = os.getpid()
+
+    return _http_session
+
+
 # Global variables to store Firebase app and Firestore client
 firebase_app = None
 firestore_db = None
+_firebase_lock = threading.Lock()
+
+
+def use_firestore_backend(app, client, async_client_factory):
+    """
+    Serve Firestore from a stand-in instead of the Firebase project
+
+    initialize_firebase() will return app and client, and get_async_firestore()
+    calls async_client_factory() once per event loop. Must be called before
+    initialize_firebase() first runs. For benchmarks and offline runs; see
+    benchmarks.memory_firestore.install().
+    """
+    global _firestore_backend
+
+    with _firebase_lock:
+        if firebase_app:
+            raise RuntimeError("Firebase is already initialized")
+        _firestore_backend = (app, client, async_client_factory)
+
+
+def get_async_client_factory():
+    """The async client factory given to use_firestore_backend(), or None for the Firebase project"""
+    return _firestore_backend[2] if _firestore_backend is not None else None
 
 
 def initialize_firebase():
-    """Initialize Firebase Admin SDK if not already initialized"""
+    """
+    Initialize Firebase Admin SDK if not already initialized
+
+    Safe to call from many threads at once: only the first caller initializes,
+    the others wait for it. Workers call it at startup (see TenantVoltAPI.warmup),
+    so requests normally find it done.
+    """
     global firebase_app, firestore_db
 
     if firebase_app:
         return firebase_app, firestore_db
 
-    try:
-        # Initialize the app with credential
-        logger.info(f"Initializing Firebase with config from: FIREBASE_CREDENTIALS_JSON")
-        cred = credentials.Certificate(get_firebase_credentials())
-        firebase_app = firebase_admin.initialize_app(cred)
-
-        # Initialize Firestore client
-        firestore_db = firestore.client()
-        logger.info("Firebase and Firestore initialized successfully")
-
-        return firebase_app, firestore_db
-    except Exception as e:
-        logger.error(f"Error initializing Firebase: {str(e)}")
-        raise
+    with _firebase_lock:
+        if firebase_app:
+            return firebase_app, firestore_db
+
+        if _firestore_backend is not None:
+            app, client, _ = _firestore_backend
+            logger.info(f"Using the Firestore backend {type(client).__name__}")
+            firestore_db = instrument_firestore(client)
+            firebase_app = app
+            return firebase_app, firestore_db
+
+        try:
+            # Initialize the app with credential
+            logger.info(f"Initializing Firebase with config from: FIREBASE_CREDENTIALS_JSON")
+            try:
+                # A previous attempt may have created the app before failing
+                app = firebase_admin.get_app()
+            except ValueError:
+                cred = credentials.Certificate(get_firebase_credentials())
+                app = firebase_admin.initialize_app(cred)
+
+            # Initialize Firestore client; published before the app, which is what callers check
+            firestore_db = instrument_firestore(firestore.client(app))
+            firebase_app = app
+            logger.info("Firebase and Firestore initialized successfully")
+
+            return firebase_app, firestore_db
+        except Exception as e:
+            logger.error(f"Error initializing Firebase: {str(e)}")
+            raise
 
 
 def sign_in_with_email_password(email, password):
@@ -61,7 +171,7 @@ def sign_in_with_email_password(email, password):
     """
     try:
         # Firebase Auth REST API endpoint
-        sign_in_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={FIREBASE_WEB_API_KEY}"
+        sign_in_url = f"{IDENTITY_TOOLKIT_URL}/accounts:signInWithPassword?key={FIREBASE_WEB_API_KEY}"
 
         # Payload for authentication
         payload = {
@@ -71,7 +181,8 @@ def sign_in_with_email_password(email, password):
         }
 
         # Make the request to Firebase Auth API
-        response = requests.post(sign_in_url, json=payload)
+        with timed('identity_toolkit'):
+            response = get_http_session().post(sign_in_url, json=payload, timeout=HTTP_TIMEOUT)
 
         # Check if request was successful
         if response.status_code == 200:
@@ -98,7 +209,7 @@ def create_user_with_email_password(email, password):
     """
     try:
         # Firebase Auth REST API endpoint for sign up
-        sign_up_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={FIREBASE_WEB_API_KEY}"
+        sign_up_url = f"{IDENTITY_TOOLKIT_URL}/accounts:signUp?key={FIREBASE_WEB_API_KEY}"
 
         # Payload for authentication
         payload = {
@@ -107,7 +218,8 @@ def create_user_with_email_password(email, password):
         }
 
         # Make the request to Firebase Auth API
-        response = requests.post(sign_up_url, json=payload)
+        with timed('identity_toolkit'):
+            response = get_http_session().post(sign_up_url, json=payload, timeout=HTTP_TIMEOUT)
 
         # Check if request was successful
         if response.status_code == 200:
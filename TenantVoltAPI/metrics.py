@@ -0,0 +1,487 @@
+"""
+Per-request latency metrics: Server-Timing headers and a Prometheus /metrics endpoint.
+
+Calls to Firestore, the Identity Toolkit REST API and SMTP are timed where
+they are made. initialize_firebase() and get_async_firestore() hand out
+clients wrapped by instrument_firestore(), the auth REST helpers use
+timed('identity_toolkit') and the pooled email backend uses timed('smtp').
+Each timing is added to the current request's phases and to this process's
+dependency counters. MetricsMiddleware reports the phases of a request in
+its Server-Timing header and records its latency in a per-endpoint
+histogram. metrics_view serves all of it in the Prometheus text format.
+
+Each worker process counts in memory. With settings.METRICS_DIR set, which
+gunicorn.conf.py does for every dyno, a worker also writes its counts to a
+file of its own there every METRICS_FLUSH_INTERVAL seconds, and a scrape
+adds up the files of all the workers, so it reports the whole dyno whichever
+worker answers it. The files of workers that exited stay, so the counters
+never go back; only their warm-up timings are dropped. Without METRICS_DIR
+a scrape sees the worker that answered it.
+"""
+import functools
+import glob
+import hmac
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from google.cloud.firestore_v1.base_aggregation import BaseAggregationQuery
+from google.cloud.firestore_v1.base_batch import BaseBatch
+from google.cloud.firestore_v1.base_client import BaseClient
+from google.cloud.firestore_v1.base_collection import BaseCollectionReference
+from google.cloud.firestore_v1.base_document import BaseDocumentReference
+from google.cloud.firestore_v1.base_query import BaseQuery
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Phase name -> [seconds, calls] for the request being served; None outside a request
+_request_phases = ContextVar('request_phases', default=None)
+
+_lock = threading.Lock()
+_dependency_calls = {}  # (dependency, outcome) -> calls
+_dependency_seconds = {}  # dependency -> seconds
+_request_latency = {}  # (endpoint, method, status) -> [bucket counts..., sum, count]
+
+# Seconds between writes of this worker's metrics to settings.METRICS_DIR
+METRICS_FLUSH_INTERVAL = 5
+
+_shared_file = None  # (pid, name) of this worker's file in METRICS_DIR
+_sharing_pid = None  # the process whose flush thread is running
+_shared_lock = threading.Lock()
+
+
+def record(dependency, seconds, error=False):
+    """Add one call to dependency that took seconds to the current request and the counters"""
+    phases = _request_phases.get()
+    if phases is not None:
+        phase = phases.setdefault(dependency, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+    with _lock:
+        key = (dependency, 'error' if error else 'ok')
+        _dependency_calls[key] = _dependency_calls.get(key, 0) + 1
+        _dependency_seconds[dependency] = _dependency_seconds.get(dependency, 0.0) + seconds
+
+
+@contextmanager
+def timed(dependency):
+    """Time the enclosed call to dependency; also works around an await"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record(dependency, time.perf_counter() - started, error=True)
+        raise
+    record(dependency, time.perf_counter() - started)
+
+
+def observe_request(endpoint, method, status, seconds):
+    """Add one request to the latency histogram"""
+    with _lock:
+        series = _request_latency.get((endpoint, method, status))
+        if series is None:
+            series = _request_latency[(endpoint, method, status)] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+
+# Firestore object types -> the methods on them that make a round trip; other
+# methods only build queries, references or batches, which get wrapped in turn
+_FIRESTORE_RPCS = [
+    ((BaseClient,), frozenset({'get_all', 'collections'})),
+    ((BaseDocumentReference,), frozenset({'get', 'create', 'set', 'update', 'delete'})),
+    ((BaseQuery, BaseCollectionReference), frozenset({'get', 'stream', 'add'})),
+    ((BaseAggregationQuery,), frozenset({'get', 'stream'})),
+    ((BaseBatch,), frozenset({'commit'})),
+]
+
+
+def register_firestore_types(types, rpcs):
+    """Have instrument_firestore wrap objects of types as well, timing their rpcs methods; for stand-in clients"""
+    _FIRESTORE_RPCS.append((tuple(types), frozenset(rpcs)))
+
+
+class InstrumentedFirestore:
+    """
+    Wraps a Firestore client, query, reference or batch so that its round trips are timed as 'firestore'
+
+    Everything else is passed through. Objects it returns are wrapped too, so
+    firestore_db.collection(...).where(...).stream() is timed. Snapshots and
+    write results are returned as they are.
+    """
+
+    __slots__ = ('_target', '_rpcs')
+
+    def __init__(self, target, rpcs):
+        self._target = target
+        self._rpcs = rpcs
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        if name in self._rpcs:
+            return _timed_rpc(attribute)
+        return _wrapping_call(attribute)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f'InstrumentedFirestore({self._target!r})'
+
+
+def instrument_firestore(target):
+    """Wrap a Firestore client (or query, reference, batch) for timing; other values are returned as they are"""
+    if isinstance(target, InstrumentedFirestore):
+        return target
+    for types, rpcs in _FIRESTORE_RPCS:
+        if isinstance(target, types):
+            return InstrumentedFirestore(target, rpcs)
+    return target
+
+
+def unwrap_firestore(value):
+    """The client, query, reference or batch an InstrumentedFirestore wraps; other values as they are"""
+    return value._target if isinstance(value, InstrumentedFirestore) else value
+
+
+def _unwrap(value):
+    if isinstance(value, InstrumentedFirestore):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    if type(value) is tuple:
+        return tuple(_unwrap(item) for item in value)
+    return value
+
+
+def _unwrap_arguments(args, kwargs):
+    return [_unwrap(arg) for arg in args], {key: _unwrap(value) for key, value in kwargs.items()}
+
+
+def _wrapping_call(method):
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        args, kwargs = _unwrap_arguments(args, kwargs)
+        return instrument_firestore(method(*args, **kwargs))
+    return call
+
+
+def _timed_rpc(method):
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        args, kwargs = _unwrap_arguments(args, kwargs)
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            record('firestore', time.perf_counter() - started, error=True)
+            raise
+        # Async methods and streams do their work once awaited or iterated
+        if inspect.isawaitable(result):
+            return _timed_awaitable(result, started)
+        if hasattr(result, '__anext__'):
+            return _timed_async_iterator(result, started)
+        if hasattr(result, '__next__'):
+            return _timed_iterator(result, started)
+        record('firestore', time.perf_counter() - started)
+        return result
+    return call
+
+
+async def _timed_awaitable(awaitable, started):
+    try:
+        result = await awaitable
+    except Exception:
+        record('firestore', time.perf_counter() - started, error=True)
+        raise
+    record('firestore', time.perf_counter() - started)
+    return result
+
+
+def _timed_iterator(iterator, started):
+    error = False
+    try:
+        yield from iterator
+    except Exception:
+        error = True
+        raise
+    finally:
+        record('firestore', time.perf_counter() - started, error=error)
+
+
+async def _timed_async_iterator(iterator, started):
+    error = False
+    try:
+        async for item in iterator:
+            yield item
+    except Exception:
+        error = True
+        raise
+    finally:
+        record('firestore', time.perf_counter() - started, error=error)
+
+
+def _snapshot():
+    """This process's metrics as JSON-serializable lists"""
+    # warmup imports firebase_config, which imports this module
+    from TenantVoltAPI.warmup import startup_timings
+
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'request_latency': [[*key, list(series)] for key, series in _request_latency.items()],
+            'dependency_calls': [[*key, calls] for key, calls in _dependency_calls.items()],
+            'dependency_seconds': [[dependency, seconds] for dependency, seconds in _dependency_seconds.items()],
+            'startup': dict(startup_timings),
+        }
+
+
+def _write_json(path, data):
+    # Written aside and renamed, so a scrape never reads half a file
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _flush_loop(directory):
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush_metrics(directory)
+        except Exception as e:
+            logger.error(f"Writing metrics to {directory} failed: {str(e)}")
+
+
+def flush_metrics(directory):
+    """Write this process's metrics to its file in directory"""
+    global _shared_file
+
+    pid = os.getpid()
+    with _shared_lock:
+        if _shared_file is None or _shared_file[0] != pid:
+            # The token keeps a reused pid from overwriting an exited worker's counts
+            _shared_file = (pid, f'worker-{pid}-{secrets.token_hex(4)}.json')
+        name = _shared_file[1]
+    _write_json(os.path.join(directory, name), _snapshot())
+
+
+def start_sharing():
+    """Write this process's metrics to settings.METRICS_DIR from now on, if it is set; once per process"""
+    global _sharing_pid
+
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if not directory:
+        return
+
+    with _shared_lock:
+        if _sharing_pid == os.getpid():
+            return
+        _sharing_pid = os.getpid()
+    os.makedirs(directory, exist_ok=True)
+    flush_metrics(directory)
+    threading.Thread(target=_flush_loop, args=(directory,), name='metrics-flush', daemon=True).start()
+
+
+def reset_shared_metrics(directory):
+    """Start directory empty; called by the gunicorn master before it forks the workers"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+        os.remove(path)
+
+
+def mark_process_dead(pid, directory):
+    """Keep an exited worker's counts in directory but drop its warm-up timings"""
+    for path in glob.glob(os.path.join(directory, f'worker-{pid}-*.json')):
+        with open(path) as f:
+            data = json.load(f)
+        data['startup'] = {}
+        _write_json(path, data)
+
+
+def _shared_snapshots(directory):
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Reading metrics from {path} failed: {str(e)}")
+    return snapshots
+
+
+def server_timing(phases, total):
+    """
+    The Server-Timing header value for a request's phases
+
+    app is the time spent outside the timed calls: the view's own work,
+    including JSON serialization, and the middleware.
+    """
+    entries = [f'{name};dur={seconds * 1000:.1f};desc="{calls} call{"" if calls == 1 else "s"}"'
+               for name, (seconds, calls) in phases.items()]
+    app = max(total - sum(seconds for seconds, _ in phases.values()), 0.0)
+    entries.append(f'app;dur={app * 1000:.1f}')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """
+    Times each request, adds its Server-Timing header and records it in the latency histogram.
+
+    Goes first in MIDDLEWARE, so the time spent in the other middleware is
+    included. Endpoints are labelled with their URL route. A streaming
+    response is timed until the view returns it, not until its body is sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        start_sharing()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = _request_phases.set({})
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            _request_phases.reset(token)
+
+    async def __acall__(self, request):
+        token = _request_phases.set({})
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            _request_phases.reset(token)
+
+    @staticmethod
+    def _finish(request, response, started):
+        total = time.perf_counter() - started
+        response['Server-Timing'] = server_timing(_request_phases.get(), total)
+        endpoint = request.resolver_match.route if request.resolver_match else 'unmatched'
+        observe_request(endpoint, request.method, response.status_code, total)
+        return response
+
+
+def _labels(**labels):
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for name, value in labels.items()}
+    return ','.join(f'{name}="{value}"' for name, value in escaped.items())
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """The metrics of this dyno's workers, or of this process without METRICS_DIR, in the Prometheus text format"""
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if directory:
+        start_sharing()
+        flush_metrics(directory)
+        snapshots = _shared_snapshots(directory)
+    else:
+        snapshots = [_snapshot()]
+
+    request_latency, dependency_calls, dependency_seconds = {}, {}, {}
+    for snapshot in snapshots:
+        for endpoint, method, status, series in snapshot['request_latency']:
+            total = request_latency.setdefault((endpoint, method, status), [0] * len(series))
+            for i, value in enumerate(series):
+                total[i] += value
+        for dependency, outcome, calls in snapshot['dependency_calls']:
+            dependency_calls[(dependency, outcome)] = dependency_calls.get((dependency, outcome), 0) + calls
+        for dependency, seconds in snapshot['dependency_seconds']:
+            dependency_seconds[dependency] = dependency_seconds.get(dependency, 0.0) + seconds
+
+    lines = [
+        '# HELP tenantvolt_request_duration_seconds Time to answer a request, by endpoint.',
+        '# TYPE tenantvolt_request_duration_seconds histogram',
+    ]
+    for (endpoint, method, status), series in sorted(request_latency.items()):
+        labels = _labels(endpoint=endpoint, method=method, status=status)
+        for bound, count in zip(LATENCY_BUCKETS, series):
+            lines.append(f'tenantvolt_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'tenantvolt_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series[-1]}')
+        lines.append(f'tenantvolt_request_duration_seconds_sum{{{labels}}} {_number(series[-2])}')
+        lines.append(f'tenantvolt_request_duration_seconds_count{{{labels}}} {series[-1]}')
+
+    lines += [
+        '# HELP tenantvolt_dependency_calls_total Calls to Firestore, Identity Toolkit and SMTP, by outcome.',
+        '# TYPE tenantvolt_dependency_calls_total counter',
+    ]
+    for (dependency, outcome), calls in sorted(dependency_calls.items()):
+        lines.append(f'tenantvolt_dependency_calls_total{{{_labels(dependency=dependency, outcome=outcome)}}} {calls}')
+
+    lines += [
+        '# HELP tenantvolt_dependency_seconds_total Time spent in calls to Firestore, Identity Toolkit and SMTP.',
+        '# TYPE tenantvolt_dependency_seconds_total counter',
+    ]
+    for dependency, seconds in sorted(dependency_seconds.items()):
+        lines.append(f'tenantvolt_dependency_seconds_total{{{_labels(dependency=dependency)}}} {_number(seconds)}')
+
+    lines += [
+        '# HELP tenantvolt_worker_startup_seconds Time each warm-up phase of a running worker took.',
+        '# TYPE tenantvolt_worker_startup_seconds gauge',
+    ]
+    for snapshot in sorted(snapshots, key=lambda snapshot: snapshot['pid']):
+        for phase, seconds in snapshot['startup'].items():
+            labels = _labels(pid=snapshot['pid'], phase=phase)
+            lines.append(f'tenantvolt_worker_startup_seconds{{{labels}}} {_number(seconds)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Serve render_metrics() to a scraper that sends settings.METRICS_TOKEN as a bearer token
+
+    The series name routes, pids and dependency errors, so without a token
+    configured the endpoint answers 404 as if it did not exist.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return HttpResponse(status=404)
+
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(auth_header.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class ProfileCache:
+    """
+    Per-worker LRU cache of house owner profiles as login returns them, bounded by memory.
+
+    An entry's size is the length of its JSON encoding, which is close to what
+    it costs to hold and exactly what login sends. Least recently used
+    profiles are evicted once the total passes max_bytes.
+
+    This worker drops a profile as soon as it writes the owner. Writes made by
+    other workers or processes are picked up when the entry expires after ttl
+    seconds, which bounds how stale a login can be.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # uid -> (profile, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._invalidations = 0
+
+    def version(self):
+        """Take before reading a profile from Firestore and pass to put(), so a read that raced a write is not cached"""
+        return self._invalidations
+
+    def get(self, uid):
+        """Return a copy of the cached profile for uid, or None"""
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[2]:
+                self._drop(uid)
+                return None
+            self._entries.move_to_end(uid)
+            # Callers add the token to the profile, so never hand out the cached dict itself
+            return dict(entry[0])
+
+    def put(self, uid, profile, version):
+        size = len(json.dumps(profile, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if version != self._invalidations:
+                return
+            self._drop(uid)
+            self._entries[uid] = (dict(profile), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, uid):
+        with self._lock:
+            self._invalidations += 1
+            self._drop(uid)
+
+    def _drop(self, uid):
+        entry = self._entries.pop(uid, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_profile_cache():
+    """Return this worker's ProfileCache, creating it on first use"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ProfileCache(
+                    max_bytes=getattr(settings, 'PROFILE_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+                    ttl=getattr(settings, 'PROFILE_CACHE_TTL', 300),
+                )
+
+    return _cache
+
+
+def invalidate_profile(uid):
+    """Drop a house owner's cached profile after this worker writes the owner or its tenants"""
+    if _cache is not None:
+        _cache.invalidate(uid)
@@ -1,5 +1,7 @@
 import os
 from pathlib import Path
+
+import dj_database_url
 from django.contrib import staticfiles
 from TenantVoltAPI import cors_middleware
 from dotenv import load_dotenv
@@ -18,14 +20,82 @@ DEBUG = True
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'tenantvolt-5cd875450cc3.herokuapp.com']
 
 # Email configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 465
-EMAIL_USE_SSL = True
+EMAIL_BACKEND = 'TenantVoltAPI.email_backend.PooledEmailBackend'
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 465))
+EMAIL_USE_SSL = os.environ.get('EMAIL_USE_SSL', 'true').lower() == 'true'
+EMAIL_TIMEOUT = 30
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL')
 
+# Authenticated SMTP connections kept open per worker (see TenantVoltAPI.email_backend)
+EMAIL_POOL_SIZE = int(os.environ.get('EMAIL_POOL_SIZE', 4))
+EMAIL_POOL_HEALTH_CHECK_INTERVAL = 30  # seconds idle before a NOOP check on reuse
+EMAIL_POOL_MAX_MESSAGES = 100  # messages per connection before it is recycled
+EMAIL_POOL_ACQUIRE_TIMEOUT = 30
+
+# Verified Firebase ID tokens kept per worker by login_required (see TenantVoltAPI.token_cache)
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_CERT_REFRESH_MARGIN = 300  # seconds before Google's signing certs expire that they are refetched
+
+# House owner profiles kept per worker by the login endpoint (see TenantVoltAPI.profile_cache)
+PROFILE_CACHE_MAX_BYTES = int(os.environ.get('PROFILE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+PROFILE_CACHE_TTL = 300  # seconds; bounds staleness after another worker updates an owner
+
+# Bulk owner import (see authentication.owner_import): PBKDF2-SHA256 rounds for the
+# password hashes handed to auth.import_users (Firebase accepts up to 120000), and hashing threads
+OWNER_IMPORT_HASH_ROUNDS = int(os.environ.get('OWNER_IMPORT_HASH_ROUNDS', 10000))
+OWNER_IMPORT_HASH_WORKERS = 4
+
+# Bearer token a scraper sends to read GET /metrics/ (see TenantVoltAPI.metrics); unset, the endpoint answers 404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Directory the workers of a dyno share their metrics through; gunicorn.conf.py sets and empties it on start.
+# Unset, each worker reports only its own
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+
+# Load shedding (see TenantVoltAPI.admission_middleware), enforced per worker process.
+# concurrency: requests an endpoint serves at once before answering 503.
+# ip_rate/uid_rate: requests per second per client IP / Firebase uid, with bursts of ip_burst/uid_burst, before 429.
+# uid_rate verifies the request's bearer token, so only endpoints that need a login set it.
+# 'endpoints' overrides 'default' by URL name.
+ADMISSION_CONTROL = {
+    'enabled': os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true',
+    # Behind Heroku's router REMOTE_ADDR is the router; it appends the client address to X-Forwarded-For.
+    # Trusted by default on Heroku dynos (DYNO is set there), where every request comes through the router
+    'trust_forwarded_for': os.environ.get('ADMISSION_TRUST_FORWARDED_FOR',
+                                          'true' if 'DYNO' in os.environ else 'false').lower() == 'true',
+    'exempt_paths': ['/health/', '/metrics/'],
+    'default': {'concurrency': 32, 'ip_rate': 20, 'ip_burst': 40},
+    'endpoints': {
+        'login': {'concurrency': 8, 'ip_rate': 1, 'ip_burst': 10},
+        'signup': {'concurrency': 4, 'ip_rate': 0.2, 'ip_burst': 5},
+        'import_owners': {'concurrency': 1, 'uid_rate': 1, 'uid_burst': 5},
+        'export_bills': {'concurrency': 2},
+        'update_order_status_batch': {'concurrency': 2},
+        'send_bill_notifications_batch': {'concurrency': 2},
+    },
+}
+
+# Concurrent email sends used by the batch bill notification endpoint
+BILL_NOTIFICATION_WORKERS = int(os.environ.get('BILL_NOTIFICATION_WORKERS', 8))
+
+# Tiered tariff used to price bills sent without an amount (see bills.tariff.Tariff)
+BILLING_TARIFF = {
+    'blocks': [
+        {'up_to': 30, 'rate': 4.00, 'fixed_charge': 75.00},
+        {'up_to': 60, 'rate': 6.00, 'fixed_charge': 200.00},
+        {'up_to': 90, 'rate': 14.00, 'fixed_charge': 400.00},
+        {'up_to': 120, 'rate': 20.00, 'fixed_charge': 1000.00},
+        {'up_to': 180, 'rate': 33.00, 'fixed_charge': 1500.00},
+        {'up_to': None, 'rate': 52.00, 'fixed_charge': 2000.00},
+    ],
+    'fixed_charges': [],
+    'taxes': [
+        {'name': 'SSCL', 'rate': 0.025},
+    ],
+}
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.auth',
@@ -39,9 +109,12 @@ INSTALLED_APPS = [
     'authentication',
     'orders',
     'bills',
+    'electricity',
 ]
 
 MIDDLEWARE = [
+    # First, so the Server-Timing total includes the other middleware
+    'TenantVoltAPI.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +123,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'TenantVoltAPI.cors_middleware.CorsMiddleware',
+    'TenantVoltAPI.admission_middleware.AdmissionControlMiddleware',
 ]
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -61,11 +135,13 @@ ROOT_URLCONF = 'TenantVoltAPI.urls'
 
 WSGI_APPLICATION = 'TenantVoltAPI.wsgi.application'
 
+# The bill notification outbox lives here and is shared by the web and worker dynos, so production
+# needs a database they can all reach: DATABASE_URL, set by Heroku Postgres. Local runs fall back to SQLite.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        ssl_require='DYNO' in os.environ,
+    )
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -0,0 +1,308 @@
+import logging
+import threading
+import time
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_store import (
+    MIGRATIONS_COLLECTION, TENANTS_COLLECTION, TENANTS_MIGRATION, has_legacy_tenants, legacy_tenants_remaining,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds a lookup waits in all for the listeners' initial snapshots before querying Firestore directly
+INITIAL_SNAPSHOT_TIMEOUT = 1
+
+# Values Firestore accepts in one 'in' filter
+IN_QUERY_LIMIT = 30
+
+
+class TenantEntry:
+    """A tenant found in house_owners together with the owner details used in bill emails"""
+
+    __slots__ = ('product_id', 'email', 'name', 'address', 'owner_uid', 'owner_name')
+
+    def __init__(self, product_id, email, name, address, owner_uid, owner_name):
+        self.product_id = product_id
+        self.email = email
+        self.name = name
+        self.address = address
+        self.owner_uid = owner_uid
+        self.owner_name = owner_name
+
+    @classmethod
+    def from_owner(cls, owner_uid, owner_data, tenant):
+        return cls(
+            product_id=tenant.get('product_id'),
+            email=tenant.get('email'),
+            name=tenant.get('name', 'Valued Tenant'),
+            address=tenant.get('address', owner_data.get('address', 'your rental property')),
+            owner_uid=owner_uid,
+            owner_name=f"{owner_data.get('first_name', '')} {owner_data.get('last_name', '')}",
+        )
+
+    @classmethod
+    def from_record(cls, record):
+        """Build the entry from a tenants collection document and the owner details it carries"""
+        owner_data = {
+            'first_name': record.get('owner_first_name', ''),
+            'last_name': record.get('owner_last_name', ''),
+        }
+        if 'owner_address' in record:
+            owner_data['address'] = record['owner_address']
+        return cls.from_owner(record.get('owner_uid'), owner_data, record)
+
+
+def is_billable(tenant):
+    return isinstance(tenant, dict) and bool(tenant.get('product_id')) and bool(tenant.get('email'))
+
+
+def iter_owner_tenants(owner_uid, owner_data):
+    """Yield a TenantEntry for every tenant in an owner's legacy tenants array that has a product_id and an email"""
+    if not has_legacy_tenants(owner_data):
+        return
+
+    for tenant in owner_data['tenants']:
+        if is_billable(tenant):
+            yield TenantEntry.from_owner(owner_uid, owner_data, tenant)
+
+
+def iter_all_tenants(firestore_db):
+    """
+    Yield a TenantEntry for every billable tenant
+
+    Streams the tenants collection, then, until migrate_tenants has finished,
+    the house_owners documents still holding a tenants array.
+    """
+    for snapshot in firestore_db.collection(TENANTS_COLLECTION).stream():
+        record = snapshot.to_dict()
+        if is_billable(record):
+            yield TenantEntry.from_record(record)
+
+    if legacy_tenants_remaining(firestore_db):
+        for house_owner in firestore_db.collection('house_owners').stream():
+            yield from iter_owner_tenants(house_owner.id, house_owner.to_dict())
+
+
+class TenantDirectory:
+    """
+    Per-worker product_id -> TenantEntry index over the tenants collection.
+
+    The index is built from the first snapshot of an on_snapshot listener and then
+    kept current from the change events Firestore pushes, so lookups cost no reads.
+    Until migrate_tenants has finished, a second listener indexes the tenants
+    arrays that house_owners documents still embed, and a third watches the
+    migration's progress. Once it is marked complete, the next lookup stops
+    both.
+
+    Each product_id maps to every document that has it, in the order they were
+    seen, and the first one answers lookups. Removing one of them leaves the
+    product_id to the next.
+    """
+
+    def __init__(self, firestore_db):
+        self._db = firestore_db
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._legacy_ready = threading.Event()
+        self._legacy_complete = threading.Event()
+        self._watch = None
+        self._legacy_watch = None
+        self._migration_watch = None
+        self._by_product = {}  # product_id -> {tenants document ID: TenantEntry}
+        self._by_tenant = {}  # tenants document ID -> its product_id in the index
+        self._legacy_by_product = {}  # product_id -> {owner uid: TenantEntry}
+        self._by_owner = {}  # owner uid -> product_ids that owner's array contributed to the legacy index
+
+    def start(self):
+        """Start (or restart) the tenants listener, and the house_owners one while legacy arrays remain"""
+        with self._lock:
+            if not self._active(self._watch):
+                # A fresh listener replays every document as ADDED, so rebuild from scratch
+                self._ready.clear()
+                self._by_product = {}
+                self._by_tenant = {}
+                self._watch = self._db.collection(TENANTS_COLLECTION).on_snapshot(self._on_snapshot)
+                logger.info("Tenant directory listener started on tenants")
+
+            legacy_stopped = self._legacy_watch is not None and not self._legacy_watch.is_active
+            if legacy_stopped or (self._legacy_watch is None and legacy_tenants_remaining(self._db)):
+                self._legacy_ready.clear()
+                self._legacy_by_product = {}
+                self._by_owner = {}
+                self._legacy_watch = self._db.collection('house_owners').on_snapshot(self._on_legacy_snapshot)
+                if self._migration_watch is None:
+                    self._legacy_complete.clear()
+                    self._migration_watch = self._db.collection(MIGRATIONS_COLLECTION).on_snapshot(
+                        self._on_migration_snapshot)
+                logger.info("Tenant directory listener started on house_owners for legacy tenants arrays")
+            elif self._legacy_watch is None:
+                self._legacy_ready.set()
+
+    @staticmethod
+    def _active(watch):
+        return watch is not None and watch.is_active
+
+    def stop(self):
+        with self._lock:
+            for watch in (self._watch, self._legacy_watch, self._migration_watch):
+                if watch is not None:
+                    watch.unsubscribe()
+            self._watch = None
+            self._legacy_watch = None
+            self._migration_watch = None
+
+    def _stop_legacy(self):
+        """Stop the house_owners and migration listeners; no tenants arrays are left to index"""
+        with self._lock:
+            for watch in (self._legacy_watch, self._migration_watch):
+                if watch is not None:
+                    watch.unsubscribe()
+            self._legacy_watch = None
+            self._migration_watch = None
+            self._legacy_by_product = {}
+            self._by_owner = {}
+            self._legacy_ready.set()
+        logger.info("Tenants migration complete, tenant directory listener on house_owners stopped")
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                tenant_id = change.document.id
+                product_id = self._by_tenant.pop(tenant_id, None)
+                if product_id is not None:
+                    _discard(self._by_product, product_id, tenant_id)
+                if change.type.name == 'REMOVED':
+                    continue
+                record = change.document.to_dict() or {}
+                if is_billable(record):
+                    self._by_product.setdefault(record['product_id'], {})[tenant_id] = TenantEntry.from_record(record)
+                    self._by_tenant[tenant_id] = record['product_id']
+
+        if not self._ready.is_set():
+            logger.info(f"Tenant directory loaded {len(self._by_product)} tenants")
+            self._ready.set()
+
+    def _on_legacy_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                owner_uid = change.document.id
+                self._remove_owner(owner_uid)
+                if change.type.name != 'REMOVED':
+                    self._add_owner(owner_uid, change.document.to_dict() or {})
+
+        if not self._legacy_ready.is_set():
+            logger.info(f"Tenant directory loaded {len(self._legacy_by_product)} tenants from legacy arrays")
+            self._legacy_ready.set()
+
+    def _on_migration_snapshot(self, col_snapshot, changes, read_time):
+        # Only flagged here: a listener is not unsubscribed from its own callback
+        for change in changes:
+            if (change.document.id == TENANTS_MIGRATION and change.type.name != 'REMOVED'
+                    and (change.document.to_dict() or {}).get('complete')):
+                self._legacy_complete.set()
+
+    def _add_owner(self, owner_uid, owner_data):
+        product_ids = []
+        for entry in iter_owner_tenants(owner_uid, owner_data):
+            # The first tenant seen keeps a product_id, mirroring the old scan order
+            owners = self._legacy_by_product.setdefault(entry.product_id, {})
+            if owner_uid not in owners:
+                owners[owner_uid] = entry
+                product_ids.append(entry.product_id)
+        self._by_owner[owner_uid] = tuple(product_ids)
+
+    def _remove_owner(self, owner_uid):
+        for product_id in self._by_owner.pop(owner_uid, ()):
+            _discard(self._legacy_by_product, product_id, owner_uid)
+
+    def lookup(self, product_id):
+        """Return the TenantEntry for a product_id, or None if no tenant has it"""
+        return self.lookup_many([product_id]).get(product_id)
+
+    def lookup_many(self, product_ids):
+        """
+        Return {product_id: TenantEntry} for the product_ids some tenant has
+
+        Waits for the initial snapshots once for all of them. If they are not
+        loaded in time, the product_ids are looked up in Firestore together.
+        """
+        if self._legacy_complete.is_set() and self._legacy_watch is not None:
+            self._stop_legacy()
+        if not self._active(self._watch) or self._legacy_watch is not None and not self._legacy_watch.is_active:
+            self.start()
+
+        deadline = time.monotonic() + INITIAL_SNAPSHOT_TIMEOUT
+        loaded = self._ready.wait(INITIAL_SNAPSHOT_TIMEOUT)
+        legacy_loaded = self._legacy_ready.wait(max(deadline - time.monotonic(), 0))
+        if not (loaded and legacy_loaded):
+            logger.warning("Tenant directory not loaded yet, querying Firestore directly")
+            return self._find(product_ids, legacy_loaded)
+
+        found = {}
+        with self._lock:
+            for product_id in product_ids:
+                entries = self._by_product.get(product_id) or self._legacy_by_product.get(product_id)
+                if entries:
+                    found[product_id] = next(iter(entries.values()))
+        return found
+
+    def _find(self, product_ids, legacy_loaded):
+        # product_id is indexed in the tenants collection, so these are 'in' queries of up to IN_QUERY_LIMIT values
+        found = {}
+        pending = list(dict.fromkeys(product_ids))
+        for start in range(0, len(pending), IN_QUERY_LIMIT):
+            chunk = pending[start:start + IN_QUERY_LIMIT]
+            for snapshot in self._db.collection(TENANTS_COLLECTION).where('product_id', 'in', chunk).stream():
+                record = snapshot.to_dict()
+                # Document ID order, so the first document with a product_id answers, as in the index
+                if is_billable(record) and record['product_id'] not in found:
+                    found[record['product_id']] = TenantEntry.from_record(record)
+
+        missing = {product_id for product_id in pending if product_id not in found}
+        if missing and legacy_loaded:
+            # The legacy index is in, or there are no tenants arrays left to index
+            with self._lock:
+                for product_id in missing:
+                    entries = self._legacy_by_product.get(product_id)
+                    if entries:
+                        found[product_id] = next(iter(entries.values()))
+        elif missing and legacy_tenants_remaining(self._db):
+            # One pass over house_owners for all the product_ids not in the tenants collection
+            for house_owner in self._db.collection('house_owners').stream():
+                for entry in iter_owner_tenants(house_owner.id, house_owner.to_dict()):
+                    if entry.product_id in missing:
+                        found[entry.product_id] = entry
+                        missing.discard(entry.product_id)
+                if not missing:
+                    break
+        return found
+
+
+def _discard(index, product_id, key):
+    """Drop one document's entry for a product_id, and the product_id once no document has it"""
+    entries = index.get(product_id)
+    if entries is not None:
+        entries.pop(key, None)
+        if not entries:
+            del index[product_id]
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_tenant_directory():
+    """Return this worker's TenantDirectory, creating and starting it on first use"""
+    global _directory
+
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _, firestore_db = initialize_firebase()
+                directory = TenantDirectory(firestore_db)
+                directory.start()
+                _directory = directory
+
+    return _directory
@@ -0,0 +1,159 @@
+"""
+Tenants are stored one document per tenant in the top-level tenants collection,
+with ID {owner_uid}_{tenant_index}, so a tenant can be read, updated or found
+by product_id (Firestore indexes every field) without touching its owner.
+The owner's house_owners document keeps only a tenant_count.
+
+House owners created before this layout embed their tenants as a `tenants`
+array. Readers accept both layouts until migrate_tenants has moved every
+owner. Any write that changes an owner's tenants migrates that owner on the
+way. An order's version is the newest update_time of its owner document
+and its tenants documents, since a tenants document can change on its own.
+"""
+import logging
+
+from google.cloud.firestore_v1 import DELETE_FIELD
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TENANTS_COLLECTION = 'tenants'
+
+# Progress of the migrate_tenants command: migrations/tenants
+MIGRATIONS_COLLECTION = 'migrations'
+TENANTS_MIGRATION = 'tenants'
+
+# Fields a tenants document adds to the tenant as signup received it
+TENANT_LINK_FIELDS = ('owner_uid', 'tenant_index', 'owner_first_name', 'owner_last_name', 'owner_address')
+
+
+def tenant_doc_id(owner_uid, tenant_index):
+    return f"{owner_uid}_{tenant_index}"
+
+
+def tenant_ref(firestore_db, owner_uid, tenant_index):
+    return firestore_db.collection(TENANTS_COLLECTION).document(tenant_doc_id(owner_uid, tenant_index))
+
+
+def tenant_record(owner_uid, owner_data, tenant_index, tenant):
+    """
+    The tenants/{owner_uid}_{tenant_index} document for one tenant of an owner
+
+    Keeps the tenant's own fields and adds the owner details bill emails
+    need, so a tenant can be billed from its document alone.
+    """
+    record = dict(tenant)
+    record.update({
+        'owner_uid': owner_uid,
+        'tenant_index': tenant_index,
+        'owner_first_name': owner_data.get('first_name', ''),
+        'owner_last_name': owner_data.get('last_name', ''),
+    })
+    if 'address' in owner_data:
+        record['owner_address'] = owner_data['address']
+    return record
+
+
+def public_tenant(record):
+    """A tenants document as clients see a tenant, without the fields the collection adds"""
+    return {field: value for field, value in record.items() if field not in TENANT_LINK_FIELDS}
+
+
+def has_legacy_tenants(owner_data):
+    """True for house_owners documents that still embed their tenants as an array"""
+    return isinstance(owner_data.get('tenants'), list)
+
+
+def tenant_writes(firestore_db, owner_uid, owner_data, tenants):
+    """Return (reference, record) for every tenant of an owner, in tenant_index order"""
+    return [
+        (tenant_ref(firestore_db, owner_uid, tenant_index), tenant_record(owner_uid, owner_data, tenant_index, tenant))
+        for tenant_index, tenant in enumerate(tenants)
+    ]
+
+
+def legacy_migration(firestore_db, owner_uid, owner_data):
+    """
+    Return (tenant_writes, owner_fields) that move an owner's tenants array into the tenants collection
+
+    Commit the tenant writes (set) and the owner update in one batch, with a
+    precondition on the owner's update_time so a concurrent edit of the array
+    is not lost.
+    """
+    tenants = [tenant if isinstance(tenant, dict) else {} for tenant in owner_data['tenants']]
+    writes = tenant_writes(firestore_db, owner_uid, owner_data, tenants)
+    return writes, {'tenants': DELETE_FIELD, 'tenant_count': len(tenants)}
+
+
+def _tenant_slots(firestore_db, owners):
+    """Return ({owner_uid: tenants list to fill}, tenants document references to fetch)"""
+    tenants_by_owner = {}
+    references = []
+    for owner_uid, owner_data in owners.items():
+        if has_legacy_tenants(owner_data):
+            tenants_by_owner[owner_uid] = list(owner_data['tenants'])
+            continue
+        tenant_count = int(owner_data.get('tenant_count') or 0)
+        tenants_by_owner[owner_uid] = [None] * tenant_count
+        references.extend(tenant_ref(firestore_db, owner_uid, index) for index in range(tenant_count))
+    return tenants_by_owner, references
+
+
+def _fill_slot(tenants_by_owner, snapshot, versions):
+    if not snapshot.exists:
+        return
+    record = snapshot.to_dict()
+    owner_uid = record.get('owner_uid')
+    tenants = tenants_by_owner.get(owner_uid)
+    tenant_index = record.get('tenant_index')
+    if tenants is not None and isinstance(tenant_index, int) and 0 <= tenant_index < len(tenants):
+        tenants[tenant_index] = public_tenant(record)
+        if versions is not None and (owner_uid not in versions or snapshot.update_time > versions[owner_uid]):
+            versions[owner_uid] = snapshot.update_time
+
+
+def get_many_owner_tenants(firestore_db, owners, versions=None):
+    """
+    Return {owner_uid: [tenant, ...]} for {owner_uid: owner_data}
+
+    Lists are in tenant_index order, with None for a tenant document that is
+    missing, so list positions stay tenant indexes. Owners still on the
+    legacy layout are answered from their array. All other tenants are
+    fetched together in one get_all. If versions is given, it is filled with
+    {owner_uid: newest update_time of that owner's tenants documents}.
+    """
+    tenants_by_owner, references = _tenant_slots(firestore_db, owners)
+    if references:
+        for snapshot in firestore_db.get_all(references):
+            _fill_slot(tenants_by_owner, snapshot, versions)
+    return tenants_by_owner
+
+
+async def aget_many_owner_tenants(async_db, owners, versions=None):
+    """get_many_owner_tenants for a Firestore AsyncClient"""
+    tenants_by_owner, references = _tenant_slots(async_db, owners)
+    if references:
+        async for snapshot in async_db.get_all(references):
+            _fill_slot(tenants_by_owner, snapshot, versions)
+    return tenants_by_owner
+
+
+def get_owner_tenants(firestore_db, owner_uid, owner_data):
+    """Return one owner's tenants; see get_many_owner_tenants"""
+    return get_many_owner_tenants(firestore_db, {owner_uid: owner_data})[owner_uid]
+
+
+async def aget_owner_tenants(async_db, owner_uid, owner_data):
+    """get_owner_tenants for a Firestore AsyncClient"""
+    return (await aget_many_owner_tenants(async_db, {owner_uid: owner_data}))[owner_uid]
+
+
+def legacy_tenants_remaining(firestore_db):
+    """False once migrate_tenants has moved every owner, so readers can stop looking for tenants arrays"""
+    try:
+        snapshot = firestore_db.collection(MIGRATIONS_COLLECTION).document(TENANTS_MIGRATION).get()
+    except Exception as e:
+        logger.error(f"Error reading tenants migration state: {str(e)}")
+        return True
+    return not (snapshot.exists and (snapshot.to_dict() or {}).get('complete'))
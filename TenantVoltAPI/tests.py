@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+from google.auth import crypt, jwt
+
+from TenantVoltAPI import admission_middleware, firebase_async, firebase_config, metrics, token_cache
+from TenantVoltAPI.admission_middleware import RateLimiter
+from TenantVoltAPI.tenant_directory import TenantDirectory
+from TenantVoltAPI.token_cache import CertificateRefresher, SigningCertificates, VerifiedTokenCache
+from benchmarks.bench_auth import KEY_ID, PROJECT_ID, make_key_and_cert, mint_tokens
+from benchmarks.memory_firestore import AsyncMemoryClient, MemoryApp, MemoryClient, MemoryStore
+
+urlpatterns = [
+    path('stream/', lambda request: StreamingHttpResponse(iter([b'a', b'b'])), name='stream'),
+    path('limited/', lambda request: JsonResponse({'success': True}), name='limited'),
+    path('per-user/', lambda request: JsonResponse({'success': True}), name='per_user'),
+]
+
+
+class FirestoreBackendTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(firebase_config, firebase_app=None, firestore_db=None, _firestore_backend=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_initialize_firebase_uses_the_installed_backend(self):
+        store = MemoryStore()
+        app = MemoryApp()
+        firebase_config.use_firestore_backend(app, MemoryClient(store), lambda: AsyncMemoryClient(store))
+
+        self.assertIs(firebase_config.initialize_firebase()[0], app)
+        _, firestore_db = firebase_config.initialize_firebase()
+        firestore_db.collection('house_owners').document('a').set({'n': 1})
+
+        async def read():
+            snapshot = await firebase_async.get_async_firestore().collection('house_owners').document('a').get()
+            return snapshot.to_dict()
+
+        with mock.patch.object(firebase_async, '_firestore_clients', {}):
+            self.assertEqual(asyncio.run(read()), {'n': 1})
+
+    def test_backend_cannot_be_installed_after_initialization(self):
+        firebase_config.firebase_app = MemoryApp()
+        with self.assertRaises(RuntimeError):
+            firebase_config.use_firestore_backend(MemoryApp(), MemoryClient(MemoryStore()), None)
+
+
+class SharedMetricsTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # No background writer; render_metrics writes this process's file itself
+        patcher = mock.patch.object(metrics, 'start_sharing')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def other_worker(self, pid=1, calls=2):
+        metrics._write_json(os.path.join(self.directory, f'worker-{pid}-0.json'), {
+            'pid': pid,
+            'request_latency': [['health/', 'GET', 200, [1] * len(metrics.LATENCY_BUCKETS) + [0.004, calls]]],
+            'dependency_calls': [['shared_test', 'ok', calls]],
+            'dependency_seconds': [['shared_test', 0.5]],
+            'startup': {'warm_up_total': 1.5},
+        })
+
+    def render(self):
+        with override_settings(METRICS_DIR=self.directory):
+            return metrics.render_metrics()
+
+    def test_scrape_adds_up_the_workers_of_the_dyno(self):
+        self.other_worker(calls=2)
+        metrics.record('shared_test', 0.25)
+        text = self.render()
+        calls = [line for line in text.splitlines() if 'dependency="shared_test"' in line]
+        self.assertIn('tenantvolt_dependency_calls_total{dependency="shared_test",outcome="ok"} 3', calls)
+        self.assertIn('tenantvolt_dependency_seconds_total{dependency="shared_test"} 0.75', calls)
+        self.assertIn('tenantvolt_worker_startup_seconds{pid="1",phase="warm_up_total"} 1.5', text)
+
+    def test_exited_worker_keeps_its_counts_but_not_its_startup(self):
+        self.other_worker(calls=2)
+        metrics.mark_process_dead(1, self.directory)
+        text = self.render()
+        self.assertNotIn('pid="1"', text)
+        self.assertRegex(text, r'tenantvolt_dependency_calls_total\{dependency="shared_test",outcome="ok"\} [2-9]')
+
+    def test_reset_empties_the_directory(self):
+        self.other_worker()
+        metrics.reset_shared_metrics(self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class VerifiedTokenCacheTests(SimpleTestCase):
+    def test_entry_expires_at_the_token_exp(self):
+        cache = VerifiedTokenCache(10)
+        with mock.patch.object(token_cache.time, 'time', return_value=999.5):
+            cache.put('token', {'uid': 'u1', 'exp': 1000})
+            self.assertEqual(cache.get('token'), {'uid': 'u1', 'exp': 1000})
+        with mock.patch.object(token_cache.time, 'time', return_value=1000):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = VerifiedTokenCache(2)
+        exp = time.time() + 60
+        cache.put('a', {'uid': 'a', 'exp': exp})
+        cache.put('b', {'uid': 'b', 'exp': exp})
+        cache.get('a')
+        cache.put('c', {'uid': 'c', 'exp': exp})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(token)['uid'] for token in ('a', 'c')], ['a', 'c'])
+
+    def test_entries_are_keyed_by_the_token_hash(self):
+        cache = VerifiedTokenCache(2)
+        cache.put('raw-token', {'uid': 'u1', 'exp': time.time() + 60})
+        self.assertEqual(list(cache._entries), [hashlib.sha256(b'raw-token').hexdigest()])
+
+
+class SigningCertificateTests(SimpleTestCase):
+    def setUp(self):
+        key_pem, cert_pem = make_key_and_cert()
+        self.signer = crypt.RSASigner.from_string(key_pem, KEY_ID)
+        self.tokens = mint_tokens(key_pem, 1)
+        self.certificates = SigningCertificates('https://certs.example.com/')
+        response = mock.Mock(status=200, headers={'Cache-Control': 'public, max-age=3600'},
+                             data=json.dumps({KEY_ID: cert_pem}).encode())
+        self.certificates._request = mock.Mock(return_value=response)
+        app = mock.Mock(project_id=PROJECT_ID)
+        for patcher in (mock.patch.object(token_cache, 'get_signing_certificates', return_value=self.certificates),
+                        mock.patch.object(token_cache, 'initialize_firebase', return_value=(app, None))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_token_is_verified_against_the_fetched_certificates(self):
+        claims = token_cache.verify_id_token(self.tokens[0])
+        self.assertEqual(claims['uid'], 'user0')
+        token_cache.verify_id_token(self.tokens[0])
+        self.certificates._request.assert_called_once()
+
+    def test_token_from_another_issuer_is_rejected(self):
+        now = int(time.time())
+        token = jwt.encode(self.signer, {'iss': 'https://securetoken.google.com/other', 'aud': PROJECT_ID,
+                                         'sub': 'user0', 'iat': now, 'exp': now + 3600}).decode()
+        with self.assertRaises(ValueError):
+            token_cache.verify_id_token(token)
+
+    def test_refresher_leaves_fresh_certificates_alone(self):
+        self.certificates.refresh()
+        refresher = CertificateRefresher(self.certificates, 300)
+        refresher.start()
+        self.addCleanup(refresher.stop)
+        time.sleep(0.05)
+        self.certificates._request.assert_called_once()
+
+    def test_refresher_fetches_certificates_it_does_not_have(self):
+        refresher = CertificateRefresher(self.certificates, 300)
+        refresher.start()
+        self.addCleanup(refresher.stop)
+        for _ in range(100):
+            if self.certificates.expires_in() > 0:
+                break
+            time.sleep(0.01)
+        self.certificates._request.assert_called_once()
+
+
+class TenantDirectoryMigrationTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.db.collection('tenants').document('new_0').set({'product_id': 'N1', 'email': 'n1@example.com'})
+        self.db.collection('house_owners').document('old').set({'tenants': [
+            {'product_id': 'L1', 'email': 'l1@example.com'},
+        ]})
+        self.directory = TenantDirectory(self.db)
+        self.directory.start()
+        self.addCleanup(self.directory.stop)
+
+    def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('condition not reached')
+
+    def test_legacy_listener_stops_once_the_migration_is_complete(self):
+        self.assertEqual(self.directory.lookup('L1').email, 'l1@example.com')
+        legacy_watch = self.directory._legacy_watch
+
+        self.db.collection('migrations').document('tenants').set({'complete': True})
+        self.wait_for(self.directory._legacy_complete.is_set)
+        self.assertEqual(self.directory.lookup('N1').email, 'n1@example.com')
+        self.assertIsNone(self.directory._legacy_watch)
+        self.assertIsNone(self.directory._migration_watch)
+        self.assertFalse(legacy_watch.is_active)
+        self.assertIsNone(self.directory.lookup('L1'))
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_bucket_allows_a_burst_then_refills_at_the_rate(self):
+        limiter = RateLimiter(10)
+        with mock.patch.object(admission_middleware.time, 'monotonic', return_value=100.0):
+            self.assertEqual([limiter.acquire('k', 2, 2) for _ in range(3)], [0, 0, 0.5])
+        with mock.patch.object(admission_middleware.time, 'monotonic', return_value=100.5):
+            self.assertEqual(limiter.acquire('k', 2, 2), 0)
+            self.assertEqual(limiter.acquire('other', 2, 2), 0)
+
+    def test_least_recently_used_bucket_is_dropped(self):
+        limiter = RateLimiter(2)
+        for key in ('a', 'b', 'a', 'c'):
+            limiter.acquire(key, 1, 5)
+        self.assertEqual(list(limiter._buckets), ['a', 'c'])
+
+
+@override_settings(ROOT_URLCONF='TenantVoltAPI.tests', ADMISSION_CONTROL={
+    'enabled': True,
+    'trust_forwarded_for': True,
+    'exempt_paths': [],
+    'default': {},
+    'endpoints': {
+        'stream': {'concurrency': 1},
+        'limited': {'ip_rate': 0.5, 'ip_burst': 2},
+        'per_user': {'uid_rate': 0.5, 'uid_burst': 1},
+    },
+})
+class AdmissionControlTests(SimpleTestCase):
+    def test_over_the_ip_rate_is_answered_429(self):
+        for status in (200, 200, 429):
+            response = self.client.get('/limited/', REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, status)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(self.client.get('/limited/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_the_last_forwarded_for_entry_is_the_client(self):
+        # Clients can put anything in front; the router appends the address it saw
+        for spoofed in ('1.1.1.1', '2.2.2.2'):
+            self.assertEqual(self.client.get('/limited/', HTTP_X_FORWARDED_FOR=f'{spoofed}, 9.9.9.9').status_code, 200)
+        self.assertEqual(self.client.get('/limited/', HTTP_X_FORWARDED_FOR='3.3.3.3, 9.9.9.9').status_code, 429)
+        self.assertEqual(self.client.get('/limited/', HTTP_X_FORWARDED_FOR='9.9.9.9, 8.8.8.8').status_code, 200)
+
+    def test_slot_is_held_until_the_streamed_body_is_sent(self):
+        streaming = self.client.get('/stream/')
+        self.assertEqual(streaming.status_code, 200)
+
+        busy = self.client.get('/stream/')
+        self.assertEqual((busy.status_code, busy['Retry-After']), (503, '1'))
+
+        self.assertEqual(b''.join(streaming.streaming_content), b'ab')
+        self.assertEqual(self.client.get('/stream/').status_code, 200)
+
+    def test_uid_rate_applies_across_client_ips(self):
+        with mock.patch.object(admission_middleware, 'verify_firebase_token', return_value={'uid': 'u1'}):
+            statuses = [
+                self.client.get('/per-user/', REMOTE_ADDR=f'10.0.0.{i}', HTTP_AUTHORIZATION='Bearer t').status_code
+                for i in range(2)
+            ]
+        self.assertEqual(statuses, [200, 429])
+
+    async def test_uid_rate_on_the_async_path(self):
+        with mock.patch.object(admission_middleware, 'verify_firebase_token', return_value={'uid': 'u1'}) as verify:
+            first = await self.async_client.get('/per-user/', headers={'Authorization': 'Bearer t'})
+            second = await self.async_client.get('/per-user/', headers={'Authorization': 'Bearer t'})
+        self.assertEqual((first.status_code, second.status_code), (200, 429))
+        verify.assert_called_with('t')
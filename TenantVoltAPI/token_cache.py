@@ -0,0 +1,218 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from google.auth import jwt
+from google.auth.transport import requests as google_requests
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts while Google's certificate endpoint is failing
+CERT_RETRY_INTERVAL = 60
+
+# Where Google publishes the X.509 certificates that sign Firebase ID tokens, by key ID
+ID_TOKEN_CERT_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+# A project's ID tokens are issued by this prefix followed by its project ID
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+# Seconds one certificate fetch may take
+CERT_FETCH_TIMEOUT = 10
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified Firebase ID token claims, shared by a worker's threads.
+
+    Entries are keyed by the SHA-256 of the token, so raw bearer tokens are
+    never held in memory, and each entry expires at the token's own exp claim.
+    Only successful verifications are cached; a rejected token is verified
+    again on every request.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token hash -> (claims, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def get(self, id_token):
+        """Return a copy of the cached claims for id_token, or None if it is not cached or has expired"""
+        key = self._key(id_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Views may add to request.firebase_user, so never hand out the cached dict itself
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, id_token, claims):
+        exp = claims.get('exp')
+        if not isinstance(exp, (int, float)) or exp <= time.time():
+            return
+        key = self._key(id_token)
+        with self._lock:
+            self._entries[key] = (dict(claims), exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SigningCertificates:
+    """
+    Google's ID token signing certificates, held in memory until the max-age Google sends.
+
+    Fetched with google-auth's public transport. get() refetches inline only
+    when the copy has expired; CertificateRefresher keeps it from getting there.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._request = google_requests.Request()
+        self._certs = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Refetch the certificates and return their max-age in seconds"""
+        response = self._request(self.url, method='GET', timeout=CERT_FETCH_TIMEOUT)
+        if response.status != 200:
+            raise RuntimeError(f"Certificate endpoint returned HTTP {response.status}")
+
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else 0
+        certs = json.loads(response.data.decode('utf-8'))
+        with self._lock:
+            self._certs = certs
+            self._expires_at = time.time() + max_age
+        return max_age
+
+    def expires_in(self):
+        """Seconds until the held certificates expire; 0 or less once they have, or before the first fetch"""
+        return self._expires_at - time.time()
+
+    def get(self):
+        if self._certs is None or self.expires_in() <= 0:
+            self.refresh()
+        return self._certs
+
+
+class CertificateRefresher:
+    """
+    Refetches the signing certificates `margin` seconds before they expire, on a daemon thread.
+
+    Without it, the first token verified after the certificates expire would
+    wait on the fetch, on a request thread. Certificates that are still fresh
+    when it starts, such as those the warm-up fetched, are not fetched again.
+    """
+
+    def __init__(self, certificates, margin):
+        self.certificates = certificates
+        self.margin = margin
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='firebase-cert-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            delay = self.certificates.expires_in() - self.margin
+            if delay <= 0:
+                try:
+                    delay = max(CERT_RETRY_INTERVAL, self.certificates.refresh() - self.margin)
+                except Exception as e:
+                    logger.error(f"Error refreshing Firebase signing certificates: {str(e)}")
+                    delay = CERT_RETRY_INTERVAL
+            self._stopped.wait(delay)
+
+
+def verify_id_token(id_token):
+    """
+    Verify a Firebase ID token against the held certificates and return its claims, with uid set
+
+    Makes the checks auth.verify_id_token makes: an RS256 signature by one of
+    Google's keys, exp and iat, the project as audience and issuer, and a
+    subject of at most 128 characters. Raises ValueError otherwise.
+    """
+    firebase_app, _ = initialize_firebase()
+    project_id = firebase_app.project_id
+    header = jwt.decode_header(id_token)
+    if header.get('alg') != 'RS256' or not header.get('kid'):
+        raise ValueError('ID token must be signed with RS256 and name its key ID')
+
+    claims = jwt.decode(id_token, certs=get_signing_certificates().get(), audience=project_id)
+    if claims.get('iss') != f'{ID_TOKEN_ISSUER_PREFIX}{project_id}':
+        raise ValueError(f"ID token has incorrect issuer: {claims.get('iss')}")
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError('ID token must have a subject of 1 to 128 characters')
+
+    claims['uid'] = subject
+    return claims
+
+
+_certificates = None
+_cache = None
+_refresher = None
+_cache_lock = threading.Lock()
+
+
+def get_signing_certificates():
+    """Return this worker's SigningCertificates; they are fetched on first use"""
+    global _certificates
+
+    if _certificates is None:
+        with _cache_lock:
+            if _certificates is None:
+                _certificates = SigningCertificates(ID_TOKEN_CERT_URL)
+
+    return _certificates
+
+
+def get_token_cache():
+    """Return this worker's VerifiedTokenCache, starting the certificate refresher on first use"""
+    global _cache, _refresher
+
+    if _cache is None:
+        certificates = get_signing_certificates()
+        with _cache_lock:
+            if _cache is None:
+                refresher = CertificateRefresher(certificates, getattr(settings, 'AUTH_CERT_REFRESH_MARGIN', 300))
+                refresher.start()
+                _refresher = refresher
+                _cache = VerifiedTokenCache(getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+
+    return _cache
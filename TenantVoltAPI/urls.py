@@ -1,8 +1,11 @@
 from django.http import HttpResponse, JsonResponse
 from django.urls import path, include
+from TenantVoltAPI.metrics import metrics_view
+from bills.views import get_latest_bills
 
 urlpatterns = [
     path('health/', lambda request: JsonResponse({'status': 'ok'})),
+    path('metrics/', metrics_view),
 
     # Authentication endpoints
     path('api/auth/', include('authentication.urls')),
@@ -12,4 +15,8 @@ urlpatterns = [
 
     # Bills endpoints
     path('api/bills/', include('bills.urls')),
+    path('bill/latest/', get_latest_bills, name='get_latest_bills'),
+
+    # Electricity connection endpoints
+    path('electricity/', include('electricity.urls')),
 ]
\ No newline at end of file
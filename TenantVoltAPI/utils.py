@@ -1,16 +1,24 @@
-from firebase_admin import auth
 from django.http import JsonResponse
 from functools import wraps
 import json
 
+from TenantVoltAPI.token_cache import get_token_cache, verify_id_token
+
 def verify_firebase_token(id_token):
-    """Verify the Firebase ID token"""
-    try:
-        decoded_token = auth.verify_id_token(id_token)
+    """Verify the Firebase ID token, reusing the claims of a token this worker already verified"""
+    token_cache = get_token_cache()
+    decoded_token = token_cache.get(id_token)
+    if decoded_token is not None:
         return decoded_token
+
+    try:
+        decoded_token = verify_id_token(id_token)
     except Exception as e:
         return None
 
+    token_cache.put(id_token, decoded_token)
+    return decoded_token
+
 def login_required(view_func):
     """Decorator for views that require Firebase authentication"""
     @wraps(view_func)
@@ -0,0 +1,93 @@
+"""
+Worker warm-up: do the per-process Firebase setup before the first request instead of during it.
+
+gunicorn.conf.py calls warm_up() from post_worker_init, once the worker has
+loaded the application and before it accepts connections. Each phase is
+timed, logged and kept in startup_timings, so cold starts can be compared
+across deploys. A failing phase is logged and ends the warm-up, since later
+phases build on it; whatever was left is then set up lazily by the first
+request that needs it.
+"""
+import logging
+import os
+import threading
+import time
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_directory import get_tenant_directory
+from TenantVoltAPI.token_cache import get_signing_certificates, get_token_cache
+from orders.order_index import get_order_index
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds the warm-up point read may take before the worker boots without it
+FIRESTORE_WARMUP_TIMEOUT = 10
+
+# Phase name -> seconds taken, for this process; filled in by warm_up()
+startup_timings = {}
+
+_warmed_pid = None
+_warm_up_lock = threading.Lock()
+
+
+def _open_firestore_channel():
+    _, firestore_db = initialize_firebase()
+    # Any point read connects the gRPC channel and fetches the OAuth access token,
+    # which the per-event-loop AsyncClients share through the same credentials
+    firestore_db.collection('migrations').document('tenants').get(timeout=FIRESTORE_WARMUP_TIMEOUT)
+
+
+def _fetch_token_certs():
+    # The refresher get_token_cache starts next leaves these alone until they near expiry
+    get_signing_certificates().refresh()
+
+
+def _start_listeners():
+    # Only started here; they load their initial snapshots in the background
+    get_order_index()
+    get_tenant_directory()
+
+
+# In order: each phase relies on the ones before it
+WARMUP_PHASES = (
+    ('firebase_init', initialize_firebase),
+    ('firestore_channel', _open_firestore_channel),
+    ('token_certs', _fetch_token_certs),
+    ('token_cache', get_token_cache),
+    ('listeners', _start_listeners),
+)
+
+
+def warm_up(timings=None):
+    """
+    Run the warm-up phases once per process and return startup_timings
+
+    timings holds phases measured by the caller, such as app_load, to be
+    reported along with these.
+    """
+    global _warmed_pid
+
+    with _warm_up_lock:
+        if _warmed_pid == os.getpid():
+            return startup_timings
+
+        startup_timings.clear()
+        startup_timings.update(timings or {})
+        started = time.perf_counter()
+        for phase, step in WARMUP_PHASES:
+            phase_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warm-up phase {phase} failed: {str(e)}")
+                break
+            finally:
+                startup_timings[phase] = time.perf_counter() - phase_started
+        startup_timings['warm_up_total'] = time.perf_counter() - started
+        _warmed_pid = os.getpid()
+
+    logger.info(f"Worker {os.getpid()} warm-up: "
+                + ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in startup_timings.items()))
+    return startup_timings
@@ -0,0 +1,69 @@
+import itertools
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from authentication.owner_import import import_owners
+
+
+def _read_owners(stream):
+    """Yield owners from a JSON array or from NDJSON, one owner per line"""
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+
+    if first == '[':
+        yield from json.loads(first + stream.read())
+        return
+
+    for line in itertools.chain([first + stream.readline()], stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Reported as a failed row rather than aborting the import
+            yield line
+
+
+class Command(BaseCommand):
+    help = ('Register house owners in bulk from a JSON array or NDJSON file of signup request bodies. '
+            'Rows that fail are reported and skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File of owners to import, or - for stdin")
+        parser.add_argument('--report', help='Write every import event, including the uid of each imported owner, '
+                                             'to this NDJSON file')
+
+    def handle(self, *args, **options):
+        _, firestore_db = initialize_firebase()
+
+        try:
+            source = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        except OSError as e:
+            raise CommandError(str(e))
+        report = open(options['report'], 'w', encoding='utf-8') if options['report'] else None
+
+        try:
+            for event in import_owners(firestore_db, _read_owners(source)):
+                if report is not None:
+                    report.write(json.dumps(event) + '\n')
+
+                if event['event'] == 'failed':
+                    self.stderr.write(f"Row {event['row']} ({event['email']}): {event['error']}")
+                elif event['event'] == 'progress':
+                    self.stdout.write(f"{event['processed']} processed: "
+                                      f"{event['imported']} imported, {event['failed']} failed")
+                elif event['event'] == 'done':
+                    style = self.style.WARNING if event['failed'] else self.style.SUCCESS
+                    self.stdout.write(style(f"Imported {event['imported']} of {event['processed']} owners"))
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Invalid JSON: {str(e)}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report is not None:
+                report.close()
@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import hashlib
+import logging
+import os
+import secrets
+import string
+
+from django.conf import settings
+from firebase_admin import auth
+
+from TenantVoltAPI.metrics import timed
+from TenantVoltAPI.tenant_store import tenant_writes
+from orders.order_updates import FIRESTORE_BATCH_LIMIT
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One batch holds the owner document and one document per tenant
+MAX_TENANTS_PER_OWNER = FIRESTORE_BATCH_LIMIT - 1
+
+# auth.import_users accepts at most 1000 users per call
+IMPORT_USERS_LIMIT = 1000
+
+REQUIRED_OWNER_FIELDS = ('email', 'password', 'first_name', 'last_name', 'mobile_number', 'address', 'tenants')
+
+UID_ALPHABET = string.ascii_letters + string.digits
+
+
+def validate_owner(data):
+    """Return the reason an owner as signup receives it cannot be registered, or None"""
+    if not isinstance(data, dict):
+        return 'Each owner must be an object'
+
+    if not all(data.get(field) for field in REQUIRED_OWNER_FIELDS):
+        return 'Missing required fields'
+
+    if not isinstance(data['email'], str) or not isinstance(data['password'], str):
+        return 'email and password must be strings'
+
+    # The same shape check auth.ImportUserRecord makes; the signup REST API rejects these too
+    local_part, at, domain = data['email'].partition('@')
+    if not at or not local_part or not domain or '@' in domain:
+        return 'INVALID_EMAIL : Email address is malformed'
+
+    # Firebase Auth enforces this on signup, but not on imported password hashes
+    if len(data['password']) < 6:
+        return 'WEAK_PASSWORD : Password should be at least 6 characters'
+
+    tenants = data['tenants']
+    if not isinstance(tenants, list) or not all(isinstance(tenant, dict) for tenant in tenants):
+        return 'tenants must be a list of objects'
+
+    if len(tenants) > MAX_TENANTS_PER_OWNER:
+        return f'At most {MAX_TENANTS_PER_OWNER} tenants can be registered'
+
+    return None
+
+
+def new_owner_document(data):
+    """The house_owners document for a newly registered owner; its tenants are written separately"""
+    return {
+        'first_name': data.get('first_name'),
+        'last_name': data.get('last_name'),
+        'mobile_number': data.get('mobile_number'),
+        'email': data.get('email'),
+        'address': data.get('address'),
+        'order_date_time': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
+        'order_status': "pending",
+        'tenant_count': len(data.get('tenants', [])),
+    }
+
+
+def _new_uid():
+    """A random 28 character uid, shaped like the ones Firebase Auth assigns"""
+    return ''.join(secrets.choice(UID_ALPHABET) for _ in range(28))
+
+
+def _hash_password(password, rounds):
+    salt = os.urandom(16)
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, rounds), salt
+
+
+def import_owners(firestore_db, rows):
+    """
+    Register many house owners; yield progress events as dicts
+
+    rows is an iterable of owners shaped like the signup request body. Every
+    IMPORT_USERS_LIMIT valid rows become one auth.import_users call, with
+    passwords pre-hashed as PBKDF2-SHA256. The owners Auth accepted are then
+    written with their tenants in Firestore batches of up to
+    FIRESTORE_BATCH_LIMIT writes. An owner never straddles two batches. A
+    row that fails is reported and skipped, and the rest of its chunk goes
+    on. If an owner's batch cannot be committed, its Auth user is deleted
+    again, so a retry of that row starts clean.
+
+    Events:
+        {"event": "imported", "row": 0, "email": "...", "uid": "..."}
+        {"event": "failed", "row": 1, "email": "...", "error": "..."}
+        {"event": "progress", "processed": 1000, "imported": 998, "failed": 2}
+        {"event": "done", "processed": 1200, "imported": 1197, "failed": 3}
+    """
+    counts = {'processed': 0, 'imported': 0, 'failed': 0}
+    seen_emails = set()
+    chunk = []
+    rounds = getattr(settings, 'OWNER_IMPORT_HASH_ROUNDS', 10000)
+
+    with ThreadPoolExecutor(max_workers=getattr(settings, 'OWNER_IMPORT_HASH_WORKERS', 4)) as executor:
+        def flush():
+            for event in _import_chunk(firestore_db, chunk, executor, rounds):
+                counts[event['event']] += 1
+                yield event
+            chunk.clear()
+            yield {'event': 'progress', **counts}
+
+        for row_number, data in enumerate(rows):
+            counts['processed'] += 1
+            email = data.get('email') if isinstance(data, dict) else None
+            error = validate_owner(data)
+            if error is None and email.lower() in seen_emails:
+                error = 'Duplicate email in this import'
+            if error is not None:
+                counts['failed'] += 1
+                yield {'event': 'failed', 'row': row_number, 'email': email, 'error': error}
+                continue
+
+            seen_emails.add(email.lower())
+            chunk.append((row_number, data))
+            if len(chunk) == IMPORT_USERS_LIMIT:
+                yield from flush()
+
+        if chunk:
+            yield from flush()
+
+    yield {'event': 'done', **counts}
+
+
+def _import_chunk(firestore_db, chunk, executor, rounds):
+    """Create the Auth users and Firestore documents of up to IMPORT_USERS_LIMIT validated owners"""
+    hashes = list(executor.map(lambda row: _hash_password(row[1]['password'], rounds), chunk))
+    records, accepted = [], []
+    for (row_number, data), (password_hash, salt) in zip(chunk, hashes):
+        uid = _new_uid()
+        try:
+            records.append(auth.ImportUserRecord(uid=uid, email=data['email'], password_hash=password_hash,
+                                                 password_salt=salt))
+        except ValueError as e:
+            yield {'event': 'failed', 'row': row_number, 'email': data['email'], 'error': str(e)}
+            continue
+        accepted.append((uid, (row_number, data)))
+
+    if not records:
+        return
+
+    try:
+        with timed('identity_toolkit'):
+            result = auth.import_users(records, hash_alg=auth.UserImportHash.pbkdf2_sha256(rounds=rounds))
+    except Exception as e:
+        logger.error(f"Owner import: import_users failed: {str(e)}")
+        for _, (row_number, data) in accepted:
+            yield {'event': 'failed', 'row': row_number, 'email': data['email'], 'error': str(e)}
+        return
+
+    auth_errors = {error.index: error.reason for error in result.errors}
+    created = []
+    for index, (uid, (row_number, data)) in enumerate(accepted):
+        if index in auth_errors:
+            yield {'event': 'failed', 'row': row_number, 'email': data['email'], 'error': auth_errors[index]}
+        else:
+            created.append((row_number, data, uid))
+
+    batch = firestore_db.batch()
+    batch_owners = []
+    batch_writes = 0
+    for row_number, data, uid in created:
+        user_data = new_owner_document(data)
+        writes = [(firestore_db.collection('house_owners').document(uid), user_data)]
+        writes.extend(tenant_writes(firestore_db, uid, user_data, data['tenants']))
+
+        if batch_writes + len(writes) > FIRESTORE_BATCH_LIMIT:
+            yield from _commit_owners(batch, batch_owners)
+            batch, batch_owners, batch_writes = firestore_db.batch(), [], 0
+
+        for reference, record in writes:
+            batch.set(reference, record)
+        batch_owners.append((row_number, data, uid))
+        batch_writes += len(writes)
+
+    if batch_owners:
+        yield from _commit_owners(batch, batch_owners)
+
+
+def _commit_owners(batch, batch_owners):
+    try:
+        batch.commit()
+    except Exception as e:
+        logger.error(f"Owner import: saving {len(batch_owners)} owners failed: {str(e)}")
+        uids = [uid for _, _, uid in batch_owners]
+        try:
+            # Without its profile the Auth user is unusable, and it would block a retry with the same email
+            auth.delete_users(uids)
+        except Exception as cleanup_error:
+            logger.error(f"Owner import: could not delete Auth users {uids}: {str(cleanup_error)}")
+        for row_number, data, _ in batch_owners:
+            yield {'event': 'failed', 'row': row_number, 'email': data['email'],
+                   'error': f'Profile could not be saved: {str(e)}'}
+        return
+
+    for row_number, data, uid in batch_owners:
+        yield {'event': 'imported', 'row': row_number, 'email': data['email'], 'uid': uid}
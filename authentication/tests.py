@@ -0,0 +1,75 @@
+import hashlib
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from authentication import owner_import
+from authentication.owner_import import import_owners
+from benchmarks.memory_firestore import MemoryClient, MemoryStore, MemoryWriteBatch
+
+
+@override_settings(OWNER_IMPORT_HASH_ROUNDS=1000)
+class ImportOwnersTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        patcher = mock.patch.object(owner_import.auth, 'import_users', side_effect=self.imported)
+        self.import_users = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(owner_import.auth, 'delete_users')
+        self.delete_users = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.auth_errors = []
+
+    def imported(self, records, hash_alg):
+        return mock.Mock(errors=self.auth_errors)
+
+    @staticmethod
+    def owner(i, tenants=1):
+        return {
+            'email': f'owner{i}@example.com', 'password': f'secret{i}', 'first_name': 'Owner', 'last_name': str(i),
+            'mobile_number': '0770000000', 'address': '1 Main St',
+            'tenants': [{'name': f'Tenant {t}', 'email': f't{t}@example.com'} for t in range(tenants)],
+        }
+
+    def run_import(self, rows):
+        events = list(import_owners(self.db, rows))
+        return [event for event in events if event['event'] != 'progress'], events[-1]
+
+    def test_rows_are_imported_in_chunks_of_the_import_users_limit(self):
+        with mock.patch.object(owner_import, 'IMPORT_USERS_LIMIT', 2):
+            events, done = self.run_import([self.owner(i) for i in range(5)])
+        self.assertEqual([len(call.args[0]) for call in self.import_users.call_args_list], [2, 2, 1])
+        self.assertEqual((done['imported'], done['failed']), (5, 0))
+        uid = events[0]['uid']
+        self.assertEqual(self.db.collection('house_owners').document(uid).get().get('tenant_count'), 1)
+        self.assertTrue(self.db.collection('tenants').document(f'{uid}_0').get().exists)
+
+    def test_passwords_are_hashed_with_the_configured_pbkdf2_rounds(self):
+        self.run_import([self.owner(0)])
+        (records,), kwargs = self.import_users.call_args
+        self.assertEqual(kwargs['hash_alg'].to_dict(), {'hashAlgorithm': 'PBKDF2_SHA256', 'rounds': 1000})
+        record = records[0]
+        expected = hashlib.pbkdf2_hmac('sha256', b'secret0', record.password_salt, 1000)
+        self.assertEqual(record.password_hash, expected)
+        self.assertEqual(len(record.password_salt), 16)
+
+    def test_invalid_and_rejected_rows_are_reported(self):
+        self.auth_errors = [mock.Mock(index=1, reason='EMAIL_EXISTS')]
+        rows = [self.owner(0), self.owner(1), {**self.owner(2), 'password': 'short'}, self.owner(0)]
+        events, done = self.run_import(rows)
+        failed = {event['row']: event['error'] for event in events if event['event'] == 'failed'}
+        self.assertEqual(failed, {
+            1: 'EMAIL_EXISTS',
+            2: 'WEAK_PASSWORD : Password should be at least 6 characters',
+            3: 'Duplicate email in this import',
+        })
+        self.assertEqual((done['processed'], done['imported'], done['failed']), (4, 1, 3))
+
+    def test_auth_users_are_deleted_when_their_profiles_cannot_be_saved(self):
+        with mock.patch.object(MemoryWriteBatch, 'commit', side_effect=RuntimeError('unavailable')):
+            events, done = self.run_import([self.owner(0), self.owner(1)])
+        uids = [record.uid for record in self.import_users.call_args.args[0]]
+        self.delete_users.assert_called_once_with(uids)
+        self.assertEqual(done['failed'], 2)
+        self.assertEqual(events[0]['error'], 'Profile could not be saved: unavailable')
+        self.assertEqual(list(self.db.collection('house_owners').stream()), [])
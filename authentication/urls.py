@@ -1,7 +1,8 @@
 from django.urls import path
-from authentication.views import login, signup
+from authentication.views import import_owners_view, login, signup
 
 urlpatterns = [
     path('login/', login, name='login'),
     path('signup/', signup, name='signup'),
+    path('import/', import_owners_view, name='import_owners'),
 ]
\ No newline at end of file
@@ -1,19 +1,27 @@
-from zoneinfo import ZoneInfo
-
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
-from datetime import datetime, UTC
 import logging
-from TenantVoltAPI.firebase_config import initialize_firebase, sign_in_with_email_password, create_user_with_email_password
+from authentication.owner_import import import_owners, new_owner_document, validate_owner
+from TenantVoltAPI.firebase_async import (
+    async_create_user_with_email_password, async_sign_in_with_email_password, get_async_firestore,
+)
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.profile_cache import get_profile_cache, invalidate_profile
+from TenantVoltAPI.tenant_store import aget_owner_tenants, has_legacy_tenants, tenant_writes
+from TenantVoltAPI.utils import login_required
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Owners one import request may carry; larger portfolios go through the import_owners command
+MAX_IMPORT_OWNERS = 2000
+
 
 @csrf_exempt
-def login(request):
+async def login(request):
     """
     Endpoint for Firebase Email/Password authentication.
 
@@ -78,7 +86,7 @@ def login(request):
             }, status=400)
 
         # Authenticate with Firebase
-        token, uid, error = sign_in_with_email_password(email, password)
+        token, uid, error = await async_sign_in_with_email_password(email, password)
 
         if error:
             return JsonResponse({
@@ -86,21 +94,35 @@ def login(request):
                 'error': error
             }, status=401)
 
-        # Initialize Firebase
-        _, firestore_db = initialize_firebase()
+        # Serve the profile from this worker's cache when it has it
+        profile_cache = get_profile_cache()
+        user_data = profile_cache.get(uid)
 
-        # Get user profile from Firestore
-        house_owners_ref = firestore_db.collection('house_owners').document(uid)
-        house_owner_doc = house_owners_ref.get()
+        if user_data is None:
+            version = profile_cache.version()
 
-        if not house_owner_doc.exists:
-            return JsonResponse({
-                'success': False,
-                'error': 'User profile Data not found'
-            }, status=404)
+            firestore_db = get_async_firestore()
+
+            # Get user profile from Firestore
+            house_owners_ref = firestore_db.collection('house_owners').document(uid)
+            house_owner_doc = await house_owners_ref.get()
 
-        # Get user data
-        user_data = house_owner_doc.to_dict()
+            if not house_owner_doc.exists:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'User profile Data not found'
+                }, status=404)
+
+            # Get user data
+            user_data = house_owner_doc.to_dict()
+
+            # Tenants live in their own collection; owners not yet migrated still embed them
+            if not has_legacy_tenants(user_data):
+                tenants = await aget_owner_tenants(firestore_db, uid, user_data)
+                user_data['tenants'] = [tenant for tenant in tenants if tenant is not None]
+                user_data.pop('tenant_count', None)
+
+            profile_cache.put(uid, user_data, version)
 
         # Add token to the response
         user_data['token'] = token
@@ -117,7 +139,7 @@ def login(request):
 
 
 @csrf_exempt
-def signup(request):
+async def signup(request):
     """
     Endpoint for user registration with Firebase.
 
@@ -151,8 +173,7 @@ def signup(request):
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
     try:
-        # Initialize Firebase
-        _, firestore_db = initialize_firebase()
+        firestore_db = get_async_firestore()
 
         # Read request body
         body_data = request.body
@@ -161,21 +182,18 @@ def signup(request):
         # Get required fields
         email = data.get('email')
         password = data.get('password')
-        first_name = data.get('first_name')
-        last_name = data.get('last_name')
-        mobile_number = data.get('mobile_number')
-        address = data.get('address')
         tenants = data.get('tenants', [])
 
         # Validate inputs
-        if not all([email, password, first_name, last_name, mobile_number, address, tenants]):
+        error = validate_owner(data)
+        if error:
             return JsonResponse({
                 'success': False,
-                'error': 'Missing required fields'
+                'error': error
             }, status=400)
 
         # Create user in Firebase Authentication
-        uid , error = create_user_with_email_password(email, password)
+        uid , error = await async_create_user_with_email_password(email, password)
 
         if error:
             return JsonResponse({
@@ -183,24 +201,17 @@ def signup(request):
                 'error': error
             }, status=400)
 
-        # Store user data in Firestore
-        user_data = {
-            'first_name': first_name,
-            'last_name': last_name,
-            'mobile_number': mobile_number,
-            'email': email,
-            'address': address,
-            'order_date_time': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
-            'order_status': "pending"
-        }
-
-        # Add tenants if available
-        if tenants and isinstance(tenants, list):
-            user_data['tenants'] = tenants
-
-        # Save to Firestore
+        # Store user data in Firestore; tenants get one document each in the tenants collection
+        user_data = new_owner_document(data)
+
+        # Save the owner and its tenants to Firestore in one batch
         house_owners_ref = firestore_db.collection('house_owners').document(uid)
-        house_owners_ref.set(user_data)
+        batch = firestore_db.batch()
+        batch.set(house_owners_ref, user_data)
+        for tenant_ref, tenant_data in tenant_writes(firestore_db, uid, user_data, tenants):
+            batch.set(tenant_ref, tenant_data)
+        await batch.commit()
+        invalidate_profile(uid)
 
         # Return token and uid
         return JsonResponse({
@@ -211,4 +222,95 @@ def signup(request):
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         logger.error(f"Signup error: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+async def _stream_import(firestore_db, owners):
+    """
+    Encode import_owners events as NDJSON; an unexpected error ends the stream with an error line
+
+    The import runs on a worker thread, one event at a time, so under ASGI
+    each event is sent as soon as it happens rather than when the import ends.
+    """
+    events = import_owners(firestore_db, owners)
+    next_event = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (event := await next_event(events, None)) is not None:
+            yield json.dumps(event) + '\n'
+    except Exception as e:
+        logger.error(f"Owner import error: {str(e)}")
+        yield json.dumps({'event': 'error', 'error': 'Server error'}) + '\n'
+    finally:
+        # Stops the import if the client went away before it finished
+        await sync_to_async(events.close, thread_sensitive=False)()
+
+
+@csrf_exempt
+@login_required
+def import_owners_view(request):
+    """
+    Bulk onboarding of house owners, e.g. when migrating a property-management portfolio.
+
+    Requires a Firebase ID token with the admin custom claim. Auth users are
+    created with auth.import_users, up to 1000 per call, and the house_owners
+    and tenants documents are written in batched commits. Progress is streamed
+    as NDJSON while the import runs. A row that fails is reported on its own
+    line and does not stop the others.
+
+    Expected request body:
+    {
+        "owners": [
+            {
+                "first_name": "John",
+                "last_name": "Doe",
+                "mobile_number": "+1234567890",
+                "email": "john.doe@example.com",
+                "password": "securePassword123",
+                "address": "123 Main St, City, Country",
+                "tenants": [
+                    {"name": "Alice Smith", "email": "alice.smith@example.com", "address": "456 Elm St, City, Country"}
+                ]
+            }
+        ]
+    }
+
+    Response body (application/x-ndjson, one event per line):
+    {"event": "imported", "row": 0, "email": "john.doe@example.com", "uid": "Xq3Lr0GZb1TnVd8sPaKfYu2WcH7m"}
+    {"event": "failed", "row": 1, "email": "jane@example.com", "error": "Missing required fields"}
+    {"event": "progress", "processed": 2, "imported": 1, "failed": 1}
+    {"event": "done", "processed": 2, "imported": 1, "failed": 1}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    if not request.firebase_user.get('admin'):
+        return JsonResponse({'success': False, 'error': 'Admin access required'}, status=403)
+
+    try:
+        # Read request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
+
+        owners = data.get('owners') if isinstance(data, dict) else None
+        if not isinstance(owners, list) or not owners:
+            return JsonResponse({
+                'success': False,
+                'error': 'owners must be a non-empty list'
+            }, status=400)
+
+        if len(owners) > MAX_IMPORT_OWNERS:
+            return JsonResponse({
+                'success': False,
+                'error': f'At most {MAX_IMPORT_OWNERS} owners can be imported per request'
+            }, status=400)
+
+        # Initialize Firebase
+        _, firestore_db = initialize_firebase()
+
+        return StreamingHttpResponse(_stream_import(firestore_db, owners), content_type='application/x-ndjson')
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Owner import error: {str(e)}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
\ No newline at end of file
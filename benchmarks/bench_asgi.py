@@ -0,0 +1,102 @@
+"""
+Compare logins served by one worker one at a time, as a sync gunicorn worker does, with concurrent logins on ASGI.
+
+Drives the ASGI application in-process with httpx, against a local
+Identity Toolkit stub (benchmarks.identity_stub, in its own process) whose
+--latency stands in for the round trip to Google. Profiles are pre-loaded into the profile
+cache, so no Firestore project is needed. With --concurrency 1 a request
+waits for the previous one, as on the sync worker; with more, the worker
+keeps serving while earlier logins wait on the network.
+
+Usage:
+    python -m benchmarks.bench_asgi --logins 400 --concurrency 20 --latency 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+# Measure the worker, not the per-IP login limits
+os.environ.setdefault('ADMISSION_CONTROL_ENABLED', 'false')
+django.setup()
+
+import httpx  # noqa: E402
+
+from TenantVoltAPI import firebase_config  # noqa: E402
+from TenantVoltAPI.asgi import application  # noqa: E402
+from TenantVoltAPI.profile_cache import get_profile_cache  # noqa: E402
+from benchmarks.identity_stub import IdentityStub  # noqa: E402
+
+
+def serve_stub(latency, address_queue):
+    stub = IdentityStub(('127.0.0.1', 0), 0.0, latency)
+    address_queue.put(stub.base_url)
+    stub.serve_forever()
+
+
+def stub_uid(email):
+    """The localId the stub hands out for an email"""
+    return hashlib.sha1(email.encode()).hexdigest()[:28]
+
+
+def warm_profiles(logins):
+    profile_cache = get_profile_cache()
+    for i in range(logins):
+        email = f'owner{i}@tenantvolt.test'
+        profile_cache.put(stub_uid(email), {
+            'first_name': 'Owner', 'last_name': str(i), 'email': email, 'mobile_number': '+94770000000',
+            'address': '123 Main St, Colombo', 'order_status': 'completed', 'tenants': [],
+        }, profile_cache.version())
+
+
+async def run(logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=application)
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+        async def login_one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post('/api/auth/login/',
+                                             json={'email': f'owner{i}@tenantvolt.test', 'password': 'secret'})
+                if response.status_code != 200:
+                    raise SystemExit(f'Login {i} failed: {response.status_code} {response.text}')
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(login_one(i) for i in range(logins))))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    # A separate process, so the stub's threads do not compete with the worker for the GIL
+    address_queue = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub, args=(args.latency, address_queue), daemon=True)
+    stub.start()
+    firebase_config.IDENTITY_TOOLKIT_URL = address_queue.get()
+    warm_profiles(args.logins)
+
+    print(f"{args.logins} logins on one worker, Identity Toolkit latency {args.latency}s")
+    for name, concurrency in (('serial', 1), ('async', args.concurrency)):
+        latencies, elapsed = asyncio.run(run(args.logins, concurrency))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{name:>7} (concurrency {concurrency:>3}): {args.logins / elapsed:7.1f} logins/s  "
+              f"p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+
+    stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Measure the per-request cost of Firebase ID token verification with and without the verified-token cache.
+
+Mints RS256 ID tokens with a throwaway key, serves the matching certificate
+from a local endpoint standing in for Google's, and verifies a stream of
+requests from a pool of users both ways: auth.verify_id_token on every
+request, as login_required used to, and the cached verify_firebase_token.
+
+Usage:
+    python -m benchmarks.bench_auth --requests 5000 --users 50 --cert-max-age 3600
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+django.setup()
+
+import firebase_admin  # noqa: E402
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+from firebase_admin import _token_gen, auth, credentials  # noqa: E402
+from google.auth import crypt, jwt  # noqa: E402
+
+from TenantVoltAPI import firebase_config, token_cache  # noqa: E402
+from TenantVoltAPI.utils import verify_firebase_token  # noqa: E402
+
+PROJECT_ID = 'tenantvolt-bench'
+KEY_ID = 'bench-key'
+
+
+def make_key_and_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'bench')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(1)
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption()).decode()
+    return key_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def serve_certs(cert_pem, max_age, latency):
+    """Serve {KEY_ID: cert} the way Google's x509 endpoint does; returns (server, url, fetch counter)"""
+    body = json.dumps({KEY_ID: cert_pem}).encode()
+    fetches = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            fetches.append(time.time())
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', f'public, max-age={max_age}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/certs", fetches
+
+
+def mint_tokens(key_pem, users):
+    signer = crypt.RSASigner.from_string(key_pem, KEY_ID)
+    now = int(time.time())
+    return [
+        jwt.encode(signer, {
+            'iss': f'https://securetoken.google.com/{PROJECT_ID}', 'aud': PROJECT_ID,
+            'sub': f'user{i}', 'auth_time': now, 'iat': now, 'exp': now + 3600,
+        }).decode()
+        for i in range(users)
+    ]
+
+
+def measure(verify, tokens, requests):
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        if verify(tokens[i % len(tokens)]) is None:
+            raise SystemExit('Token verification failed')
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"  {label:<22} mean {statistics.mean(timings) * 1e6:9.1f} us   "
+          f"p50 {statistics.median(timings) * 1e6:9.1f} us   p99 {p99 * 1e6:9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--cert-max-age', type=int, default=3600)
+    parser.add_argument('--cert-latency', type=float, default=0.05, help='seconds the certificate endpoint takes')
+    args = parser.parse_args()
+
+    key_pem, cert_pem = make_key_and_cert()
+    server, cert_url, fetches = serve_certs(cert_pem, args.cert_max_age, args.cert_latency)
+
+    # Point the SDK and the refresher at the local endpoint before the token verifier is built
+    _token_gen.ID_TOKEN_CERT_URI = cert_url
+    token_cache.ID_TOKEN_CERT_URL = cert_url
+    firebase_config.firebase_app = firebase_admin.initialize_app(credentials.Certificate({
+        'type': 'service_account', 'project_id': PROJECT_ID, 'private_key': key_pem,
+        'client_email': f'bench@{PROJECT_ID}.iam.gserviceaccount.com', 'token_uri': 'https://oauth2.googleapis.com/token',
+    }), {'projectId': PROJECT_ID})
+
+    tokens = mint_tokens(key_pem, args.users)
+    auth.verify_id_token(tokens[0])  # warm the certificate cache for both runs
+
+    print(f"{args.requests} requests from {args.users} users")
+    stock = measure(auth.verify_id_token, tokens, args.requests)
+    report('verify every request', stock)
+    cached = measure(verify_firebase_token, tokens, args.requests)
+    report('verified-token cache', cached)
+    print(f"  speedup: {statistics.mean(stock) / statistics.mean(cached):.0f}x mean, "
+          f"{token_cache.get_token_cache().hits} cache hits, {len(fetches)} certificate fetches")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
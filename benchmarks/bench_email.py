@@ -0,0 +1,74 @@
+"""
+Compare bill email throughput of Django's stock SMTP backend with the pooled backend.
+
+Runs a local SMTP sink (benchmarks.smtp_sink) with simulated handshake/AUTH
+latency and sends the same messages through both backends from a thread pool.
+
+Usage:
+    python -m benchmarks.bench_email --messages 200 --threads 8 --connect-latency 0.15 --auth-latency 0.1
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+django.setup()
+
+from django.core.mail import EmailMessage, get_connection  # noqa: E402
+
+from benchmarks.smtp_sink import SMTPSink  # noqa: E402
+
+BACKENDS = {
+    'stock': 'django.core.mail.backends.smtp.EmailBackend',
+    'pooled': 'TenantVoltAPI.email_backend.PooledEmailBackend',
+}
+
+
+def run(backend_path, port, messages, threads):
+    def send_one(i):
+        connection = get_connection(
+            backend_path, host='127.0.0.1', port=port, username='bench', password='bench',
+            use_ssl=False, use_tls=False,
+        )
+        message = EmailMessage(
+            subject=f'Electricity Bill Notification - {i}',
+            body='Amount Due: $12.50',
+            from_email='billing@tenantvolt.test',
+            to=[f'tenant{i}@tenantvolt.test'],
+            connection=connection,
+        )
+        return message.send()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        sent = sum(executor.map(send_one, range(messages)))
+    return sent, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--connect-latency', type=float, default=0.15)
+    parser.add_argument('--auth-latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    sink = SMTPSink(('127.0.0.1', 0), args.connect_latency, args.auth_latency)
+    sink.start_in_background()
+    port = sink.server_address[1]
+
+    print(f"{args.messages} messages, {args.threads} threads, "
+          f"connect latency {args.connect_latency}s, auth latency {args.auth_latency}s")
+    for name, backend_path in BACKENDS.items():
+        sent, elapsed = run(backend_path, port, args.messages, args.threads)
+        print(f"{name:>7}: {sent} sent in {elapsed:.2f}s  "
+              f"{sent / elapsed:8.1f} msg/s  {elapsed / sent * 1000:7.2f} ms/msg")
+
+    sink.shutdown()
+
+
+if __name__ == '__main__':
+    main()
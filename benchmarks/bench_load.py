@@ -0,0 +1,178 @@
+"""
+End-to-end load test of the ASGI application with no Firebase project or mail server.
+
+Firestore is replaced by the in-memory backend (benchmarks.memory_firestore),
+Firebase Auth by benchmarks.identity_stub (in its own process) and SMTP by
+benchmarks.smtp_sink. --latency is added to every Firestore and Auth round
+trip. Each scenario sends --requests requests, --concurrency at a time, in-process
+through httpx, and builds on the data the one before it wrote:
+
+    signup          register owners, each with --tenants tenants
+    login           sign each owner in (profile read from Firestore, then cached)
+    list_orders     page through the order listing
+    update_status   complete each order, assigning product_ids to its tenants
+    notify          queue a bill notification for every tenant
+    deliver         drain the outbox as drain_outbox does: send and record the bills
+
+For each scenario it prints throughput and p50/p95/p99 latency (per request,
+or per outbox batch for deliver).
+
+Usage:
+    python -m benchmarks.bench_load --requests 200 --concurrency 20 --latency 0.01
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import time
+
+from benchmarks.smtp_sink import SMTPSink
+
+# Settings are read once by django.setup(), so the fakes go in first
+_smtp_sink = SMTPSink(('127.0.0.1', 0))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+# Measure the worker, not the per-IP limits
+os.environ['ADMISSION_CONTROL_ENABLED'] = 'false'
+os.environ.update({
+    'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': str(_smtp_sink.server_address[1]), 'EMAIL_USE_SSL': 'false',
+    'EMAIL_HOST_USER': 'bench', 'EMAIL_HOST_PASSWORD': 'bench', 'DEFAULT_FROM_EMAIL': 'billing@tenantvolt.test',
+})
+
+import django  # noqa: E402
+
+django.setup()
+
+import httpx  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from TenantVoltAPI import firebase_config  # noqa: E402
+from TenantVoltAPI.asgi import application  # noqa: E402
+from benchmarks import memory_firestore  # noqa: E402
+from benchmarks.bench_asgi import serve_stub, stub_uid  # noqa: E402
+from bills.outbox import claim_due_jobs, deliver_jobs  # noqa: E402
+
+# Before anything initializes Firebase
+memory_firestore.install()
+
+BILL_MONTH = '2025-02'
+DELIVERY_BATCH_SIZE = 50
+
+
+def owner(i, tenants):
+    return {
+        'first_name': 'Owner', 'last_name': str(i), 'email': f'owner{i}@tenantvolt.test', 'password': 'secret1',
+        'mobile_number': '+94770000000', 'address': f'{i} Main St, Colombo',
+        'tenants': [{'name': f'Tenant {i}-{j}', 'email': f'tenant{i}-{j}@tenantvolt.test'} for j in range(tenants)],
+    }
+
+
+def product_id(i, j):
+    return f'{i:05d}{j:02d}'
+
+
+def percentile(latencies, fraction):
+    return latencies[max(int(len(latencies) * fraction + 0.5) - 1, 0)]
+
+
+def report(name, count, errors, latencies, elapsed, unit='req'):
+    latencies = sorted(latencies)
+    print(f"{name:>14}: {count:6d} {unit}  {errors:4d} errors  {count / elapsed:8.1f} {unit}/s  "
+          f"p50 {statistics.median(latencies) * 1000:8.2f} ms  p95 {percentile(latencies, 0.95) * 1000:8.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms")
+
+
+async def run_scenario(client, concurrency, requests):
+    """Send (method, url, body, expected_status) requests; returns (latencies, errors, elapsed)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def send(method, url, body, expected_status):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latency = time.perf_counter() - started
+            if response.status_code != expected_status:
+                errors.append(f'{method} {url}: {response.status_code} {response.text[:200]}')
+            return latency
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(send(*request) for request in requests))
+    elapsed = time.perf_counter() - started
+    for error in errors[:3]:
+        print(f"    {error}")
+    return latencies, len(errors), elapsed
+
+
+async def run(owners, tenants, concurrency):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost', timeout=60) as client:
+        scenarios = (
+            ('signup', [('POST', '/api/auth/signup/', owner(i, tenants), 200) for i in range(owners)]),
+            ('login', [('POST', '/api/auth/login/', {'email': f'owner{i}@tenantvolt.test', 'password': 'secret1'}, 200)
+                       for i in range(owners)]),
+            ('list_orders', [('GET', '/api/orders/?limit=20', None, 200) for _ in range(owners)]),
+            ('update_status', [
+                ('POST', '/api/orders/update-status/', {
+                    'uid': stub_uid(f'owner{i}@tenantvolt.test'),
+                    'tenants': [{'tenant_index': j, 'product_id': product_id(i, j)} for j in range(tenants)],
+                }, 200)
+                for i in range(owners)
+            ]),
+            ('notify', [('POST', '/api/bills/send-notification/',
+                         {'product_id': product_id(i, j), 'month': BILL_MONTH, 'kw_value': 120 + j}, 202)
+                        for i in range(owners) for j in range(tenants)]),
+        )
+        for name, requests in scenarios:
+            latencies, errors, elapsed = await run_scenario(client, concurrency, requests)
+            report(name, len(requests), errors, latencies, elapsed)
+
+
+def deliver():
+    """Drain the outbox in batches, as drain_outbox does"""
+    latencies, sent, failed = [], 0, 0
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        jobs = claim_due_jobs(DELIVERY_BATCH_SIZE)
+        if not jobs:
+            break
+        batch_sent, batch_failed = deliver_jobs(jobs)
+        sent += batch_sent
+        failed += batch_failed
+        latencies.append(time.perf_counter() - batch_started)
+    if latencies:
+        report('deliver', sent + failed, failed, latencies, time.perf_counter() - started, unit='msg')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='owners to sign up, and requests per scenario')
+    parser.add_argument('--tenants', type=int, default=2, help='tenants per owner, each notified once')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds added to each Firestore and Identity Toolkit round trip')
+    args = parser.parse_args()
+
+    # A separate process, so the stub's threads do not compete with the worker for the GIL
+    address_queue = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub, args=(args.latency, address_queue), daemon=True)
+    stub.start()
+    firebase_config.IDENTITY_TOOLKIT_URL = address_queue.get()
+    _smtp_sink.start_in_background()
+    memory_firestore.get_memory_store().latency = args.latency
+    # The outbox lives in the database; use a throwaway one
+    connection.creation.create_test_db(verbosity=0)
+
+    print(f"{args.requests} owners with {args.tenants} tenants each, concurrency {args.concurrency}, "
+          f"Firestore and Identity Toolkit latency {args.latency}s")
+    try:
+        asyncio.run(run(args.requests, args.tenants, args.concurrency))
+        deliver()
+    finally:
+        stub.terminate()
+    print(f"{_smtp_sink.messages} emails received by the SMTP sink")
+
+
+if __name__ == '__main__':
+    main()
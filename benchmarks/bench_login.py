@@ -0,0 +1,77 @@
+"""
+Compare login round trips to the Identity Toolkit with a fresh connection per call and with the shared session.
+
+Runs a local stub (benchmarks.identity_stub) with simulated handshake latency
+and signs in from a thread pool, once with a bare requests.post per call, as
+firebase_config used to, and once through sign_in_with_email_password.
+
+Usage:
+    python -m benchmarks.bench_login --logins 300 --threads 8 --connect-latency 0.1 --latency 0.02
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+django.setup()
+
+import requests  # noqa: E402
+
+from TenantVoltAPI import firebase_config  # noqa: E402
+from benchmarks.identity_stub import IdentityStub  # noqa: E402
+
+
+def stock_sign_in(email, password):
+    response = requests.post(f"{firebase_config.IDENTITY_TOOLKIT_URL}/accounts:signInWithPassword?key=bench",
+                             json={'email': email, 'password': password, 'returnSecureToken': True})
+    return response.json().get('idToken')
+
+
+def pooled_sign_in(email, password):
+    id_token, _, _ = firebase_config.sign_in_with_email_password(email, password)
+    return id_token
+
+
+def run(sign_in, logins, threads):
+    def login_one(i):
+        started = time.perf_counter()
+        if sign_in(f'owner{i}@tenantvolt.test', 'secret') is None:
+            raise SystemExit('Login failed')
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(login_one, range(logins)))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--connect-latency', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    stub = IdentityStub(('127.0.0.1', 0), args.connect_latency, args.latency)
+    stub.start_in_background()
+    firebase_config.IDENTITY_TOOLKIT_URL = stub.base_url
+
+    print(f"{args.logins} logins, {args.threads} threads, "
+          f"connect latency {args.connect_latency}s, request latency {args.latency}s")
+    for name, sign_in in (('stock', stock_sign_in), ('pooled', pooled_sign_in)):
+        connections = stub.connections
+        latencies, elapsed = run(sign_in, args.logins, args.threads)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{name:>7}: {args.logins / elapsed:7.1f} logins/s  p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+              f"p95 {p95 * 1000:7.2f} ms  {stub.connections - connections} connections")
+
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
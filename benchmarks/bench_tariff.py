@@ -0,0 +1,81 @@
+"""
+Benchmark the vectorized tariff engine against a per-tenant Python loop.
+
+Prices a synthetic portfolio with settings.BILLING_TARIFF both ways, checks the
+results agree and reports the timings.
+
+Usage:
+    python -m benchmarks.bench_tariff --tenants 100000 --repeat 5
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TenantVoltAPI.settings')
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from bills.tariff import Tariff  # noqa: E402
+
+
+def price_loop(definition, kw_values):
+    """Reference implementation: one tenant at a time"""
+    blocks = definition['blocks']
+    fixed_charge = sum(charge['amount'] for charge in definition.get('fixed_charges', ()))
+    tax_rate = sum(tax['rate'] for tax in definition.get('taxes', ()))
+
+    amounts = []
+    for kwh in kw_values:
+        energy = 0.0
+        lower = 0.0
+        block_fixed = 0.0
+        for block in blocks:
+            upper = float('inf') if block['up_to'] is None else block['up_to']
+            energy += max(0.0, min(kwh, upper) - lower) * block['rate']
+            block_fixed = block.get('fixed_charge', 0)
+            if kwh <= upper:
+                break
+            lower = upper
+        subtotal = energy + block_fixed + fixed_charge
+        amounts.append(round(subtotal * (1 + tax_rate), 2))
+    return amounts
+
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    kw_values = np.round(rng.gamma(shape=2.0, scale=90.0, size=args.tenants), 2)
+    definition = settings.BILLING_TARIFF
+    tariff = Tariff.from_dict(definition)
+
+    vector_time, vector_amounts = best_of(args.repeat, tariff.price, kw_values)
+    loop_time, loop_amounts = best_of(max(1, args.repeat // 2), price_loop, definition, kw_values.tolist())
+
+    if not np.allclose(vector_amounts, loop_amounts, atol=0.011):
+        raise SystemExit('Vectorized and loop prices disagree')
+
+    print(f"{args.tenants} tenants, best of {args.repeat}")
+    print(f"  vectorized: {vector_time * 1000:8.2f} ms  ({args.tenants / vector_time:,.0f} bills/s)")
+    print(f"  python loop: {loop_time * 1000:7.2f} ms  ({args.tenants / loop_time:,.0f} bills/s)")
+    print(f"  speedup: {loop_time / vector_time:.1f}x, total billed {vector_amounts.sum():,.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Local Firebase Auth REST API stand-in for benchmarking login offline.
+
+Answers accounts:signInWithPassword and accounts:signUp for any email and
+password over keep-alive HTTP/1.1. --connect-latency adds a delay to each new
+connection, standing in for the TCP and TLS handshakes with
+identitytoolkit.googleapis.com that a pooled session avoids. --latency adds
+a delay to every request.
+
+Usage:
+    python -m benchmarks.identity_stub --port 9099 --connect-latency 0.1 --latency 0.02
+
+Point the app at it with IDENTITY_TOOLKIT_URL=http://127.0.0.1:9099/v1.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class IdentityStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        time.sleep(self.server.connect_latency)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.server.latency)
+        self.server.count_request()
+
+        local_id = hashlib.sha1(payload.get('email', '').encode()).hexdigest()[:28]
+        if self.path.startswith('/v1/accounts:signInWithPassword'):
+            self.respond(200, {'idToken': f'stub-token-{local_id}', 'localId': local_id, 'expiresIn': '3600'})
+        elif self.path.startswith('/v1/accounts:signUp'):
+            self.respond(200, {'localId': local_id, 'email': payload.get('email')})
+        else:
+            self.respond(404, {'error': {'code': 404, 'message': 'NOT_FOUND'}})
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class IdentityStub(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Concurrent benchmarks open many connections at once
+    request_queue_size = 256
+
+    def __init__(self, address, connect_latency=0.0, latency=0.0):
+        super().__init__(address, IdentityStubHandler)
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9099)
+    parser.add_argument('--connect-latency', type=float, default=0.0,
+                        help='seconds added to each new connection, standing in for the TCP and TLS handshakes')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to each request')
+    args = parser.parse_args()
+
+    stub = IdentityStub((args.host, args.port), args.connect_latency, args.latency)
+    print(f"Identity Toolkit stub listening on {stub.base_url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{stub.requests} requests over {stub.connections} connections")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,706 @@
+"""
+In-process stand-in for Firestore, for benchmarks and offline runs.
+
+install() hands it to TenantVoltAPI.firebase_config.use_firestore_backend():
+initialize_firebase() then returns a MemoryClient and get_async_firestore()
+an AsyncMemoryClient, both over one MemoryStore per process. They implement the part of the client API this
+project uses: collections, documents, where/order_by/select/start_after/limit
+queries, count() aggregations, get_all, atomic batches with update_time
+preconditions, non-atomic bulk batches and on_snapshot listeners. Errors are
+the google.api_core exceptions Firestore raises. Importing the module
+registers its types with TenantVoltAPI.metrics.instrument_firestore and its
+bulk batch with orders.order_updates.
+
+Every call that would be a round trip to Firestore first waits
+FIRESTORE_MEMORY_LATENCY seconds (or MemoryStore.latency), so benchmarks see
+the network cost without a project. Nothing is persisted.
+"""
+import asyncio
+import copy
+import enum
+import functools
+import os
+import queue
+import secrets
+import string
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP
+from google.rpc import code_pb2
+
+from TenantVoltAPI.metrics import register_firestore_types
+from orders.order_updates import register_bulk_batch
+
+_MISSING = object()
+
+AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+ERROR_CODES = {NotFound: code_pb2.NOT_FOUND, AlreadyExists: code_pb2.ALREADY_EXISTS,
+               FailedPrecondition: code_pb2.FAILED_PRECONDITION}
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class MemoryApp:
+    """Takes the place of the firebase_admin App that initialize_firebase() returns"""
+    name = '[DEFAULT]'
+    project_id = 'tenantvolt-memory'
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class AggregationResult:
+    def __init__(self, alias, value, read_time):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class Status:
+    def __init__(self, code, message=''):
+        self.code = code
+        self.message = message
+
+
+class BulkWriteResponse:
+    def __init__(self, write_results, status):
+        self.write_results = write_results
+        self.status = status
+
+
+class Precondition:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class Change:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, field_path, value, commit_time):
+    *parents, leaf = field_path.split('.')
+    for part in parents:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+    if value is DELETE_FIELD:
+        data.pop(leaf, None)
+    else:
+        data[leaf] = _resolve(value, commit_time)
+
+
+def _resolve(value, commit_time):
+    """Copy a value being written, replacing SERVER_TIMESTAMP with the commit time"""
+    if value is SERVER_TIMESTAMP:
+        return commit_time
+    if isinstance(value, dict):
+        return {key: _resolve(item, commit_time) for key, item in value.items() if item is not DELETE_FIELD}
+    if isinstance(value, (list, tuple)):
+        return [_resolve(item, commit_time) for item in value]
+    return copy.deepcopy(value)
+
+
+def _type_rank(value):
+    """Firestore's ordering of value types: null, booleans, numbers, timestamps, strings, bytes, ..."""
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 6
+
+
+def _compare(left, right):
+    left_rank, right_rank = _type_rank(left), _type_rank(right)
+    if left_rank != right_rank:
+        return -1 if left_rank < right_rank else 1
+    try:
+        return (left > right) - (left < right)
+    except TypeError:
+        return 0
+
+
+def _matches(value, op, operand):
+    if value is _MISSING:
+        return False
+    if op == '==':
+        return _type_rank(value) == _type_rank(operand) and value == operand
+    if op == '!=':
+        return value != operand
+    if op in ('<', '<=', '>', '>='):
+        if _type_rank(value) != _type_rank(operand):
+            return False
+        order = _compare(value, operand)
+        return {'<': order < 0, '<=': order <= 0, '>': order > 0, '>=': order >= 0}[op]
+    if op == 'in':
+        return value in operand
+    if op == 'not-in':
+        return value not in operand
+    if op == 'array_contains':
+        return isinstance(value, list) and operand in value
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(item in value for item in operand)
+    raise ValueError(f'Unsupported operator: {op}')
+
+
+class _Watch:
+    """Delivers snapshot callbacks from its own thread, in commit order, like the SDK's Watch"""
+
+    def __init__(self, store, collection, callback):
+        self._store = store
+        self.collection = collection
+        self._callback = callback
+        self._events = queue.SimpleQueue()
+        self.is_active = True
+        self._thread = threading.Thread(target=self._run, name=f'memory-watch-{collection}', daemon=True)
+
+    def start(self, initial):
+        self._events.put(initial)
+        self._thread.start()
+
+    def push(self, docs, changes, read_time):
+        if self.is_active:
+            self._events.put((docs, changes, read_time))
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._store._remove_watch(self)
+        self._events.put(None)
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None or not self.is_active:
+                return
+            self._callback(*event)
+
+
+class MemoryStore:
+    """The documents of every collection, shared by the sync and async clients of a process"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._collections = {}  # collection -> {document_id: (data, create_time, update_time)}
+        self._watches = []
+        self._lock = threading.Lock()
+        self._last_time = datetime.now(timezone.utc)
+
+    def _now(self):
+        # Strictly increasing, so every write gets a distinct update_time as in Firestore
+        now = datetime.now(timezone.utc)
+        self._last_time = now if now > self._last_time else self._last_time + timedelta(microseconds=1)
+        return self._last_time
+
+    def read(self, reference):
+        with self._lock:
+            return self._snapshot(reference, self._collections.get(reference.collection, {}).get(reference.id))
+
+    def read_many(self, references):
+        with self._lock:
+            return [self._snapshot(reference, self._collections.get(reference.collection, {}).get(reference.id))
+                    for reference in references]
+
+    def documents(self, collection):
+        with self._lock:
+            return [(document_id, data, create_time, update_time)
+                    for document_id, (data, create_time, update_time)
+                    in self._collections.get(collection, {}).items()]
+
+    @staticmethod
+    def _snapshot(reference, stored, read_time=None):
+        if stored is None:
+            return DocumentSnapshot(reference, None, read_time=read_time)
+        data, create_time, update_time = stored
+        return DocumentSnapshot(reference, data, create_time, update_time, read_time)
+
+    def commit(self, writes):
+        """Apply (method, reference, data, option) writes atomically; returns the commit time"""
+        with self._lock:
+            commit_time = self._now()
+            staged = {}
+            for method, reference, data, option in writes:
+                key = (reference.collection, reference.id)
+                current = staged[key] if key in staged else self._collections.get(reference.collection, {}).get(
+                    reference.id)
+                staged[key] = (self._apply(method, reference, current, data, option, commit_time), reference)
+
+            changes_by_collection = {}
+            for (collection, document_id), (stored, reference) in staged.items():
+                documents = self._collections.setdefault(collection, {})
+                previous = documents.get(document_id)
+                if stored is None:
+                    documents.pop(document_id, None)
+                    if previous is not None:
+                        change = Change(ChangeType.REMOVED, self._snapshot(reference, previous, commit_time))
+                        changes_by_collection.setdefault(collection, []).append(change)
+                    continue
+                documents[document_id] = stored
+                change_type = ChangeType.ADDED if previous is None else ChangeType.MODIFIED
+                change = Change(change_type, self._snapshot(reference, stored, commit_time))
+                changes_by_collection.setdefault(collection, []).append(change)
+
+            for watch in self._watches:
+                changes = changes_by_collection.get(watch.collection)
+                if changes:
+                    watch.push([], changes, commit_time)
+        return commit_time
+
+    @staticmethod
+    def _apply(method, reference, current, data, option, commit_time):
+        """Return the document as stored after one write, or raise as Firestore would"""
+        if option is not None:
+            if option.exists is not None and option.exists != (current is not None):
+                raise FailedPrecondition(f'Document {reference.path} exists: {current is not None}')
+            if option.last_update_time is not None and (current is None or current[2] != option.last_update_time):
+                raise FailedPrecondition(f'Document {reference.path} was modified since {option.last_update_time}')
+
+        create_time = current[1] if current is not None else commit_time
+        if method == 'delete':
+            return None
+        if method == 'create':
+            if current is not None:
+                raise AlreadyExists(f'Document already exists: {reference.path}')
+            return _resolve(data, commit_time), commit_time, commit_time
+        if method == 'set':
+            return _resolve(data, commit_time), create_time, commit_time
+        if method == 'merge':
+            merged = copy.deepcopy(current[0]) if current is not None else {}
+            for field_path, value in data.items():
+                _set_field(merged, field_path, value, commit_time)
+            return merged, create_time, commit_time
+        if method == 'update':
+            if current is None:
+                raise NotFound(f'No document to update: {reference.path}')
+            updated = copy.deepcopy(current[0])
+            for field_path, value in data.items():
+                _set_field(updated, field_path, value, commit_time)
+            return updated, create_time, commit_time
+        raise ValueError(f'Unsupported write: {method}')
+
+    def watch(self, collection, callback):
+        watch = _Watch(self, collection, callback)
+        with self._lock:
+            read_time = self._now()
+            changes = [Change(ChangeType.ADDED, self._snapshot(MemoryDocumentReference(None, collection, document_id),
+                                                               stored, read_time))
+                       for document_id, stored in sorted(self._collections.get(collection, {}).items())]
+            self._watches.append(watch)
+            # Queued under the lock, so no commit can slip in between the initial snapshot and the changes
+            watch.start(([change.document for change in changes], changes, read_time))
+        return watch
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def clear(self):
+        with self._lock:
+            self._collections.clear()
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection, document_id):
+        self._client = client
+        self.collection = collection
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f'{self.collection}/{self.id}'
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._client._round_trip()
+        return self._client._store.read(self)
+
+    def create(self, document_data):
+        return self._write('create', document_data)
+
+    def set(self, document_data, merge=False):
+        return self._write('merge' if merge else 'set', document_data)
+
+    def update(self, field_updates, option=None):
+        return self._write('update', field_updates, option)
+
+    def delete(self, option=None):
+        return self._write('delete', None, option)
+
+    def _write(self, method, data, option=None):
+        self._client._round_trip()
+        return WriteResult(self._client._store.commit([(method, self, data, option)]))
+
+
+class AsyncMemoryDocumentReference(MemoryDocumentReference):
+    async def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        await self._client._round_trip()
+        return self._client._store.read(self)
+
+    async def _write(self, method, data, option=None):
+        await self._client._round_trip()
+        return WriteResult(self._client._store.commit([(method, self, data, option)]))
+
+
+class MemoryQuery:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+                 'cursor': self._cursor, 'fields': self._fields, **changes}
+        return self._client._query_class(self._client, self._collection, **state)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def count(self, alias=None):
+        return self._client._aggregation_class(self, alias or 'count')
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            # Firestore orders by the first inequality field when no order is given
+            inequality = next((field for field, op, _ in self._filters
+                               if op in ('<', '<=', '>', '>=', '!=', 'not-in')), None)
+            if inequality is not None:
+                orders.append((inequality, self.ASCENDING))
+        if not any(field == '__name__' for field, _ in orders):
+            orders.append(('__name__', orders[-1][1] if orders else self.ASCENDING))
+        return orders
+
+    @staticmethod
+    def _value(document_id, data, field_path):
+        return document_id if field_path == '__name__' else _get_field(data, field_path)
+
+    def _run(self):
+        """The snapshots this query returns, without the round trip"""
+        store = self._client._store
+        orders = self._effective_orders()
+        read_time = datetime.now(timezone.utc)
+
+        rows = []
+        for document_id, data, create_time, update_time in store.documents(self._collection):
+            if not all(_matches(self._value(document_id, data, field), op, value)
+                       for field, op, value in self._filters):
+                continue
+            # Documents without an ordered field are left out, as in Firestore
+            if any(self._value(document_id, data, field) is _MISSING for field, _ in orders):
+                continue
+            rows.append((document_id, data, create_time, update_time))
+
+        def compare_rows(left, right):
+            for field, direction in orders:
+                order = _compare(self._value(left[0], left[1], field), self._value(right[0], right[1], field))
+                if order:
+                    return -order if direction == self.DESCENDING else order
+            return 0
+
+        rows.sort(key=functools.cmp_to_key(compare_rows))
+
+        if self._cursor is not None:
+            cursor = self._cursor_values(orders)
+            rows = [row for row in rows if self._after_cursor(row, cursor, orders)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        snapshots = []
+        for document_id, data, create_time, update_time in rows:
+            if self._fields is not None:
+                projected = {}
+                for field in self._fields:
+                    value = _get_field(data, field)
+                    if field != '__name__' and value is not _MISSING:
+                        _set_field(projected, field, value, None)
+                data = projected
+            reference = self._client._document_class(self._client, self._collection, document_id)
+            snapshots.append(DocumentSnapshot(reference, copy.deepcopy(data), create_time, update_time, read_time))
+        return snapshots
+
+    def _cursor_values(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, DocumentSnapshot):
+            data = cursor._data or {}
+            return [cursor.id if field == '__name__' else _get_field(data, field) for field, _ in orders]
+        values = []
+        for field, _ in orders:
+            value = cursor.get(field, _MISSING)
+            if field == '__name__' and isinstance(value, MemoryDocumentReference):
+                value = value.id
+            values.append(value)
+        return values
+
+    def _after_cursor(self, row, cursor, orders):
+        for (field, direction), cursor_value in zip(orders, cursor):
+            if cursor_value is _MISSING:
+                break
+            order = _compare(self._value(row[0], row[1], field), cursor_value)
+            if order:
+                return (order < 0) if direction == self.DESCENDING else (order > 0)
+        return False
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        self._client._round_trip()
+        yield from self._run()
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        return list(self.stream())
+
+
+class AsyncMemoryQuery(MemoryQuery):
+    async def stream(self, transaction=None, retry=None, timeout=None):
+        await self._client._round_trip()
+        for snapshot in self._run():
+            yield snapshot
+
+    async def get(self, transaction=None, retry=None, timeout=None):
+        return [snapshot async for snapshot in self.stream()]
+
+
+class MemoryCollectionReference:
+    """Mixed into the query classes: a collection is the query of all its documents"""
+
+    @property
+    def id(self):
+        return self._collection
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = ''.join(secrets.choice(AUTO_ID_ALPHABET) for _ in range(20))
+        return self._client._document_class(self._client, self._collection, document_id)
+
+    def on_snapshot(self, callback):
+        return self._client._store.watch(self._collection, callback)
+
+
+class MemoryAggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        self._query._client._round_trip()
+        return self._result()
+
+    def _result(self):
+        return [[AggregationResult(self._alias, len(self._query._run()), datetime.now(timezone.utc))]]
+
+
+class AsyncMemoryAggregationQuery(MemoryAggregationQuery):
+    async def get(self, transaction=None, retry=None, timeout=None):
+        await self._query._client._round_trip()
+        return self._result()
+
+
+class MemoryWriteBatch:
+    """Atomic: every write is applied, or none is"""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('merge' if merge else 'set', reference, document_data, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, option))
+
+    def commit(self, retry=None, timeout=None):
+        self._client._round_trip()
+        return self._commit()
+
+    def _commit(self):
+        if not self._writes:
+            return []
+        commit_time = self._client._store.commit(self._writes)
+        return [WriteResult(commit_time) for _ in self._writes]
+
+
+class AsyncMemoryWriteBatch(MemoryWriteBatch):
+    async def commit(self, retry=None, timeout=None):
+        await self._client._round_trip()
+        return self._commit()
+
+
+class MemoryBulkWriteBatch(MemoryWriteBatch):
+    """Non-atomic like the BatchWrite RPC: each write succeeds or fails on its own"""
+
+    def commit(self, retry=None, timeout=None):
+        self._client._round_trip()
+        write_results, status = [], []
+        for write in self._writes:
+            try:
+                write_results.append(WriteResult(self._client._store.commit([write])))
+                status.append(Status(code_pb2.OK))
+            except tuple(ERROR_CODES) as e:
+                write_results.append(WriteResult(None))
+                status.append(Status(ERROR_CODES[type(e)], e.message))
+        return BulkWriteResponse(write_results, status)
+
+
+class MemoryClient:
+    _document_class = MemoryDocumentReference
+    _query_class = type('MemoryCollectionQuery', (MemoryCollectionReference, MemoryQuery), {})
+    _aggregation_class = MemoryAggregationQuery
+    _batch_class = MemoryWriteBatch
+
+    def __init__(self, store):
+        self._store = store
+        self.project = MemoryApp.project_id
+
+    def _round_trip(self):
+        if self._store.latency:
+            time.sleep(self._store.latency)
+
+    def collection(self, collection_id):
+        return self._query_class(self, collection_id)
+
+    def document(self, document_path):
+        collection, document_id = document_path.split('/')
+        return self._document_class(self, collection, document_id)
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._round_trip()
+        yield from self._store.read_many(list(references))
+
+    def batch(self):
+        return self._batch_class(self)
+
+    @staticmethod
+    def write_option(last_update_time=None, exists=None):
+        return Precondition(last_update_time, exists)
+
+
+class AsyncMemoryClient(MemoryClient):
+    _document_class = AsyncMemoryDocumentReference
+    _query_class = type('AsyncMemoryCollectionQuery', (MemoryCollectionReference, AsyncMemoryQuery), {})
+    _aggregation_class = AsyncMemoryAggregationQuery
+    _batch_class = AsyncMemoryWriteBatch
+
+    async def _round_trip(self):
+        if self._store.latency:
+            await asyncio.sleep(self._store.latency)
+
+    async def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        await self._round_trip()
+        for snapshot in self._store.read_many(list(references)):
+            yield snapshot
+
+
+register_firestore_types([MemoryClient], {'get_all', 'collections'})
+register_firestore_types([MemoryDocumentReference], {'get', 'create', 'set', 'update', 'delete'})
+register_firestore_types([MemoryQuery], {'get', 'stream', 'add'})
+register_firestore_types([MemoryAggregationQuery], {'get', 'stream'})
+register_firestore_types([MemoryWriteBatch], {'commit'})
+# What orders.order_updates builds in place of BulkWriteBatch(client)
+register_bulk_batch(MemoryClient, MemoryBulkWriteBatch)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_memory_store():
+    """Return this process's MemoryStore, creating it on first use"""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MemoryStore(latency=float(os.getenv('FIRESTORE_MEMORY_LATENCY', 0)))
+
+    return _store
+
+
+def install():
+    """Serve this process's Firestore from get_memory_store(); call before Firebase is first initialized"""
+    from TenantVoltAPI.firebase_config import use_firestore_backend
+
+    store = get_memory_store()
+    use_firestore_backend(MemoryApp(), MemoryClient(store), lambda: AsyncMemoryClient(store))
@@ -0,0 +1,103 @@
+"""
+Local SMTP stand-in for benchmarking email delivery offline.
+
+Accepts any login and swallows every message. --connect-latency and
+--auth-latency add a delay to each new session and each AUTH, so the cost of
+the TLS handshake and login that pooling avoids shows up in the numbers.
+
+Usage:
+    python -m benchmarks.smtp_sink --port 2525 --connect-latency 0.15 --auth-latency 0.1
+
+Point the app at it with EMAIL_HOST=127.0.0.1 EMAIL_PORT=2525 EMAIL_USE_SSL=false.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, NOOP, RSET, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.connect_latency)
+        self.reply('220 tenantvolt-sink ESMTP ready')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                self.wfile.write(b'250-tenantvolt-sink\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n')
+            elif verb == 'HELO':
+                self.reply('250 tenantvolt-sink')
+            elif verb == 'AUTH':
+                # smtplib sends AUTH PLAIN with the credentials inline; prompt for them otherwise
+                if len(command.split()) == 2:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                time.sleep(server.auth_latency)
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                server.count_message()
+                self.reply('250 2.0.0 Ok: queued')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 2.0.0 Ok')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('502 5.5.2 Command not recognized')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, connect_latency=0.0, auth_latency=0.0):
+        super().__init__(address, SMTPSinkHandler)
+        self.connect_latency = connect_latency
+        self.auth_latency = auth_latency
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def count_message(self):
+        with self._lock:
+            self.messages += 1
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--connect-latency', type=float, default=0.0,
+                        help='seconds added to each new session, standing in for the TLS handshake')
+    parser.add_argument('--auth-latency', type=float, default=0.0,
+                        help='seconds added to each AUTH command')
+    args = parser.parse_args()
+
+    sink = SMTPSink((args.host, args.port), args.connect_latency, args.auth_latency)
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{sink.messages} messages received")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import queue
+
+from django.test import SimpleTestCase
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from google.rpc import code_pb2
+
+from TenantVoltAPI.metrics import InstrumentedFirestore, instrument_firestore
+from benchmarks.memory_firestore import MemoryClient, MemoryStore
+from orders.order_updates import _commit_bulk
+
+
+class MemoryFirestoreTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.owners = self.db.collection('house_owners')
+
+    def test_create_fails_for_an_existing_document(self):
+        self.owners.document('a').create({'n': 1})
+        with self.assertRaises(AlreadyExists):
+            self.owners.document('a').create({'n': 2})
+        self.assertEqual(self.owners.document('a').get().to_dict(), {'n': 1})
+
+    def test_update_checks_its_precondition(self):
+        ref = self.owners.document('a')
+        ref.set({'n': 1})
+        stale = ref.get().update_time
+        ref.update({'n': 2})
+        with self.assertRaises(FailedPrecondition):
+            ref.update({'n': 3}, option=self.db.write_option(last_update_time=stale))
+        self.assertEqual(ref.get().get('n'), 2)
+
+    def test_query_filters_orders_and_pages(self):
+        for i in range(5):
+            self.owners.document(f'o{i}').set({'n': i, 'status': 'pending' if i % 2 else 'completed'})
+        query = self.owners.where('status', '==', 'pending').order_by('n', direction='DESCENDING').limit(1)
+        first = list(query.stream())
+        rest = list(query.start_after(first[-1]).stream())
+        self.assertEqual([doc.id for doc in first + rest], ['o3', 'o1'])
+        self.assertEqual(self.owners.count().get()[0][0].value, 5)
+
+    def test_batch_is_atomic(self):
+        self.owners.document('a').set({'n': 1})
+        batch = self.db.batch()
+        batch.set(self.owners.document('b'), {'n': 2})
+        batch.create(self.owners.document('a'), {'n': 3})
+        with self.assertRaises(AlreadyExists):
+            batch.commit()
+        self.assertFalse(self.owners.document('b').get().exists)
+
+    def test_bulk_writes_fail_one_by_one(self):
+        db = instrument_firestore(self.db)
+        self.assertIsInstance(db, InstrumentedFirestore)
+        statuses = _commit_bulk(db, [
+            ('a', 'update', db.collection('house_owners').document('a'), {'n': 3}),
+            ('b', 'set', db.collection('house_owners').document('b'), {'n': 4}),
+        ])
+        self.assertEqual([code for code, _, _ in statuses], [code_pb2.NOT_FOUND, code_pb2.OK])
+        self.assertFalse(self.owners.document('a').get().exists)
+        self.assertEqual(self.owners.document('b').get().get('n'), 4)
+
+    def test_listener_receives_the_initial_snapshot_and_changes(self):
+        self.owners.document('a').set({'n': 1})
+        events = queue.SimpleQueue()
+        watch = self.owners.on_snapshot(
+            lambda docs, changes, read_time: events.put([(change.type.name, change.document.id) for change in changes]))
+        try:
+            self.assertEqual(events.get(timeout=1), [('ADDED', 'a')])
+            self.owners.document('a').delete()
+            self.assertEqual(events.get(timeout=1), [('REMOVED', 'a')])
+        finally:
+            watch.unsubscribe()
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from django.core.management.base import BaseCommand
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from bills.notifications import FIRESTORE_BATCH_LIMIT, POINTER_WRITE_ATTEMPTS, move_latest_pointers
+
+
+class Command(BaseCommand):
+    help = ('Build the latest_bills pointer documents from the existing bills collection. '
+            'Pointers only move forward, so it is safe to run while bills are being sent.')
+
+    def handle(self, *args, **options):
+        _, firestore_db = initialize_firebase()
+
+        # Keep the newest bill per product: highest month, then latest notification.
+        # Pointers are keyed by the product_id string, whichever type the bill stored
+        latest = {}
+        scanned = 0
+        for snapshot in firestore_db.collection('bills').stream():
+            scanned += 1
+            bill = snapshot.to_dict()
+            product_id = bill.get('product_id')
+            # Skip malformed records and claims whose email was never sent
+            if not product_id or not bill.get('month') or not bill.get('notification_sent'):
+                continue
+            product_id = str(product_id)
+            key = (bill['month'], bill.get('notification_date', ''))
+            if product_id not in latest or key > latest[product_id][0]:
+                latest[product_id] = (key, bill)
+
+        items = [(product_id, self._pointer(bill)) for product_id, (_, bill) in latest.items()]
+        written = failed = 0
+        for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            chunk = dict(items[start:start + FIRESTORE_BATCH_LIMIT])
+            for _ in range(POINTER_WRITE_ATTEMPTS):
+                batch = firestore_db.batch()
+                moved = move_latest_pointers(firestore_db, batch, chunk)
+                try:
+                    if moved:
+                        batch.commit()
+                except (AlreadyExists, FailedPrecondition):
+                    # A bill was sent for one of these products after its pointer was read
+                    continue
+                written += moved
+                break
+            else:
+                failed += len(chunk)
+                self.stderr.write(f"Gave up on {len(chunk)} pointers that kept changing; re-run the command")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} bills, wrote {written} latest_bills pointers, "
+            f"left {len(items) - written - failed} that were already current"))
+
+    @classmethod
+    def _pointer(cls, bill):
+        return {
+            'month': bill['month'],
+            'amount': bill.get('amount'),
+            'kw_value': bill.get('kw_value'),
+            'status': bill.get('status', 'not_paid'),
+            'payment_date': bill.get('payment_date'),
+            'calculated_at': cls._calculated_at(bill.get('notification_date')),
+        }
+
+    @staticmethod
+    def _calculated_at(notification_date):
+        """bills store notification_date as a UTC 'YYYY-MM-DD HH:MM:SS' string"""
+        if not notification_date:
+            return None
+        sent = datetime.strptime(notification_date, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        return sent.astimezone(ZoneInfo("Asia/Colombo")).isoformat()
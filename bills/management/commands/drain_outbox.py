@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bills.outbox import claim_due_jobs, deliver_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Send queued bill notifications from the local outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Jobs claimed and sent per batch (max 500)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the outbox has no due jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the currently due jobs and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, min(options['batch_size'], 500))
+        poll_interval = options['poll_interval']
+
+        self.stdout.write(f"Draining bill notification outbox (batch size {batch_size})")
+        total_sent = total_failed = 0
+
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale jobs")
+
+            jobs = claim_due_jobs(batch_size)
+            if jobs:
+                sent, failed = deliver_jobs(jobs)
+                total_sent += sent
+                total_failed += failed
+                self.stdout.write(f"Batch of {len(jobs)}: {sent} sent, {failed} failed")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(poll_interval)
+
+        self.stdout.write(self.style.SUCCESS(f"Outbox drained: {total_sent} sent, {total_failed} failed"))
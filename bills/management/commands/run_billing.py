@@ -0,0 +1,222 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_directory import iter_all_tenants
+from bills.notifications import (
+    validate_bill, price_bills, send_bill_email, record_bills, claim_bill, mark_bill_sent,
+    release_bill_claim, BILL_ALREADY_SENT, BILL_IN_PROGRESS, BILL_UNCONFIRMED, BILL_UNCONFIRMED_MESSAGE,
+)
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines log of a billing run.
+
+    A product is logged as `sent` as soon as its email goes out and as `recorded`
+    once its bill documents are committed, so a resumed run neither re-sends
+    emails nor loses the Firestore records of emails that were already sent.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sent = set()
+        self.recorded = set()
+        self._lock = threading.Lock()
+
+        line = '\n'
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash; its product is simply redone
+                        continue
+                    getattr(self, entry['event']).add(entry['product_id'])
+
+        self._file = open(path, 'a')
+        if not line.endswith('\n'):
+            self._file.write('\n')
+
+    def log(self, event, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                self._file.write(json.dumps({'event': event, 'product_id': product_id}) + '\n')
+                getattr(self, event).add(product_id)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Command(BaseCommand):
+    help = 'Price and send the monthly bills of every tenant with a product_id, resumable from a checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', required=True, help='Billing month, YYYY-MM')
+        parser.add_argument('--usage', required=True,
+                            help='CSV file with product_id,kw_value columns holding the month\'s meter readings')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent delivery threads')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Bills handled per task: one SMTP connection and one batched record write')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: billing-<month>.checkpoint.jsonl in BASE_DIR)')
+
+    def handle(self, *args, **options):
+        month = options['month']
+        try:
+            datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise CommandError('Invalid month format. Expected YYYY-MM')
+
+        checkpoint_path = options['checkpoint'] or os.path.join(settings.BASE_DIR, f'billing-{month}.checkpoint.jsonl')
+        checkpoint = Checkpoint(checkpoint_path)
+        usage = self._load_usage(options['usage'])
+
+        _, firestore_db = initialize_firebase()
+
+        # One pass over the tenants collection to enumerate every billable tenant
+        tenants = {}
+        for tenant in iter_all_tenants(firestore_db):
+            tenants.setdefault(tenant.product_id, tenant)
+
+        work = []
+        missing_usage = 0
+        for product_id, tenant in tenants.items():
+            if product_id in checkpoint.recorded:
+                continue
+            if product_id not in usage:
+                missing_usage += 1
+                continue
+            bill, error = validate_bill({'product_id': product_id, 'month': month, 'kw_value': usage[product_id]})
+            if error:
+                self.stderr.write(f"Skipping {product_id}: {error}")
+                continue
+            work.append((tenant, bill))
+
+        # Price the whole portfolio in one vectorized call
+        price_bills([bill for _, bill in work])
+
+        already_done = len(checkpoint.recorded & tenants.keys())
+        self.stdout.write(
+            f"Billing {month}: {len(tenants)} tenants, {already_done} already done, "
+            f"{missing_usage} without a reading, {len(work)} to process")
+
+        chunk_size = max(1, options['chunk_size'])
+        chunks = [work[start:start + chunk_size] for start in range(0, len(work), chunk_size)]
+        latencies = []
+        failures = []
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = [executor.submit(self._process_chunk, firestore_db, checkpoint, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                chunk_latencies, chunk_failures = future.result()
+                latencies.extend(chunk_latencies)
+                failures.extend(chunk_failures)
+
+        elapsed = time.perf_counter() - started
+        checkpoint.close()
+
+        for product_id, error in failures:
+            self.stderr.write(f"Failed {product_id}: {error}")
+        self._report(len(work), failures, latencies, elapsed, checkpoint_path)
+
+    def _load_usage(self, path):
+        usage = {}
+        try:
+            with open(path, newline='') as usage_file:
+                for row in csv.DictReader(usage_file):
+                    try:
+                        usage[row['product_id'].strip()] = float(row['kw_value'])
+                    except (KeyError, TypeError, ValueError):
+                        raise CommandError(f'Invalid usage row: {row}')
+        except OSError as e:
+            raise CommandError(f'Cannot read usage file: {e}')
+        return usage
+
+    def _process_chunk(self, firestore_db, checkpoint, chunk):
+        """Send a chunk's emails over one pooled connection, then record them in one batched write"""
+        latencies = []
+        failures = []
+        sent = []
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            return latencies, [(bill['product_id'], f'SMTP connection failed: {str(e)}') for _, bill in chunk]
+
+        try:
+            for tenant, bill in chunk:
+                # Sent by an interrupted run but never recorded: only the record is missing
+                if bill['product_id'] in checkpoint.sent:
+                    sent.append((tenant, bill))
+                    continue
+
+                send_started = time.perf_counter()
+                try:
+                    claim = claim_bill(firestore_db, tenant, bill)
+                except Exception as e:
+                    failures.append((bill['product_id'], f'Bill claim failed: {str(e)}'))
+                    continue
+                if claim == BILL_ALREADY_SENT:
+                    # Sent outside this run (e.g. through the API); just mark it done
+                    checkpoint.log('recorded', [bill['product_id']])
+                    continue
+                if claim == BILL_IN_PROGRESS:
+                    failures.append((bill['product_id'], 'This bill is already being sent'))
+                    continue
+                if claim == BILL_UNCONFIRMED:
+                    failures.append((bill['product_id'], BILL_UNCONFIRMED_MESSAGE))
+                    continue
+
+                try:
+                    if not send_bill_email(tenant, bill, connection=connection):
+                        raise RuntimeError('Failed to send email notification')
+                except Exception as e:
+                    release_bill_claim(firestore_db, bill)
+                    failures.append((bill['product_id'], str(e)))
+                    continue
+                mark_bill_sent(firestore_db, tenant, bill)
+                latencies.append(time.perf_counter() - send_started)
+                checkpoint.log('sent', [bill['product_id']])
+                sent.append((tenant, bill))
+        finally:
+            connection.close()
+
+        errors = record_bills(firestore_db, sent)
+        recorded = []
+        for (tenant, bill), error in zip(sent, errors):
+            if error is None:
+                recorded.append(bill['product_id'])
+            else:
+                failures.append((bill['product_id'], f'Bill record write failed: {str(error)}'))
+        checkpoint.log('recorded', recorded)
+
+        return latencies, failures
+
+    def _report(self, total, failures, latencies, elapsed, checkpoint_path):
+        succeeded = total - len(failures)
+        self.stdout.write(f"Processed {total} bills in {elapsed:.2f}s: {succeeded} completed, {len(failures)} failed")
+        if elapsed > 0:
+            self.stdout.write(f"Throughput: {succeeded / elapsed:.1f} bills/s")
+        if latencies:
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+            self.stdout.write(
+                f"Send latency: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+        if failures:
+            self.stdout.write(self.style.WARNING(f"Re-run the same command to retry; progress is in {checkpoint_path}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Billing run complete; checkpoint {checkpoint_path}"))
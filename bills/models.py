@@ -0,0 +1,58 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class NotificationJob(models.Model):
+    """
+    A bill notification waiting in the local outbox.
+
+    send_bill_notification stores the validated payload here and returns at once;
+    the drain_outbox management command sends the email, writes the Firestore
+    bill record and tracks retries.
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product_id = models.CharField(max_length=64)
+    month = models.CharField(max_length=7)
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    tenant_email = models.CharField(max_length=254, blank=True, default='')
+    notified_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='bills_job_due_idx'),
+        ]
+
+    def to_dict(self):
+        return {
+            'job_id': str(self.id),
+            'status': self.status,
+            'product_id': self.product_id,
+            'month': self.month,
+            'attempts': self.attempts,
+            'last_error': self.last_error or None,
+            'tenant_email': self.tenant_email or None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+        }
@@ -0,0 +1,323 @@
+from django.core.mail import send_mail
+from django.conf import settings
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+import logging
+import math
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from bills.tariff import get_tariff
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REQUIRED_BILL_FIELDS = ['product_id', 'month', 'kw_value']
+
+# Firestore rejects batched writes with more than 500 operations
+FIRESTORE_BATCH_LIMIT = 500
+
+# Commits of a record_bills chunk whose latest_bills pointers another writer moved in between
+POINTER_WRITE_ATTEMPTS = 3
+
+# An unsent claim older than this belongs to a sender that stopped before it could record the send
+BILL_CLAIM_LEASE = timedelta(minutes=10)
+
+# claim_bill outcomes
+BILL_CLAIMED = 'claimed'
+BILL_ALREADY_SENT = 'already_sent'
+BILL_IN_PROGRESS = 'in_progress'
+BILL_UNCONFIRMED = 'unconfirmed'
+
+BILL_UNCONFIRMED_MESSAGE = ('An earlier send of this bill was interrupted and may have been delivered; '
+                            'delete its bills record to send it again')
+
+
+def _is_non_negative_number(value):
+    # json.loads accepts NaN and Infinity, which compare False with everything
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value) and value >= 0)
+
+
+def validate_bill(data):
+    """
+    Validate a bill notification payload.
+
+    amount is optional; bills without one are priced from kw_value by price_bills.
+
+    Returns: (bill, error_message) where bill holds the payload fields plus
+    formatted_month (e.g. "February 2025")
+    """
+    if not isinstance(data, dict):
+        return None, 'Bill must be a JSON object'
+
+    # Validate required fields
+    for field in REQUIRED_BILL_FIELDS:
+        if field not in data:
+            return None, f'Missing required field: {field}'
+
+    # Tenants are indexed by product_id, so it has to be a value they can be looked up by
+    if not isinstance(data['product_id'], (str, int)) or isinstance(data['product_id'], bool):
+        return None, 'product_id must be a string or an integer'
+
+    # Format month for display (convert YYYY-MM to Month YYYY)
+    try:
+        month_date = datetime.strptime(data.get('month'), "%Y-%m")
+    except (TypeError, ValueError):
+        return None, 'Invalid month format. Expected YYYY-MM'
+
+    amount = data.get('amount')
+    kw_value = data.get('kw_value')
+    if not _is_non_negative_number(kw_value):
+        return None, 'kw_value must be a finite, non-negative number'
+    if amount is not None and not _is_non_negative_number(amount):
+        return None, 'amount must be a finite, non-negative number'
+
+    return {
+        'product_id': data.get('product_id'),
+        'month': data.get('month'),
+        'formatted_month': month_date.strftime("%B %Y"),
+        'amount': amount,
+        'kw_value': kw_value,
+    }, None
+
+
+def price_bills(bills):
+    """Fill in `amount` for validated bills sent without one, pricing them all in one vectorized call"""
+    unpriced = [bill for bill in bills if bill['amount'] is None]
+    if unpriced:
+        amounts = get_tariff().price([bill['kw_value'] for bill in unpriced])
+        for bill, amount in zip(unpriced, amounts.tolist()):
+            bill['amount'] = amount
+    return bills
+
+
+def render_bill_email(tenant, bill):
+    """Build the (subject, body) of the bill notification email for a TenantEntry"""
+    subject = f"Electricity Bill Notification - {bill['formatted_month']}"
+
+    email_body = f"""
+Hello {tenant.name},
+
+ELECTRICITY BILL NOTIFICATION
+
+This is to inform you that your electricity bill for {bill['formatted_month']} is now available:
+
+Property: {tenant.address}
+Total Usage: {bill['kw_value']} kWh
+Amount Due: ${bill['amount']:.2f}
+
+Please make your payment at your earliest convenience to avoid any service interruption.
+
+If you have any questions about this bill, please contact your property manager.
+
+Best Regards,
+{tenant.owner_name}
+TenantVolt System
+    """.strip()
+
+    return subject, email_body
+
+
+def send_bill_email(tenant, bill, connection=None):
+    """Send the bill notification email, returning the number of messages sent"""
+    subject, email_body = render_bill_email(tenant, bill)
+
+    # Send email using Django's email functionality
+    return send_mail(
+        subject=subject,
+        message=email_body,
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[tenant.email],
+        fail_silently=False,
+        connection=connection,
+    )
+
+
+def bill_id(product_id, month):
+    """Deterministic `bills` document ID: one document per product per month"""
+    return quote(f"{product_id}_{month}", safe='')
+
+
+async def aget_bill(async_db, product_id, month):
+    """Point read of a product's bill for a month with a Firestore AsyncClient, or None"""
+    snapshot = await async_db.collection('bills').document(bill_id(product_id, month)).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def claim_bill(firestore_db, tenant, bill):
+    """
+    Reserve the right to send a bill before touching SMTP.
+
+    The claim is an atomic create-if-absent of bills/{product_id}_{month}, so
+    re-sends, retries and concurrent senders of the same bill collapse into one
+    email. A claim is only ever given up by its own sender: release_bill_claim
+    deletes it when the email could not be sent, and mark_bill_sent marks it
+    sent as soon as the email went out. A claim still unsent after
+    BILL_CLAIM_LEASE belongs to a sender that stopped in between, so nobody
+    knows whether its email was delivered; it is never taken over.
+
+    Returns BILL_CLAIMED, BILL_ALREADY_SENT, BILL_IN_PROGRESS or BILL_UNCONFIRMED.
+    """
+    ref = firestore_db.collection('bills').document(bill_id(bill['product_id'], bill['month']))
+    now = datetime.now(timezone.utc)
+    claim = {**bill_record(tenant, bill), 'notification_sent': False, 'notification_date': None, 'claimed_at': now}
+
+    try:
+        ref.create(claim)
+        return BILL_CLAIMED
+    except AlreadyExists:
+        pass
+
+    snapshot = ref.get()
+    if not snapshot.exists:
+        # The other claim was released in between; the caller can retry later
+        return BILL_IN_PROGRESS
+
+    existing = snapshot.to_dict()
+    if existing.get('notification_sent'):
+        return BILL_ALREADY_SENT
+
+    claimed_at = existing.get('claimed_at')
+    if claimed_at is not None and now - claimed_at < BILL_CLAIM_LEASE:
+        return BILL_IN_PROGRESS
+
+    return BILL_UNCONFIRMED
+
+
+def mark_bill_sent(firestore_db, tenant, bill):
+    """
+    Mark a claimed bill as sent right after its email went out, before anything else can fail
+
+    record_bills writes the same record again, so a failed mark is retried
+    there. Returns None or the write error.
+    """
+    ref = firestore_db.collection('bills').document(bill_id(bill['product_id'], bill['month']))
+    try:
+        ref.set(bill_record(tenant, bill))
+    except Exception as e:
+        logger.error(f"Error marking bill {ref.id} as sent: {str(e)}")
+        return e
+    return None
+
+
+def release_bill_claim(firestore_db, bill):
+    """Drop a claim whose email could not be sent so a retry can claim it again"""
+    ref = firestore_db.collection('bills').document(bill_id(bill['product_id'], bill['month']))
+    try:
+        ref.delete()
+    except Exception as e:
+        # Left in place, the claim turns unconfirmed after BILL_CLAIM_LEASE and needs deleting by hand
+        logger.error(f"Error releasing bill claim {ref.id}: {str(e)}")
+
+
+def bill_record(tenant, bill):
+    """Firestore `bills` document for a bill whose notification was sent"""
+    return {
+        'product_id': bill['product_id'],
+        'tenant_email': tenant.email,
+        'month': bill['month'],
+        'amount': bill['amount'],
+        'kw_value': bill['kw_value'],
+        'notification_sent': True,
+        'notification_date': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def latest_bill_pointer(bill):
+    """`latest_bills/{product_id}` document, in the bill_details shape /bill/latest/ returns"""
+    return {
+        'month': bill['month'],
+        'amount': bill['amount'],
+        'kw_value': bill['kw_value'],
+        'status': 'not_paid',
+        'payment_date': None,
+        'calculated_at': datetime.now(ZoneInfo("Asia/Colombo")).isoformat(),
+    }
+
+
+def record_bills(firestore_db, sent_bills):
+    """
+    Write the `bills` records of sent notifications, and move each product's
+    `latest_bills` pointer to the new bill, using batched commits. The records
+    were marked sent by mark_bill_sent already; writing them again retries
+    any of those marks that failed.
+
+    A pointer only ever moves forward: the current pointers of a chunk are
+    read first, and a bill no newer than its product's pointer leaves it
+    alone. The pointer writes are preconditioned on what was read, so a
+    concurrent writer makes the commit fail and the chunk is read and
+    written again.
+
+    sent_bills: list of (tenant, bill) pairs
+    Returns: list aligned with sent_bills holding None or the commit error
+    """
+    errors = [None] * len(sent_bills)
+
+    # Every bill costs at most two writes: the record and the pointer
+    per_batch = FIRESTORE_BATCH_LIMIT // 2
+    for start in range(0, len(sent_bills), per_batch):
+        chunk = sent_bills[start:start + per_batch]
+        error = None
+        for _ in range(POINTER_WRITE_ATTEMPTS):
+            try:
+                _record_chunk(firestore_db, chunk)
+                error = None
+                break
+            except (AlreadyExists, FailedPrecondition) as e:
+                # Another writer moved one of the pointers after it was read
+                error = e
+            except Exception as e:
+                error = e
+                break
+        if error is not None:
+            logger.error(f"Error recording {len(chunk)} sent bills: {str(error)}")
+            errors[start:start + len(chunk)] = [error] * len(chunk)
+
+    return errors
+
+
+def _record_chunk(firestore_db, chunk):
+    bills_collection = firestore_db.collection('bills')
+
+    # The newest bill of each product in the chunk is the pointer candidate
+    newest = {}
+    for _, bill in chunk:
+        product_id = str(bill['product_id'])
+        if product_id not in newest or bill['month'] > newest[product_id]['month']:
+            newest[product_id] = bill
+
+    batch = firestore_db.batch()
+    for tenant, bill in chunk:
+        batch.set(bills_collection.document(bill_id(bill['product_id'], bill['month'])), bill_record(tenant, bill))
+    move_latest_pointers(firestore_db, batch, {
+        product_id: latest_bill_pointer(bill) for product_id, bill in newest.items()
+    })
+    batch.commit()
+
+
+def move_latest_pointers(firestore_db, batch, pointers):
+    """
+    Add the writes that move latest_bills pointers forward to batch; return how many were added
+
+    pointers maps product_id strings to pointer documents. The current
+    pointers are read first, and only a newer month replaces one. The writes
+    are preconditioned on what was read, so committing the batch raises
+    AlreadyExists or FailedPrecondition if another writer got there first.
+    """
+    latest_bills_collection = firestore_db.collection('latest_bills')
+    refs = [latest_bills_collection.document(product_id) for product_id in pointers]
+    current = {snapshot.id: snapshot for snapshot in firestore_db.get_all(refs, field_paths=['month'])}
+
+    moved = 0
+    for ref in refs:
+        pointer = pointers[ref.id]
+        snapshot = current.get(ref.id)
+        if snapshot is None or not snapshot.exists:
+            batch.create(ref, pointer)
+        elif (snapshot.to_dict() or {}).get('month', '') < pointer['month']:
+            batch.update(ref, pointer, option=firestore_db.write_option(last_update_time=snapshot.update_time))
+        else:
+            continue
+        moved += 1
+    return moved
@@ -0,0 +1,202 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_directory import get_tenant_directory
+from bills.models import NotificationJob
+from bills.notifications import (
+    validate_bill, send_bill_email, record_bills, claim_bill, mark_bill_sent,
+    release_bill_claim, BILL_ALREADY_SENT, BILL_IN_PROGRESS, BILL_UNCONFIRMED, BILL_UNCONFIRMED_MESSAGE,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+# A job left in `sending` this long belonged to a worker that died mid-batch
+SENDING_LEASE = timedelta(minutes=10)
+
+
+def enqueue_bill(bill):
+    """
+    Store a validated bill in the outbox.
+
+    Returns: (job, created); a bill that is already queued or sending returns
+    its existing job instead of queuing a second one
+    """
+    pending = NotificationJob.objects.filter(
+        product_id=bill['product_id'],
+        month=bill['month'],
+        status__in=[NotificationJob.STATUS_QUEUED, NotificationJob.STATUS_SENDING],
+    ).first()
+    if pending is not None:
+        return pending, False
+
+    return NotificationJob.objects.create(
+        product_id=bill['product_id'],
+        month=bill['month'],
+        payload={field: bill[field] for field in ('product_id', 'month', 'amount', 'kw_value')},
+    ), True
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts"""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def requeue_stale_jobs():
+    """Hand jobs abandoned in `sending` by a crashed worker back to the queue"""
+    return NotificationJob.objects.filter(
+        status=NotificationJob.STATUS_SENDING,
+        updated_at__lt=timezone.now() - SENDING_LEASE,
+    ).update(status=NotificationJob.STATUS_QUEUED, updated_at=timezone.now())
+
+
+def claim_due_jobs(batch_size):
+    """
+    Claim up to batch_size due jobs for this worker.
+
+    Each job is claimed with a conditional UPDATE, so several drain_outbox
+    processes can share the outbox without sending a job twice.
+    """
+    now = timezone.now()
+    candidate_ids = list(
+        NotificationJob.objects.filter(status=NotificationJob.STATUS_QUEUED, next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('id', flat=True)[:batch_size]
+    )
+
+    claimed_ids = [
+        job_id for job_id in candidate_ids
+        if NotificationJob.objects.filter(id=job_id, status=NotificationJob.STATUS_QUEUED).update(
+            status=NotificationJob.STATUS_SENDING, attempts=F('attempts') + 1, updated_at=now)
+    ]
+    return list(NotificationJob.objects.filter(id__in=claimed_ids).order_by('next_attempt_at'))
+
+
+def _fail(job, error):
+    """Schedule a retry, or give up once the job has used all its attempts"""
+    job.last_error = error
+    if job.attempts >= MAX_ATTEMPTS:
+        job.status = NotificationJob.STATUS_FAILED
+        logger.error(f"Bill notification job {job.id} failed permanently: {error}")
+    else:
+        job.status = NotificationJob.STATUS_QUEUED
+        job.next_attempt_at = timezone.now() + backoff_delay(job.attempts)
+        logger.warning(f"Bill notification job {job.id} attempt {job.attempts} failed, retrying: {error}")
+    job.save()
+
+
+def deliver_jobs(jobs):
+    """
+    Send the emails for claimed jobs over one pooled SMTP connection and record
+    the sent bills in Firestore with batched writes.
+
+    Returns: (sent_count, failed_count)
+    """
+    if not jobs:
+        return 0, 0
+
+    _, firestore_db = initialize_firebase()
+    directory = get_tenant_directory()
+
+    notified = []
+    already_sent = []
+    failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for job in jobs:
+            _fail(job, f'SMTP connection failed: {str(e)}')
+        return 0, len(jobs)
+
+    try:
+        for job in jobs:
+            # The payload was validated on enqueue; this re-derives formatted_month. Its
+            # product_id is the one the request sent, which job.product_id only holds as a string
+            bill, _ = validate_bill(job.payload)
+            tenant = directory.lookup(bill['product_id'])
+            if tenant is None:
+                # Not retryable: the tenant was removed after the job was queued
+                job.attempts = MAX_ATTEMPTS
+                _fail(job, f"No tenant found with product_id: {bill['product_id']}")
+                failed += 1
+                continue
+
+            # A job whose email went out but whose bill record failed only retries the record
+            if job.notified_at is None:
+                try:
+                    claim = claim_bill(firestore_db, tenant, bill)
+                except Exception as e:
+                    _fail(job, f'Bill claim failed: {str(e)}')
+                    failed += 1
+                    continue
+
+                if claim == BILL_ALREADY_SENT:
+                    already_sent.append(job)
+                    continue
+                if claim == BILL_IN_PROGRESS:
+                    _fail(job, 'This bill is already being sent')
+                    failed += 1
+                    continue
+                if claim == BILL_UNCONFIRMED:
+                    # Not retryable: resending could deliver the bill twice
+                    job.attempts = MAX_ATTEMPTS
+                    _fail(job, BILL_UNCONFIRMED_MESSAGE)
+                    failed += 1
+                    continue
+
+                try:
+                    if not send_bill_email(tenant, bill, connection=connection):
+                        raise RuntimeError('Failed to send email notification')
+                except Exception as e:
+                    release_bill_claim(firestore_db, bill)
+                    _fail(job, str(e))
+                    failed += 1
+                    continue
+                mark_bill_sent(firestore_db, tenant, bill)
+                job.notified_at = timezone.now()
+                job.tenant_email = tenant.email
+                job.save(update_fields=['notified_at', 'tenant_email', 'updated_at'])
+
+            notified.append((job, tenant, bill))
+    finally:
+        connection.close()
+
+    # Sent by an earlier job or run: nothing left to do for these
+    if already_sent:
+        now = timezone.now()
+        NotificationJob.objects.filter(id__in=[job.id for job in already_sent]).update(
+            status=NotificationJob.STATUS_SENT, sent_at=now, last_error='Bill was already sent', updated_at=now)
+        logger.info(f"Skipped {len(already_sent)} bill notification jobs that were already sent")
+
+    if not notified:
+        return 0, failed
+
+    errors = record_bills(firestore_db, [(tenant, bill) for _, tenant, bill in notified])
+    recorded = []
+    for (job, tenant, bill), error in zip(notified, errors):
+        if error is None:
+            recorded.append((job, tenant, bill))
+        else:
+            _fail(job, f'Bill record write failed: {str(error)}')
+
+    now = timezone.now()
+    NotificationJob.objects.filter(id__in=[job.id for job, _, _ in recorded]).update(
+        status=NotificationJob.STATUS_SENT, sent_at=now, last_error='', updated_at=now)
+    for _, tenant, bill in recorded:
+        logger.info(f"Bill notification email sent to {tenant.email} for product_id {bill['product_id']}")
+
+    return len(recorded), failed + len(notified) - len(recorded)
+
@@ -0,0 +1,84 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+
+class Tariff:
+    """
+    A tiered electricity tariff that prices whole arrays of kWh readings at once.
+
+    Definition format (see settings.BILLING_TARIFF):
+    {
+        "blocks": [
+            {"up_to": 30, "rate": 4.00, "fixed_charge": 75.00},
+            {"up_to": None, "rate": 52.00, "fixed_charge": 2000.00}  # None = no upper bound
+        ],
+        "fixed_charges": [{"name": "Meter rent", "amount": 50.00}],
+        "taxes": [{"name": "SSCL", "rate": 0.025}]
+    }
+
+    Each kWh is charged at the rate of the block it falls in. The block holding a
+    reading's total usage decides its fixed charge. The tariff-wide fixed_charges
+    are added to every bill, and the taxes apply to that subtotal.
+    """
+
+    def __init__(self, blocks, fixed_charges=(), taxes=()):
+        if not blocks:
+            raise ValueError('A tariff needs at least one block')
+
+        upper = [math.inf if block.get('up_to') is None else float(block['up_to']) for block in blocks]
+        if any(high <= low for low, high in zip([0.0] + upper, upper)) or not math.isinf(upper[-1]):
+            raise ValueError('Tariff blocks must have increasing up_to values and end with an unbounded block')
+
+        self.upper = np.array(upper)
+        self.lower = np.concatenate(([0.0], self.upper[:-1]))
+        self.widths = self.upper - self.lower
+        self.rates = np.array([float(block['rate']) for block in blocks])
+        self.block_fixed_charges = np.array([float(block.get('fixed_charge', 0)) for block in blocks])
+        self.fixed_charge = sum(float(charge['amount']) for charge in fixed_charges)
+        self.tax_rate = sum(float(tax['rate']) for tax in taxes)
+
+    @classmethod
+    def from_dict(cls, definition):
+        return cls(
+            blocks=definition['blocks'],
+            fixed_charges=definition.get('fixed_charges', ()),
+            taxes=definition.get('taxes', ()),
+        )
+
+    def breakdown(self, kw_values):
+        """Return {'energy', 'fixed', 'tax', 'amount'} arrays for an array of kWh readings"""
+        kwh = np.asarray(kw_values, dtype=np.float64)
+        if kwh.ndim != 1:
+            kwh = kwh.reshape(-1)
+        if not np.isfinite(kwh).all() or (kwh < 0).any():
+            raise ValueError('kw_value must be a finite, non-negative number')
+
+        # kWh falling in each block, one row per reading: shape (readings, blocks)
+        block_units = np.clip(kwh[:, None] - self.lower, 0.0, self.widths)
+        energy = block_units @ self.rates
+
+        # Index of the block holding each reading's total usage (block upper bounds are inclusive)
+        top_block = np.searchsorted(self.upper, kwh, side='left')
+        fixed = self.block_fixed_charges[top_block] + self.fixed_charge
+
+        subtotal = energy + fixed
+        tax = subtotal * self.tax_rate
+        return {
+            'energy': energy,
+            'fixed': fixed,
+            'tax': tax,
+            'amount': np.round(subtotal + tax, 2),
+        }
+
+    def price(self, kw_values):
+        """Return the bill amount for every kWh reading, rounded to cents"""
+        return self.breakdown(kw_values)['amount']
+
+
+@lru_cache(maxsize=1)
+def get_tariff():
+    """The tariff configured in settings.BILLING_TARIFF"""
+    return Tariff.from_dict(settings.BILLING_TARIFF)
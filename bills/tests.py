@@ -0,0 +1,336 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+
+from TenantVoltAPI import tenant_directory
+from TenantVoltAPI.tenant_directory import TenantDirectory, TenantEntry
+from benchmarks.memory_firestore import MemoryClient, MemoryQuery, MemoryStore
+from bills.notifications import (
+    claim_bill, mark_bill_sent, release_bill_claim, record_bills, bill_id, validate_bill, BILL_CLAIM_LEASE,
+    BILL_CLAIMED, BILL_ALREADY_SENT, BILL_IN_PROGRESS, BILL_UNCONFIRMED,
+)
+from bills.models import NotificationJob
+from bills.outbox import (
+    MAX_ATTEMPTS, SENDING_LEASE, _fail, backoff_delay, claim_due_jobs, deliver_jobs, enqueue_bill, requeue_stale_jobs,
+)
+from bills.views import _deliver_bill
+
+
+class BillClaimTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.tenant = TenantEntry('P1', 'tenant@example.com', 'Tenant', '1 Main St', 'owner-uid', 'Owner Name')
+        self.bill, _ = validate_bill({'product_id': 'P1', 'month': '2025-02', 'kw_value': 120, 'amount': 30.5})
+        self.ref = self.db.collection('bills').document(bill_id('P1', '2025-02'))
+
+    def expire_claim(self):
+        claim = self.ref.get().to_dict()
+        self.ref.set({**claim, 'claimed_at': datetime.now(timezone.utc) - BILL_CLAIM_LEASE * 2})
+
+    def test_claim_creates_an_unsent_record(self):
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_CLAIMED)
+        claim = self.ref.get().to_dict()
+        self.assertFalse(claim['notification_sent'])
+        self.assertEqual(claim['tenant_email'], 'tenant@example.com')
+
+    def test_second_claim_is_in_progress(self):
+        claim_bill(self.db, self.tenant, self.bill)
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_IN_PROGRESS)
+
+    def test_released_claim_can_be_claimed_again(self):
+        claim_bill(self.db, self.tenant, self.bill)
+        release_bill_claim(self.db, self.bill)
+        self.assertFalse(self.ref.get().exists)
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_CLAIMED)
+
+    def test_marked_claim_is_already_sent(self):
+        claim_bill(self.db, self.tenant, self.bill)
+        self.assertIsNone(mark_bill_sent(self.db, self.tenant, self.bill))
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_ALREADY_SENT)
+
+    def test_expired_marked_claim_is_not_taken_over(self):
+        # The email went out and was marked, but the batched record write failed
+        claim_bill(self.db, self.tenant, self.bill)
+        mark_bill_sent(self.db, self.tenant, self.bill)
+        self.expire_claim()
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_ALREADY_SENT)
+
+    def test_expired_unsent_claim_is_unconfirmed(self):
+        claim_bill(self.db, self.tenant, self.bill)
+        self.expire_claim()
+        claimed_at = self.ref.get().to_dict()['claimed_at']
+        self.assertEqual(claim_bill(self.db, self.tenant, self.bill), BILL_UNCONFIRMED)
+        self.assertEqual(self.ref.get().to_dict()['claimed_at'], claimed_at)
+
+    def test_record_bills_marks_the_claim_sent(self):
+        claim_bill(self.db, self.tenant, self.bill)
+        self.assertEqual(record_bills(self.db, [(self.tenant, self.bill)]), [None])
+        self.assertTrue(self.ref.get().to_dict()['notification_sent'])
+
+    def test_failed_send_releases_the_claim(self):
+        item = {'tenant': self.tenant, 'bill': self.bill, 'result': {}}
+        with mock.patch('bills.views.send_bill_email', side_effect=OSError('connection refused')):
+            _deliver_bill(self.db, item)
+        self.assertEqual(item['result']['error'], 'connection refused')
+        self.assertFalse(self.ref.get().exists)
+
+    def test_sent_bill_is_marked_before_it_is_recorded(self):
+        item = {'tenant': self.tenant, 'bill': self.bill, 'result': {}}
+        with mock.patch('bills.views.send_bill_email', return_value=1):
+            _deliver_bill(self.db, item)
+        self.assertTrue(item['sent'])
+        self.assertTrue(self.ref.get().to_dict()['notification_sent'])
+        self.expire_claim()
+        with mock.patch('bills.views.send_bill_email', return_value=1) as send:
+            retry = {'tenant': self.tenant, 'bill': self.bill, 'result': {}}
+            _deliver_bill(self.db, retry)
+        send.assert_not_called()
+        self.assertTrue(retry['result']['duplicate'])
+
+
+class LatestBillPointerTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.tenant = TenantEntry(1001, 'tenant@example.com', 'Tenant', '1 Main St', 'owner-uid', 'Owner Name')
+
+    def bill(self, month, product_id=1001):
+        bill, _ = validate_bill({'product_id': product_id, 'month': month, 'kw_value': 120, 'amount': 30.5})
+        return bill
+
+    def pointer_month(self):
+        return self.db.collection('latest_bills').document('1001').get().to_dict()['month']
+
+    def test_pointer_is_keyed_by_the_product_id_string(self):
+        self.assertEqual(record_bills(self.db, [(self.tenant, self.bill('2025-02'))]), [None])
+        self.assertEqual(self.pointer_month(), '2025-02')
+
+    def test_older_bill_does_not_move_the_pointer_back(self):
+        record_bills(self.db, [(self.tenant, self.bill('2025-03'))])
+        self.assertEqual(record_bills(self.db, [(self.tenant, self.bill('2025-02'))]), [None])
+        self.assertEqual(self.pointer_month(), '2025-03')
+        self.assertTrue(self.db.collection('bills').document(bill_id(1001, '2025-02')).get().exists)
+
+    def test_newest_bill_of_a_chunk_wins(self):
+        record_bills(self.db, [(self.tenant, self.bill('2025-04')), (self.tenant, self.bill('2025-03'))])
+        self.assertEqual(self.pointer_month(), '2025-04')
+        record_bills(self.db, [(self.tenant, self.bill('2025-05'))])
+        self.assertEqual(self.pointer_month(), '2025-05')
+
+
+class ValidateBillTests(SimpleTestCase):
+    def error(self, **fields):
+        return validate_bill({'product_id': 'P1', 'month': '2025-02', **fields})[1]
+
+    def test_non_finite_kw_value_is_rejected(self):
+        for kw_value in (float('nan'), float('inf'), -1, True, '120'):
+            self.assertEqual(self.error(kw_value=kw_value), 'kw_value must be a finite, non-negative number')
+
+    def test_non_finite_amount_is_rejected(self):
+        for amount in (float('nan'), float('-inf'), -5, False, 'abc'):
+            self.assertEqual(self.error(kw_value=120, amount=amount), 'amount must be a finite, non-negative number')
+
+    def test_valid_bill(self):
+        self.assertIsNone(self.error(kw_value=120))
+        self.assertIsNone(self.error(kw_value=0, amount=12.5))
+
+
+class OutboxTests(TestCase):
+    def bill(self, product_id='1001', month='2025-02'):
+        return validate_bill({'product_id': product_id, 'month': month, 'kw_value': 120, 'amount': 30.5})[0]
+
+    def test_enqueue_returns_the_pending_job_for_the_same_bill(self):
+        job, created = enqueue_bill(self.bill())
+        again, created_again = enqueue_bill(self.bill())
+        self.assertTrue(created)
+        self.assertEqual((again.id, created_again), (job.id, False))
+
+        NotificationJob.objects.filter(id=job.id).update(status=NotificationJob.STATUS_SENT)
+        _, created = enqueue_bill(self.bill())
+        self.assertTrue(created)
+
+    def test_claim_takes_due_jobs_once(self):
+        due, _ = enqueue_bill(self.bill('1001'))
+        later, _ = enqueue_bill(self.bill('1002'))
+        NotificationJob.objects.filter(id=later.id).update(next_attempt_at=django_timezone.now() + timedelta(hours=1))
+
+        claimed = claim_due_jobs(10)
+        self.assertEqual([job.id for job in claimed], [due.id])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), (NotificationJob.STATUS_SENDING, 1))
+        self.assertEqual(claim_due_jobs(10), [])
+
+    def test_failed_job_backs_off_until_its_last_attempt(self):
+        enqueue_bill(self.bill())
+        job = claim_due_jobs(1)[0]
+        _fail(job, 'SMTP down')
+        job.refresh_from_db()
+        self.assertEqual(job.status, NotificationJob.STATUS_QUEUED)
+        self.assertGreater(job.next_attempt_at, django_timezone.now())
+
+        job.attempts = MAX_ATTEMPTS
+        _fail(job, 'SMTP down')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (NotificationJob.STATUS_FAILED, 'SMTP down'))
+
+    def test_backoff_grows_exponentially_up_to_the_cap(self):
+        self.assertLessEqual(backoff_delay(1), timedelta(seconds=36))
+        self.assertGreaterEqual(backoff_delay(3), timedelta(seconds=96))
+        self.assertLessEqual(backoff_delay(30), timedelta(seconds=3600 * 1.2))
+
+    def test_stale_sending_jobs_are_requeued(self):
+        stale, _ = enqueue_bill(self.bill('1001'))
+        fresh, _ = enqueue_bill(self.bill('1002'))
+        claim_due_jobs(10)
+        NotificationJob.objects.filter(id=stale.id).update(updated_at=django_timezone.now() - SENDING_LEASE * 2)
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), (NotificationJob.STATUS_QUEUED, NotificationJob.STATUS_SENDING))
+
+    def test_numeric_product_id_is_looked_up_as_sent(self):
+        db = MemoryClient(MemoryStore())
+        tenant = TenantEntry(1001, 'tenant@example.com', 'Tenant', '1 Main St', 'owner-uid', 'Owner Name')
+        directory = mock.Mock()
+        directory.lookup.side_effect = {1001: tenant}.get
+        enqueue_bill(self.bill(product_id=1001))
+
+        with mock.patch('bills.outbox.initialize_firebase', return_value=(None, db)), \
+                mock.patch('bills.outbox.get_tenant_directory', return_value=directory):
+            self.assertEqual(deliver_jobs(claim_due_jobs(10)), (1, 0))
+        directory.lookup.assert_called_once_with(1001)
+        self.assertEqual(mail.outbox[0].to, ['tenant@example.com'])
+        self.assertEqual(NotificationJob.objects.get().status, NotificationJob.STATUS_SENT)
+
+
+class BatchNotificationTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        for product_id in ('1001', '1002'):
+            self.db.collection('tenants').document(f'owner_{product_id}').set({
+                'product_id': product_id, 'email': f'{product_id}@example.com', 'name': 'Tenant', 'owner_uid': 'owner',
+            })
+        self.db.collection('migrations').document('tenants').set({'complete': True})
+        self.directory = TenantDirectory(self.db)
+        self.addCleanup(self.directory.stop)
+        for target, value in (('initialize_firebase', (None, self.db)), ('get_tenant_directory', self.directory)):
+            patcher = mock.patch(f'bills.views.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, bills):
+        return self.client.post(reverse('send_bill_notifications_batch'), {'bills': bills},
+                                content_type='application/json').json()
+
+    def test_batch_resolves_its_tenants_together(self):
+        bills = [
+            {'product_id': '1001', 'month': '2025-02', 'kw_value': 120, 'amount': 30.5},
+            {'product_id': '9999', 'month': '2025-02', 'kw_value': 120},
+            {'product_id': ['1002'], 'month': '2025-02', 'kw_value': 120},
+            {'product_id': '1002', 'month': '2025-02', 'kw_value': 120, 'amount': 12},
+        ]
+        with mock.patch.object(self.directory, 'lookup_many', wraps=self.directory.lookup_many) as lookup_many:
+            body = self.post(bills)
+        lookup_many.assert_called_once_with(['1001', '9999', '1002'])
+        self.assertEqual((body['sent'], body['failed'], body['duplicates']), (2, 2, 0))
+        self.assertEqual(body['results'][1]['error'], 'No tenant found with product_id: 9999')
+        self.assertEqual(body['results'][2]['error'], 'product_id must be a string or an integer')
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['1001@example.com', '1002@example.com'])
+
+    def test_repeated_batch_reports_duplicates(self):
+        bills = [{'product_id': '1001', 'month': '2025-02', 'kw_value': 120, 'amount': 30.5}]
+        self.post(bills)
+        body = self.post(bills)
+        self.assertEqual((body['sent'], body['duplicates']), (0, 1))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class TenantLookupFallbackTests(SimpleTestCase):
+    """Lookups before the listeners' initial snapshots arrive"""
+
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        for i in range(40):
+            tenant = {'product_id': str(i), 'email': f'{i}@example.com'}
+            self.db.collection('tenants').document(f'owner_{i}').set(tenant)
+        self.db.collection('house_owners').document('legacy').set({'tenants': [
+            {'product_id': 'L1', 'email': 'l1@example.com'}, {'product_id': 'L2', 'email': 'l2@example.com'},
+        ]})
+        self.directory = TenantDirectory(self.db)
+        for patcher in (mock.patch.object(TenantDirectory, 'start'),
+                        mock.patch.object(tenant_directory, 'INITIAL_SNAPSHOT_TIMEOUT', 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_misses_are_queried_in_chunks_and_one_legacy_scan(self):
+        streamed = []
+        stream = MemoryQuery.stream
+
+        def recording_stream(query, *args, **kwargs):
+            streamed.append(query._collection)
+            return stream(query, *args, **kwargs)
+
+        product_ids = [str(i) for i in range(40)] + ['L1', 'L2', 'missing']
+        with mock.patch.object(MemoryQuery, 'stream', recording_stream):
+            found = self.directory.lookup_many(product_ids)
+        self.assertEqual(streamed, ['tenants', 'tenants', 'house_owners'])
+        self.assertEqual(len(found), 42)
+        self.assertEqual(found['L2'].email, 'l2@example.com')
+        self.assertNotIn('missing', found)
+
+
+class BackfillLatestBillsTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        patcher = mock.patch('bills.management.commands.backfill_latest_bills.initialize_firebase',
+                             return_value=(None, self.db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_bill(self, product_id, month, sent=True):
+        self.db.collection('bills').document(bill_id(product_id, month)).set({
+            'product_id': product_id, 'month': month, 'amount': 10, 'kw_value': 40,
+            'notification_sent': sent, 'notification_date': f'{month}-01 00:00:00',
+        })
+
+    def pointer_month(self, product_id='1001'):
+        return self.db.collection('latest_bills').document(product_id).get().to_dict()['month']
+
+    def backfill(self):
+        call_command('backfill_latest_bills', stdout=StringIO(), stderr=StringIO())
+
+    def test_numeric_and_string_product_ids_share_a_pointer(self):
+        self.add_bill(1001, '2025-03')
+        self.add_bill('1001', '2025-02')
+        self.add_bill('1001', '2025-04', sent=False)
+        self.backfill()
+        self.assertEqual([snapshot.id for snapshot in self.db.collection('latest_bills').stream()], ['1001'])
+        self.assertEqual(self.pointer_month(), '2025-03')
+
+    def test_newer_pointer_is_not_moved_back(self):
+        self.add_bill('1001', '2025-02')
+        self.db.collection('latest_bills').document('1001').set({'month': '2025-05'})
+        self.backfill()
+        self.assertEqual(self.pointer_month(), '2025-05')
+
+    def test_pointer_moved_during_the_backfill_is_re_read(self):
+        self.add_bill('1001', '2025-02')
+        self.db.collection('latest_bills').document('1001').set({'month': '2025-01'})
+        get_all = self.db.get_all
+        reads = []
+
+        def moved_after_first_read(references, **kwargs):
+            snapshots = list(get_all(references, **kwargs))
+            if not reads:
+                reads.append(references)
+                self.db.collection('latest_bills').document('1001').set({'month': '2025-06'})
+            return iter(snapshots)
+
+        with mock.patch.object(self.db, 'get_all', moved_after_first_read):
+            self.backfill()
+        self.assertEqual(self.pointer_month(), '2025-06')
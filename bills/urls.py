@@ -3,4 +3,7 @@ from bills import views
 
 urlpatterns = [
     path('send-notification/', views.send_bill_notification, name='send_bill_notification'),
+    path('send-notification/batch/', views.send_bill_notifications_batch, name='send_bill_notifications_batch'),
+    path('jobs/<uuid:job_id>/', views.get_notification_job, name='get_notification_job'),
+    path('export/', views.export_bills, name='export_bills'),
 ]
\ No newline at end of file
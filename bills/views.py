@@ -1,30 +1,68 @@
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from django.conf import settings
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import csv
 import json
 import logging
-from datetime import datetime, timezone
+from datetime import datetime
+from TenantVoltAPI.firebase_async import get_async_firestore
 from TenantVoltAPI.firebase_config import initialize_firebase
-import os
+from TenantVoltAPI.tenant_directory import get_tenant_directory
+from bills.models import NotificationJob
+from bills.notifications import (
+    validate_bill, price_bills, send_bill_email, record_bills, aget_bill, claim_bill, mark_bill_sent,
+    release_bill_claim, BILL_ALREADY_SENT, BILL_IN_PROGRESS, BILL_UNCONFIRMED, BILL_UNCONFIRMED_MESSAGE,
+)
+from bills.outbox import enqueue_bill
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upper bound on bills accepted by one batch request
+MAX_BATCH_BILLS = 1000
+
+# Upper bound on tenants in one /bill/latest/ request
+MAX_LATEST_BILLS = 1000
+
+# Bills fetched per Firestore page while streaming an export
+EXPORT_PAGE_SIZE = 500
+
+EXPORT_FIELDS = ['bill_id', 'product_id', 'month', 'amount', 'kw_value', 'tenant_email', 'notification_date']
+
 
 @csrf_exempt
-def send_bill_notification(request):
+async def send_bill_notification(request):
     """
-    Find tenant by product_id and send bill notification email
+    Find tenant by product_id and queue a bill notification email
+
+    The notification is written to the local outbox and delivered by the
+    drain_outbox worker; poll the returned status_url for the outcome. A bill
+    already sent for the same product and month is not sent again, and a
+    repeat of a still-queued bill returns the existing job.
 
     Expected POST body:
     {
         "product_id": "1112",
         "month": "2025-02",  # Format: YYYY-MM
-        "amount": 1250.00,
+        "amount": 1250.00,  # Optional: priced from kw_value with the configured tariff
         "kw_value": 650
     }
+
+    Response body (202):
+    {
+        "success": true,
+        "message": "Bill notification queued for alice.smith@example.com",
+        "job_id": "6f1c1c1e-4f8e-4a8e-9d55-0d9f3c2b7a10",
+        "amount": 1250.00,
+        "status_url": "/api/bills/jobs/6f1c1c1e-4f8e-4a8e-9d55-0d9f3c2b7a10/"
+    }
     """
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
@@ -34,142 +72,473 @@ def send_bill_notification(request):
         body_data = request.body
         data = json.loads(body_data.decode('utf-8'))
 
-        # Validate required fields
-        required_fields = ['product_id', 'month', 'amount', 'kw_value']
-        for field in required_fields:
-            if field not in data:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }, status=400)
+        # Validate required fields and month format
+        bill, error = validate_bill(data)
+        if error:
+            return JsonResponse({
+                'success': False,
+                'error': error
+            }, status=400)
 
-        # Extract data
-        product_id = data.get('product_id')
-        month_code = data.get('month')
-        amount = data.get('amount')
-        kw_value = data.get('kw_value')
+        product_id = bill['product_id']
 
-        # Format month for display (convert YYYY-MM to Month YYYY)
-        try:
-            month_date = datetime.strptime(month_code, "%Y-%m")
-            formatted_month = month_date.strftime("%B %Y")  # e.g., "February 2025"
-        except ValueError:
+        # Resolve the tenant from the in-memory product_id index; it may wait for the initial snapshot
+        tenant = await sync_to_async(get_tenant_directory().lookup, thread_sensitive=False)(product_id)
+
+        # If no tenant found with matching product_id
+        if tenant is None:
             return JsonResponse({
                 'success': False,
-                'error': 'Invalid month format. Expected YYYY-MM'
+                'error': f'No tenant found with product_id: {product_id}'
+            }, status=404)
+
+        # Re-sends of a bill that already went out stop here, before any email is queued
+        existing = await aget_bill(get_async_firestore(), product_id, bill['month'])
+        if existing and existing.get('notification_sent'):
+            return JsonResponse({
+                'success': True,
+                'duplicate': True,
+                'message': f"Bill notification for {bill['month']} was already sent to {existing.get('tenant_email')}",
+            })
+
+        # Price the usage when the caller did not send an amount
+        price_bills([bill])
+
+        # Queue the notification; the drain_outbox worker sends it and records the bill
+        job, created = await sync_to_async(enqueue_bill)(bill)
+        if created:
+            logger.info(f"Bill notification job {job.id} queued for product_id {product_id}")
+
+        return JsonResponse({
+            'success': True,
+            'message': f"Bill notification queued for {tenant.email}",
+            'job_id': str(job.id),
+            'amount': job.payload['amount'],
+            'status_url': reverse('get_notification_job', args=[job.id]),
+        }, status=202)
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Error queueing bill notification: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+async def get_notification_job(request, job_id):
+    """
+    Get the delivery status of a queued bill notification
+
+    Response body:
+    {
+        "success": true,
+        "job": {
+            "job_id": "6f1c1c1e-4f8e-4a8e-9d55-0d9f3c2b7a10",
+            "status": "sent",  # queued | sending | sent | failed
+            "product_id": "1112",
+            "month": "2025-02",
+            "attempts": 1,
+            "last_error": null,
+            "tenant_email": "alice.smith@example.com",
+            "created_at": "2025-03-01T00:01:00.119374+00:00",
+            "updated_at": "2025-03-01T00:01:02.502113+00:00",
+            "sent_at": "2025-03-01T00:01:02.502113+00:00"
+        }
+    }
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        job = await NotificationJob.objects.aget(id=job_id)
+    except NotificationJob.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Not found',
+            'message': f'No notification job found with id: {job_id}'
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'job': job.to_dict(),
+    })
+
+
+def _deliver_bill(firestore_db, item):
+    """Claim and send one resolved batch item's email, filling in its result in place"""
+    tenant, bill, result = item['tenant'], item['bill'], item['result']
+    claimed = False
+    try:
+        claim = claim_bill(firestore_db, tenant, bill)
+        if claim == BILL_ALREADY_SENT:
+            result['success'] = True
+            result['duplicate'] = True
+            return item
+        if claim == BILL_IN_PROGRESS:
+            result['error'] = 'This bill is already being sent'
+            return item
+        if claim == BILL_UNCONFIRMED:
+            result['error'] = BILL_UNCONFIRMED_MESSAGE
+            return item
+        claimed = True
+
+        if not send_bill_email(tenant, bill):
+            raise RuntimeError('Failed to send email notification')
+        # The email is out, so the claim must not be released from here on
+        claimed = False
+        mark_bill_sent(firestore_db, tenant, bill)
+        item['sent'] = True
+        result['success'] = True
+        result['tenant_email'] = tenant.email
+    except Exception as e:
+        logger.error(f"Error sending bill notification for product_id {bill['product_id']}: {str(e)}")
+        if claimed:
+            release_bill_claim(firestore_db, bill)
+        result['error'] = str(e)
+    return item
+
+
+@csrf_exempt
+def send_bill_notifications_batch(request):
+    """
+    Send bill notification emails for many products in one request
+
+    Tenants are resolved together from the in-memory index, bills without an
+    amount are priced together by the tariff engine, emails go out
+    concurrently on a bounded pool and the bill records are committed with
+    Firestore batched writes. Bills already sent for that product and month
+    are reported with "duplicate": true and not sent again.
+
+    Expected POST body:
+    {
+        "bills": [
+            {"product_id": "1112", "month": "2025-02", "amount": 1250.00, "kw_value": 650},
+            {"product_id": "1113", "month": "2025-02", "amount": 980.50, "kw_value": 512}
+        ]
+    }
+
+    Response body:
+    {
+        "success": true,
+        "count": 2,
+        "sent": 1,
+        "duplicates": 0,
+        "failed": 1,
+        "results": [
+            {"index": 0, "product_id": "1112", "success": true, "amount": 1250.00, "tenant_email": "alice.smith@example.com"},
+            {"index": 1, "product_id": "1113", "success": false, "error": "No tenant found with product_id: 1113"}
+        ]
+    }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        # Parse request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
+
+        bills = data.get('bills') if isinstance(data, dict) else None
+        if not isinstance(bills, list) or not bills:
+            return JsonResponse({
+                'success': False,
+                'error': 'bills must be a non-empty list'
+            }, status=400)
+
+        if len(bills) > MAX_BATCH_BILLS:
+            return JsonResponse({
+                'success': False,
+                'error': f'At most {MAX_BATCH_BILLS} bills can be sent per request'
             }, status=400)
 
         # Initialize Firebase
         _, firestore_db = initialize_firebase()
+        directory = get_tenant_directory()
 
-        # Query all house_owners to find the tenant with matching product_id
-        house_owners = firestore_db.collection('house_owners').stream()
-
-        tenant_email = None
-        tenant_name = None
-        owner_name = None
-        property_address = None
+        # Validate every item, then resolve all their tenants together
+        results = []
+        valid = []
+        for index, item in enumerate(bills):
+            result = {
+                'index': index,
+                'product_id': item.get('product_id') if isinstance(item, dict) else None,
+                'success': False,
+            }
+            results.append(result)
 
-        for house_owner in house_owners:
-            owner_data = house_owner.to_dict()
+            bill, error = validate_bill(item)
+            if error:
+                result['error'] = error
+                continue
+            valid.append((bill, result))
 
-            # Skip if no tenants field or not a list
-            if 'tenants' not in owner_data or not isinstance(owner_data['tenants'], list):
+        tenants = directory.lookup_many([bill['product_id'] for bill, _ in valid])
+        deliverable = []
+        for bill, result in valid:
+            tenant = tenants.get(bill['product_id'])
+            if tenant is None:
+                result['error'] = f"No tenant found with product_id: {bill['product_id']}"
                 continue
 
-            # Look for tenant with matching product_id
-            for tenant in owner_data['tenants']:
-                if tenant.get('product_id') == product_id:
-                    tenant_email = tenant.get('email')
-                    tenant_name = tenant.get('name', 'Valued Tenant')
-                    owner_name = f"{owner_data.get('first_name', '')} {owner_data.get('last_name', '')}"
-                    property_address = tenant.get('address', owner_data.get('address', 'your rental property'))
-                    break
+            deliverable.append({'tenant': tenant, 'bill': bill, 'result': result})
 
-            # If tenant found, break the outer loop too
-            if tenant_email:
-                break
+        # Price every bill sent without an amount in one vectorized call
+        price_bills([item['bill'] for item in deliverable])
+        for item in deliverable:
+            item['result']['amount'] = item['bill']['amount']
 
-        # If no tenant found with matching product_id
-        if not tenant_email:
-            return JsonResponse({
-                'success': False,
-                'error': f'No tenant found with product_id: {product_id}'
-            }, status=404)
+        # Send the emails concurrently on a bounded worker pool
+        workers = getattr(settings, 'BILL_NOTIFICATION_WORKERS', 8)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            delivered = [item for item in executor.map(partial(_deliver_bill, firestore_db), deliverable)
+                         if item.get('sent')]
 
-        # Prepare email content
-        subject = f"Electricity Bill Notification - {formatted_month}"
+        # Record the sent bills and their latest-bill pointers with batched writes
+        errors = record_bills(firestore_db, [(item['tenant'], item['bill']) for item in delivered])
+        for item, error in zip(delivered, errors):
+            if error is not None:
+                item['result']['record_error'] = str(error)
 
-        email_body = f"""
-Hello {tenant_name},
+        sent_count = len(delivered)
+        duplicate_count = sum(1 for result in results if result.get('duplicate'))
+        logger.info(f"Batch bill notification: {sent_count} of {len(bills)} emails sent")
 
-ELECTRICITY BILL NOTIFICATION
+        return JsonResponse({
+            'success': True,
+            'count': len(results),
+            'sent': sent_count,
+            'duplicates': duplicate_count,
+            'failed': len(results) - sent_count - duplicate_count,
+            'results': results,
+        })
 
-This is to inform you that your electricity bill for {formatted_month} is now available:
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Error sending batch bill notifications: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
 
-Property: {property_address}
-Total Usage: {kw_value} kWh
-Amount Due: ${amount:.2f}
 
-Please make your payment at your earliest convenience to avoid any service interruption.
+@csrf_exempt
+async def get_latest_bills(request):
+    """
+    Get the latest bill of many tenants in one request
 
-If you have any questions about this bill, please contact your property manager.
+    All product_ids are fetched from their `latest_bills` pointer documents in a
+    single get_all round trip; bill_details is null for products with no bill.
 
-Best Regards,
-{owner_name}
-TenantVolt System
-        """.strip()
+    Expected POST body:
+    {
+        "tenants": [
+            {"tenant_index": 0, "product_id": "1112"},
+            {"tenant_index": 1, "product_id": "1113"}
+        ]
+    }
 
-        # Send email using Django's email functionality
-        sent = send_mail(
-            subject=subject,
-            message=email_body,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[tenant_email],
-            fail_silently=False,
-        )
+    Response body:
+    {
+        "tenants": [
+            {
+                "tenant_index": 0,
+                "product_id": "1112",
+                "bill_details": {
+                    "month": "2025-02",
+                    "amount": 11900,
+                    "kw_value": 337.7,
+                    "status": "not_paid",
+                    "payment_date": null,
+                    "calculated_at": "2025-03-01T00:01:00.119374+05:30"
+                }
+            },
+            ...
+        ]
+    }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
-        if sent:
-            # Log the email was sent
-            logger.info(f"Bill notification email sent to {tenant_email} for product_id {product_id}")
+    try:
+        # Parse request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
 
-            # Create record of this bill in Firestore (optional)
-            bills_ref = firestore_db.collection('bills').document()
-            bills_ref.set({
-                'product_id': product_id,
-                'tenant_email': tenant_email,
-                'month': month_code,
-                'amount': amount,
-                'kw_value': kw_value,
-                'notification_sent': True,
-                'notification_date': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
-            })
+        tenants = data.get('tenants') if isinstance(data, dict) else None
+        if not isinstance(tenants, list) or not tenants:
+            return JsonResponse({
+                'success': False,
+                'error': 'tenants must be a non-empty list'
+            }, status=400)
 
+        if len(tenants) > MAX_LATEST_BILLS:
             return JsonResponse({
-                'success': True,
-                'message': f"Bill notification sent to {tenant_email}",
-                'tenant': {
-                    'email': tenant_email,
-                    'name': tenant_name
-                },
-                'bill': {
-                    'month': month_code,
-                    'amount': amount,
-                    'kw_value': kw_value
+                'success': False,
+                'error': f'At most {MAX_LATEST_BILLS} tenants can be requested at once'
+            }, status=400)
+
+        for tenant in tenants:
+            if not isinstance(tenant, dict) or not tenant.get('product_id'):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Every tenant needs a product_id'
+                }, status=400)
+
+        firestore_db = get_async_firestore()
+
+        # Fetch every distinct pointer document in one round trip
+        latest_bills_collection = firestore_db.collection('latest_bills')
+        product_ids = list(dict.fromkeys(str(tenant['product_id']) for tenant in tenants))
+        refs = [latest_bills_collection.document(product_id) for product_id in product_ids]
+        latest = {snapshot.id: snapshot.to_dict() async for snapshot in firestore_db.get_all(refs) if snapshot.exists}
+
+        return JsonResponse({
+            'tenants': [
+                {
+                    'tenant_index': tenant.get('tenant_index'),
+                    'product_id': tenant['product_id'],
+                    'bill_details': latest.get(str(tenant['product_id'])),
                 }
-            })
+                for tenant in tenants
+            ]
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Error getting latest bills: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
+
+
+class _Echo:
+    """File-like object whose write() returns the row, so csv.writer can feed a generator"""
+
+    def write(self, value):
+        return value
+
+
+def _fetch_page(page):
+    return list(page.stream())
+
+
+async def _iter_bills(firestore_db, month=None, product_id=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield bill documents page by page, resuming each page after the last document
+
+    Each page is fetched on a worker thread, so under ASGI a page goes out to
+    the client before the next one is read.
+    """
+    query = firestore_db.collection('bills')
+    if month:
+        query = query.where('month', '==', month)
+    if product_id:
+        query = query.where('product_id', '==', product_id)
+    query = query.order_by('__name__').limit(page_size)
+
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = await sync_to_async(_fetch_page, thread_sensitive=False)(page)
+        for doc in docs:
+            yield doc
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+async def _export_rows(firestore_db, month, product_id):
+    async for doc in _iter_bills(firestore_db, month, product_id):
+        bill = doc.to_dict()
+        # Claims whose email never went out are not billing history
+        if not bill.get('notification_sent'):
+            continue
+        row = {field: bill.get(field) for field in EXPORT_FIELDS}
+        row['bill_id'] = doc.id
+        yield row
+
+
+async def _stream_export(rows, export_format):
+    try:
+        if export_format == 'csv':
+            writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+            yield writer.writeheader()
+            async for row in rows:
+                yield writer.writerow(row)
         else:
+            async for row in rows:
+                yield json.dumps(row) + '\n'
+    except Exception as e:
+        # The 200 headers are already out; re-raising aborts the connection, so the
+        # client sees a failed download rather than a complete-looking short file
+        logger.error(f"Error streaming bills export: {str(e)}")
+        raise
+
+
+@csrf_exempt
+def export_bills(request):
+    """
+    Stream the billing history as NDJSON or CSV
+
+    Bills are read from Firestore in pages of EXPORT_PAGE_SIZE using
+    start_after cursors and written out row by row, so memory use does not
+    grow with the size of the collection. The body is an async iterator, so
+    on the ASGI worker each page is sent as soon as it is read.
+
+    Query parameters:
+        format: "ndjson" (default) or "csv"
+        month: only bills for this month (YYYY-MM)
+        product_id: only bills for this product
+
+    NDJSON response body (one object per line):
+    {"bill_id": "1112_2025-02", "product_id": "1112", "month": "2025-02", "amount": 11900, "kw_value": 337.7, "tenant_email": "alice.smith@example.com", "notification_date": "2025-03-01 00:01:00"}
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    export_format = request.GET.get('format', 'ndjson')
+    month = request.GET.get('month')
+    product_id = request.GET.get('product_id')
+
+    if export_format not in ('ndjson', 'csv'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid format. Expected ndjson or csv'
+        }, status=400)
+
+    if month:
+        try:
+            datetime.strptime(month, "%Y-%m")
+        except ValueError:
             return JsonResponse({
                 'success': False,
-                'error': 'Failed to send email notification'
-            }, status=500)
+                'error': 'Invalid month format. Expected YYYY-MM'
+            }, status=400)
 
-    except json.JSONDecodeError:
-        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    try:
+        # Initialize Firebase
+        _, firestore_db = initialize_firebase()
     except Exception as e:
-        logger.error(f"Error sending bill notification: {str(e)}")
+        logger.error(f"Error exporting bills: {str(e)}")
         return JsonResponse({
             'success': False,
             'error': 'Server error',
             'message': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+    rows = _export_rows(firestore_db, month, product_id)
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(_stream_export(rows, export_format), content_type=content_type)
+    filename = f"bills-{month or 'all'}{'-' + product_id if product_id else ''}.{export_format}"
+    # product_id comes from the query string; keep only filename-safe characters
+    response['Content-Disposition'] = content_disposition_header(True, get_valid_filename(filename))
+    return response
@@ -0,0 +1,101 @@
+import logging
+import threading
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cached for products that have no connection_status document yet
+MISSING = object()
+
+
+class ConnectionStatusCache:
+    """
+    Per-worker cache of `connection_status/{product_id}` documents.
+
+    Updates from this worker are written through to the cache. Changes made by
+    other workers arrive through an on_snapshot listener on the collection, which
+    replaces or drops the cached entries. Products not in the cache are fetched
+    with one get_all call per batch.
+    """
+
+    def __init__(self, firestore_db):
+        self._db = firestore_db
+        self._collection = firestore_db.collection('connection_status')
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._watch = None
+
+    def start(self):
+        """Start (or restart) the connection_status listener"""
+        with self._lock:
+            if self._watch is not None and self._watch.is_active:
+                return
+            # Entries cached while no listener was running may have missed changes
+            self._statuses = {}
+            self._watch = self._collection.on_snapshot(self._on_snapshot)
+            logger.info("Connection status listener started")
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                product_id = change.document.id
+                if change.type.name == 'REMOVED':
+                    self._statuses.pop(product_id, None)
+                else:
+                    self._statuses[product_id] = bool((change.document.to_dict() or {}).get('connection_status'))
+
+    def get_many(self, product_ids):
+        """Return {product_id: bool or None}; None means the product has no status document"""
+        if self._watch is None or not self._watch.is_active:
+            self.start()
+
+        found = {}
+        misses = []
+        with self._lock:
+            for product_id in product_ids:
+                status = self._statuses.get(product_id)
+                if status is None:
+                    misses.append(product_id)
+                else:
+                    found[product_id] = status
+
+        if misses:
+            snapshots = self._db.get_all([self._collection.document(product_id) for product_id in misses])
+            fetched = {
+                snapshot.id: bool((snapshot.to_dict() or {}).get('connection_status'))
+                for snapshot in snapshots if snapshot.exists
+            }
+            with self._lock:
+                for product_id in misses:
+                    status = fetched.get(product_id, MISSING)
+                    # A listener event that landed during the fetch is newer, so keep it
+                    found[product_id] = self._statuses.setdefault(product_id, status)
+
+        return {product_id: (None if status is MISSING else status) for product_id, status in found.items()}
+
+    def put(self, product_id, connection_status):
+        """Write-through after this worker updated a product's status"""
+        with self._lock:
+            self._statuses[product_id] = connection_status
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_connection_status_cache():
+    """Return this worker's ConnectionStatusCache, creating and starting it on first use"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _, firestore_db = initialize_firebase()
+                cache = ConnectionStatusCache(firestore_db)
+                cache.start()
+                _cache = cache
+
+    return _cache
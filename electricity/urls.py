@@ -0,0 +1,7 @@
+from django.urls import path
+from electricity import views
+
+urlpatterns = [
+    path('connection-status/', views.get_connection_status, name='get_connection_status'),
+    path('update-connection-status/', views.update_connection_status, name='update_connection_status'),
+]
\ No newline at end of file
@@ -0,0 +1,156 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+import json
+import logging
+from TenantVoltAPI.firebase_config import initialize_firebase
+from electricity.connection_cache import get_connection_status_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound on tenants in one connection-status request
+MAX_STATUS_TENANTS = 1000
+
+
+@csrf_exempt
+def get_connection_status(request):
+    """
+    Get the electricity connection status of many tenants
+
+    Statuses come from the per-worker cache; product_ids it has not seen cost
+    one get_all round trip for the whole request. Products with no status
+    document are reported as disconnected.
+
+    Expected request body:
+    {
+        "tenants": [
+            {"tenant_index": 0, "product_id": "1112"},
+            {"tenant_index": 1, "product_id": "1113"}
+        ]
+    }
+
+    Response body:
+    {
+        "tenants": [
+            {"tenant_index": 0, "connection_status": false},
+            {"tenant_index": 1, "connection_status": true}
+        ]
+    }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        # Read request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
+
+        tenants = data.get('tenants') if isinstance(data, dict) else None
+        if not isinstance(tenants, list) or not tenants:
+            return JsonResponse({
+                'success': False,
+                'error': 'tenants must be a non-empty list'
+            }, status=400)
+
+        if len(tenants) > MAX_STATUS_TENANTS:
+            return JsonResponse({
+                'success': False,
+                'error': f'At most {MAX_STATUS_TENANTS} tenants can be requested at once'
+            }, status=400)
+
+        for tenant in tenants:
+            if not isinstance(tenant, dict) or not tenant.get('product_id'):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Every tenant needs a product_id'
+                }, status=400)
+
+        product_ids = list(dict.fromkeys(str(tenant['product_id']) for tenant in tenants))
+        statuses = get_connection_status_cache().get_many(product_ids)
+
+        return JsonResponse({
+            'tenants': [
+                {
+                    'tenant_index': tenant.get('tenant_index'),
+                    'connection_status': bool(statuses.get(str(tenant['product_id']))),
+                }
+                for tenant in tenants
+            ]
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Error getting connection status: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+def update_connection_status(request):
+    """
+    Update the electricity connection status of a tenant
+
+    Expected request body:
+    {
+        "connection_status": true,
+        "product_id": "1113"
+    }
+
+    Response body:
+    {
+        "message": "Connection Status of 1113 updated to True successfully"
+    }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        # Read request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
+
+        product_id = data.get('product_id') if isinstance(data, dict) else None
+        connection_status = data.get('connection_status') if isinstance(data, dict) else None
+
+        # Validate inputs
+        if not product_id or not isinstance(connection_status, bool):
+            return JsonResponse({
+                'success': False,
+                'error': 'Missing required fields',
+                'message': 'product_id and a boolean connection_status are required'
+            }, status=400)
+
+        product_id = str(product_id)
+
+        # Initialize Firebase
+        _, firestore_db = initialize_firebase()
+
+        firestore_db.collection('connection_status').document(product_id).set({
+            'connection_status': connection_status,
+            'updated_at': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
+        }, merge=True)
+
+        # Write through so this worker's next read sees the update immediately
+        get_connection_status_cache().put(product_id, connection_status)
+
+        return JsonResponse({
+            'message': f"Connection Status of {product_id} updated to {connection_status} successfully"
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"Error updating connection status: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
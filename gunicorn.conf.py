@@ -0,0 +1,38 @@
+"""
+gunicorn settings, read automatically from the working directory (see Procfile).
+
+Each worker initializes Firebase and opens its connections before it takes
+requests (TenantVoltAPI.warmup), and logs how long each startup phase took.
+The workers share their metrics through METRICS_DIR (TenantVoltAPI.metrics).
+"""
+import os
+import tempfile
+import time
+
+
+def on_starting(server):
+    # Set before the workers are forked, so they all inherit it; emptied, since counts of a previous run would
+    # otherwise be added to this one's
+    directory = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'tenantvolt-metrics')
+    os.environ['METRICS_DIR'] = directory
+    from TenantVoltAPI.metrics import reset_shared_metrics
+
+    reset_shared_metrics(directory)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # Runs once the worker has loaded Django, before it accepts connections;
+    # post_fork is too early, the application is not imported yet
+    from TenantVoltAPI.warmup import warm_up
+
+    warm_up({'app_load': time.perf_counter() - worker.forked_at})
+
+
+def child_exit(server, worker):
+    from TenantVoltAPI.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid, os.environ['METRICS_DIR'])
@@ -0,0 +1,134 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.core.management.base import BaseCommand
+from google.api_core.exceptions import FailedPrecondition
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_store import (
+    MIGRATIONS_COLLECTION, TENANTS_MIGRATION, has_legacy_tenants, legacy_migration,
+)
+from orders.order_updates import FIRESTORE_BATCH_LIMIT
+
+# Times a page is re-read after an owner changed between our read and our write
+MAX_PAGE_ATTEMPTS = 3
+
+
+class Command(BaseCommand):
+    help = ('Move the tenants arrays embedded in house_owners into the tenants collection. '
+            'Safe to run while the API serves traffic; progress is saved, so an interrupted run resumes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=200,
+                            help='house_owners documents read per page (max 500)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the saved progress and scan from the first house owner')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be migrated without writing anything')
+
+    def handle(self, *args, **options):
+        _, firestore_db = initialize_firebase()
+        page_size = max(1, min(options['page_size'], FIRESTORE_BATCH_LIMIT))
+        dry_run = options['dry_run']
+
+        state_ref = firestore_db.collection(MIGRATIONS_COLLECTION).document(TENANTS_MIGRATION)
+        state = {} if options['restart'] else (state_ref.get().to_dict() or {})
+        last_uid = state.get('last_uid')
+        migrated = state.get('migrated', 0)
+        # Owners skipped before the checkpoint are not scanned again, so a resumed run inherits them
+        skipped = state.get('skipped', 0) if last_uid else 0
+        if last_uid:
+            self.stdout.write(f"Resuming after house owner {last_uid} "
+                              f"({migrated} owners migrated, {skipped} skipped so far)")
+
+        query = firestore_db.collection('house_owners').order_by('__name__').limit(page_size)
+        while True:
+            page = query.start_after({'__name__': last_uid}) if last_uid else query
+            owners = list(page.stream())
+            if not owners:
+                break
+
+            page_migrated, page_skipped = self._migrate_page(firestore_db, owners, dry_run)
+            migrated += page_migrated
+            skipped += page_skipped
+            last_uid = owners[-1].id
+            if not dry_run:
+                state_ref.set({
+                    'last_uid': last_uid,
+                    'migrated': migrated,
+                    'skipped': skipped,
+                    'complete': False,
+                    'updated_at': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            self.stdout.write(f"Up to {last_uid}: {page_migrated} of {len(owners)} owners migrated")
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: {migrated} owners would be migrated"))
+            return
+
+        # Readers stop looking for tenants arrays once the migration is marked complete
+        state_ref.set({
+            'last_uid': None,
+            'migrated': migrated,
+            'skipped': skipped,
+            'complete': skipped == 0,
+            'updated_at': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Migrated {migrated} owners; {skipped} could not be migrated and keep their tenants array"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Tenants migration complete: {migrated} owners migrated"))
+
+    def _migrate_page(self, firestore_db, owners, dry_run):
+        """Migrate the legacy owners of one page; return (migrated, skipped)"""
+        migrated = skipped = 0
+        for _ in range(MAX_PAGE_ATTEMPTS):
+            legacy = [owner for owner in owners if owner.exists and has_legacy_tenants(owner.to_dict())]
+            if dry_run:
+                return len(legacy), 0
+
+            conflicted = []
+            batch = firestore_db.batch()
+            batch_owners = []
+            batch_writes = 0
+            for owner in legacy:
+                tenant_sets, owner_fields = legacy_migration(firestore_db, owner.id, owner.to_dict())
+                writes = len(tenant_sets) + 1
+                if writes > FIRESTORE_BATCH_LIMIT:
+                    self.stderr.write(f"Skipping {owner.id}: {len(tenant_sets)} tenants do not fit in one batch")
+                    skipped += 1
+                    continue
+
+                if batch_writes + writes > FIRESTORE_BATCH_LIMIT:
+                    migrated += self._commit(batch, batch_owners, conflicted)
+                    batch, batch_owners, batch_writes = firestore_db.batch(), [], 0
+
+                for reference, record in tenant_sets:
+                    batch.set(reference, record)
+                # The array must not have changed since it was read, or the change would be lost
+                batch.update(owner.reference, owner_fields,
+                             option=firestore_db.write_option(last_update_time=owner.update_time))
+                batch_owners.append(owner)
+                batch_writes += writes
+
+            if batch_owners:
+                migrated += self._commit(batch, batch_owners, conflicted)
+
+            if not conflicted:
+                return migrated, skipped
+
+            # Re-read the owners of the batches that lost a race and try them again
+            owners = list(firestore_db.get_all([owner.reference for owner in conflicted]))
+
+        self.stderr.write(f"Giving up on {len(owners)} owners that kept changing; re-run the command to retry")
+        return migrated, skipped + len(owners)
+
+    @staticmethod
+    def _commit(batch, batch_owners, conflicted):
+        try:
+            batch.commit()
+        except FailedPrecondition:
+            conflicted.extend(batch_owners)
+            return 0
+        return len(batch_owners)
@@ -0,0 +1,264 @@
+import bisect
+import logging
+import threading
+
+from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.tenant_store import TENANTS_COLLECTION, has_legacy_tenants, public_tenant
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def serialize_order(uid, order_data, tenants, default_status=''):
+    """
+    Shape a house_owners document and its tenants for the order listings UI
+
+    tenants is in tenant_index order; None marks a tenant that could not be read.
+    """
+    ui_order = {
+        'uid': uid,
+        'owner': {
+            'first_name': order_data.get('first_name', ''),
+            'last_name': order_data.get('last_name', ''),
+            'email': order_data.get('email', ''),
+            'mobile_number': order_data.get('mobile_number', ''),
+            'address': order_data.get('address', '')
+        },
+        'order_info': {
+            'order_status': order_data.get('order_status', default_status),
+            'order_date_time': order_data.get('order_date_time', '')
+        },
+        'tenants': []
+    }
+
+    # Process tenants with editable product_ids
+    for i, tenant in enumerate(tenants):
+        if not isinstance(tenant, dict):
+            continue
+        ui_order['tenants'].append({
+            'tenant_index': i,  # For tracking which tenant is updated
+            'name': tenant.get('name', ''),
+            'email': tenant.get('email', ''),
+            'address': tenant.get('address', '')
+        })
+
+    return ui_order
+
+
+class OrderEntry:
+    """A house_owners document as the order listings serve it"""
+
+    __slots__ = ('id', 'order_status', 'update_time', 'order')
+
+    def __init__(self, uid, order_status, update_time, order):
+        self.id = uid
+        self.order_status = order_status
+        # Newest update_time of the owner and its tenants documents: the version of the served order
+        self.update_time = update_time
+        self.order = order
+
+
+class OrderIndex:
+    """
+    Per-worker materialized view of house_owners and their tenants, grouped by order_status.
+
+    Two on_snapshot listeners keep it current, one on house_owners and one on
+    the tenants collection. Every order is stored already serialized for the
+    UI, together with its tenants, and each status keeps its uids sorted. A
+    page is therefore a bisect plus a slice, with no Firestore read. Pages come
+    out in the same order and with the same cursors as the direct query.
+
+    Staleness: while both listeners are healthy, a read reflects every change
+    Firestore has pushed to them, normally within a second of the write.
+    Orders this worker updates are written through at once. page() returns
+    None until both first snapshots have loaded, and whenever a listener has
+    stopped. The caller then queries Firestore directly, so the view is never
+    served from a dead listener.
+    """
+
+    def __init__(self, firestore_db):
+        self._db = firestore_db
+        self._lock = threading.Lock()
+        self._owners_ready = threading.Event()
+        self._tenants_ready = threading.Event()
+        self._owners_watch = None
+        self._tenants_watch = None
+        self._owners = {}  # uid -> (order_data, update_time)
+        self._tenants = {}  # owner uid -> {tenant_index: (tenant, update_time)}
+        self._tenant_keys = {}  # tenants document ID -> (owner uid, tenant_index)
+        self._entries = {}  # uid -> OrderEntry
+        self._uids_by_status = {}  # order_status -> sorted uids
+
+    def start(self):
+        """Start (or restart) the house_owners and tenants listeners"""
+        with self._lock:
+            if self._active(self._owners_watch) and self._active(self._tenants_watch):
+                return
+            self._stop_watches()
+            # Fresh listeners replay every document as ADDED, so rebuild from scratch
+            self._owners_ready.clear()
+            self._tenants_ready.clear()
+            self._owners = {}
+            self._tenants = {}
+            self._tenant_keys = {}
+            self._entries = {}
+            self._uids_by_status = {}
+            self._owners_watch = self._db.collection('house_owners').on_snapshot(self._on_owners_snapshot)
+            self._tenants_watch = self._db.collection(TENANTS_COLLECTION).on_snapshot(self._on_tenants_snapshot)
+            logger.info("Order index listeners started on house_owners and tenants")
+
+    @staticmethod
+    def _active(watch):
+        return watch is not None and watch.is_active
+
+    def _stop_watches(self):
+        for watch in (self._owners_watch, self._tenants_watch):
+            if watch is not None:
+                watch.unsubscribe()
+        self._owners_watch = None
+        self._tenants_watch = None
+
+    def stop(self):
+        with self._lock:
+            self._stop_watches()
+
+    @property
+    def healthy(self):
+        return (self._active(self._owners_watch) and self._active(self._tenants_watch)
+                and self._owners_ready.is_set() and self._tenants_ready.is_set())
+
+    def _on_owners_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                document = change.document
+                if change.type.name == 'REMOVED':
+                    self._owners.pop(document.id, None)
+                    self._remove(document.id)
+                else:
+                    self._apply(document.id, document.to_dict() or {}, document.update_time)
+
+        if not self._owners_ready.is_set():
+            logger.info(f"Order index loaded {len(self._owners)} orders")
+            self._owners_ready.set()
+
+    def _on_tenants_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            changed_owners = set()
+            for change in changes:
+                document = change.document
+                key = self._tenant_keys.pop(document.id, None)
+                if key is not None:
+                    self._tenants.get(key[0], {}).pop(key[1], None)
+                    changed_owners.add(key[0])
+                if change.type.name == 'REMOVED':
+                    continue
+
+                record = document.to_dict() or {}
+                owner_uid, tenant_index = record.get('owner_uid'), record.get('tenant_index')
+                if owner_uid is None or not isinstance(tenant_index, int):
+                    continue
+                self._tenants.setdefault(owner_uid, {})[tenant_index] = (public_tenant(record), document.update_time)
+                self._tenant_keys[document.id] = (owner_uid, tenant_index)
+                changed_owners.add(owner_uid)
+
+            for owner_uid in changed_owners:
+                self._rebuild(owner_uid)
+
+        if not self._tenants_ready.is_set():
+            logger.info(f"Order index loaded tenants of {len(self._tenants)} owners")
+            self._tenants_ready.set()
+
+    def _apply(self, uid, order_data, update_time):
+        current = self._owners.get(uid)
+        # A write-through may already hold a newer version than this event
+        if current is not None and update_time is not None and current[1] > update_time:
+            return
+        self._owners[uid] = (order_data, update_time)
+        self._rebuild(uid)
+
+    def _rebuild(self, uid):
+        """Re-serialize one order from its owner data and the tenants documents seen so far"""
+        self._remove(uid)
+        if uid not in self._owners:
+            return
+        order_data, update_time = self._owners[uid]
+        order_status = order_data.get('order_status')
+        if order_status is None:
+            return
+
+        if has_legacy_tenants(order_data):
+            tenants = order_data['tenants']
+        else:
+            tenants = [None] * int(order_data.get('tenant_count') or 0)
+            for tenant_index, (tenant, tenant_update_time) in self._tenants.get(uid, {}).items():
+                if 0 <= tenant_index < len(tenants):
+                    tenants[tenant_index] = tenant
+                    if update_time is None or tenant_update_time > update_time:
+                        update_time = tenant_update_time
+
+        self._entries[uid] = OrderEntry(uid, order_status, update_time, serialize_order(uid, order_data, tenants))
+        bisect.insort(self._uids_by_status.setdefault(order_status, []), uid)
+
+    def _remove(self, uid):
+        entry = self._entries.pop(uid, None)
+        if entry is None:
+            return
+        uids = self._uids_by_status[entry.order_status]
+        del uids[bisect.bisect_left(uids, uid)]
+
+    def page(self, order_status, limit, cursor=None):
+        """
+        Return up to limit + 1 OrderEntries with order_status after cursor, ordered by uid
+
+        Returns None if the view cannot be trusted yet; query Firestore instead.
+        """
+        if not self._active(self._owners_watch) or not self._active(self._tenants_watch):
+            self.start()
+        if not self.healthy:
+            return None
+
+        with self._lock:
+            uids = self._uids_by_status.get(order_status, [])
+            start = bisect.bisect_right(uids, cursor) if cursor else 0
+            return [self._entries[uid] for uid in uids[start:start + limit + 1]]
+
+    def count(self, order_status):
+        """Return how many orders have order_status, or None if the view cannot be trusted yet"""
+        if not self._active(self._owners_watch) or not self._active(self._tenants_watch):
+            self.start()
+        if not self.healthy:
+            return None
+
+        with self._lock:
+            return len(self._uids_by_status.get(order_status, ()))
+
+    def put(self, uid, order_data, update_time):
+        """Write-through after this worker updated an order's house_owners document"""
+        with self._lock:
+            self._apply(uid, order_data, update_time)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_order_index():
+    """Return this worker's OrderIndex, creating and starting it on first use"""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _, firestore_db = initialize_firebase()
+                index = OrderIndex(firestore_db)
+                index.start()
+                _index = index
+
+    return _index
+
+
+def put_order(uid, order_data, update_time):
+    """Write an updated order through to this worker's OrderIndex, if it has one"""
+    if _index is not None:
+        _index.put(uid, order_data, update_time)
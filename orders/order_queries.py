@@ -0,0 +1,136 @@
+import base64
+import json
+from datetime import datetime
+
+# Order statuses the listings and counts accept
+ORDER_STATUSES = ('pending', 'completed')
+
+# Sort orders a listing can ask for; a leading "-" means newest first
+ORDER_SORTS = ('uid', 'order_date_time', '-order_date_time')
+
+# The only house_owners fields the order listings use
+ORDER_LIST_FIELDS = [
+    'first_name', 'last_name', 'email', 'mobile_number', 'address',
+    'order_status', 'order_date_time', 'tenants', 'tenant_count',
+]
+
+
+class OrderFilter:
+    """
+    Status filter, order_date_time range and sort of an order listing.
+
+    order_date_time is stored as a "YYYY-MM-DD HH:MM:SS" string, so the date
+    range is a pair of string bounds. Orders without an order_date_time are
+    left out of date-sorted and date-ranged listings, because Firestore
+    only returns documents that have the ordered field.
+    """
+
+    __slots__ = ('order_status', 'date_from', 'date_to', 'sort')
+
+    def __init__(self, order_status=None, date_from=None, date_to=None, sort='uid'):
+        self.order_status = order_status
+        self.date_from = date_from
+        self.date_to = date_to
+        self.sort = sort
+
+    @classmethod
+    def from_params(cls, params, order_status=None):
+        """
+        Build a filter from status, from, to and sort query parameters
+
+        Returns (order_filter, error). from and to are inclusive YYYY-MM-DD
+        dates. A date range needs a date sort, which it defaults to.
+        """
+        order_status = params.get('status') or order_status
+        if order_status is not None and order_status not in ORDER_STATUSES:
+            return None, f"status must be one of: {', '.join(ORDER_STATUSES)}"
+
+        bounds = []
+        for name, time_of_day in (('from', '00:00:00'), ('to', '23:59:59')):
+            value = params.get(name)
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    return None, f'Invalid {name} date. Expected YYYY-MM-DD'
+                value = f"{value} {time_of_day}"
+            bounds.append(value or None)
+        date_from, date_to = bounds
+
+        has_range = date_from is not None or date_to is not None
+        sort = params.get('sort') or ('-order_date_time' if has_range else 'uid')
+        if sort not in ORDER_SORTS:
+            return None, f"sort must be one of: {', '.join(ORDER_SORTS)}"
+        if has_range and sort == 'uid':
+            return None, 'A from/to date range needs sort=order_date_time or sort=-order_date_time'
+
+        return cls(order_status, date_from, date_to, sort), None
+
+    @property
+    def key(self):
+        """Identifies the listing, e.g. for ETags"""
+        return f"{self.order_status}:{self.date_from}:{self.date_to}:{self.sort}"
+
+    @property
+    def by_uid(self):
+        return self.sort == 'uid'
+
+    def query(self, firestore_db):
+        """The filtered house_owners query, without ordering"""
+        query = firestore_db.collection('house_owners')
+        if self.order_status is not None:
+            query = query.where('order_status', '==', self.order_status)
+        if self.date_from is not None:
+            query = query.where('order_date_time', '>=', self.date_from)
+        if self.date_to is not None:
+            query = query.where('order_date_time', '<=', self.date_to)
+        return query
+
+    def page_query(self, firestore_db, limit, cursor=None, fields=ORDER_LIST_FIELDS):
+        """
+        Query one page of the listing after cursor
+
+        Ties on order_date_time are broken by document ID, so every order has a
+        stable position and a cursor. One extra document is read to tell
+        whether another page exists.
+        """
+        query = self.query(firestore_db).select(fields)
+        if self.by_uid:
+            query = query.order_by('__name__')
+        else:
+            direction = 'DESCENDING' if self.sort.startswith('-') else 'ASCENDING'
+            query = query.order_by('order_date_time', direction=direction).order_by('__name__', direction=direction)
+
+        if cursor:
+            query = query.start_after(self.decode_cursor(cursor))
+        return query.limit(limit + 1)
+
+    def count(self, firestore_db):
+        """Count the matching orders with an aggregation query, without reading the documents"""
+        result = self.query(firestore_db).count(alias='count').get()
+        return int(result[0][0].value)
+
+    async def acount(self, async_db):
+        """count() for a Firestore AsyncClient"""
+        result = await self.query(async_db).count(alias='count').get()
+        return int(result[0][0].value)
+
+    def cursor_for(self, doc):
+        """The cursor that resumes the listing after doc"""
+        if self.by_uid:
+            return doc.id
+        position = [doc.to_dict().get('order_date_time'), doc.id]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Turn a cursor from cursor_for back into start_after values; raises ValueError if it is malformed"""
+        if self.by_uid:
+            return {'__name__': cursor}
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            order_date_time, uid = json.loads(base64.urlsafe_b64decode(padded))
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        if not isinstance(order_date_time, str) or not isinstance(uid, str):
+            raise ValueError('Invalid cursor')
+        return {'order_date_time': order_date_time, '__name__': uid}
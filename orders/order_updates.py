@@ -0,0 +1,209 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import logging
+
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud.firestore_v1.bulk_batch import BulkWriteBatch
+from google.rpc import code_pb2
+
+from TenantVoltAPI.metrics import instrument_firestore, unwrap_firestore
+from TenantVoltAPI.profile_cache import invalidate_profile
+from TenantVoltAPI.tenant_store import has_legacy_tenants, legacy_migration, tenant_ref
+from orders.order_index import put_order
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Firestore accepts at most 500 writes per commit
+FIRESTORE_BATCH_LIMIT = 500
+
+# Rounds of re-reading legacy owners whose tenants array changed between our read and our write
+MAX_CONFLICT_RETRIES = 3
+
+# Client type -> the class of its non-atomic batches, for clients that are not google.cloud.firestore's
+_bulk_batch_classes = {}
+
+
+def register_bulk_batch(client_type, batch_class):
+    """Build the bulk batches of clients of client_type as batch_class(client), the way BulkWriteBatch(client) is"""
+    _bulk_batch_classes[client_type] = batch_class
+
+
+def _bulk_batch(firestore_db):
+    client = unwrap_firestore(firestore_db)
+    return instrument_firestore(_bulk_batch_classes.get(type(client), BulkWriteBatch)(client))
+
+
+def product_id_assignments(tenant_updates, tenant_count):
+    """Return {tenant_index: product_id} for the entries of tenant_updates that name an existing tenant"""
+    assignments = {}
+    for update in tenant_updates:
+        tenant_index = update.get('tenant_index')
+        product_id = update.get('product_id')
+
+        # Validate index and product_id
+        if tenant_index is not None and product_id is not None:
+            # Check if the index is valid
+            if isinstance(tenant_index, int) and 0 <= tenant_index < tenant_count:
+                assignments[tenant_index] = product_id
+
+    return assignments
+
+
+def tenant_assignment_writes(firestore_db, uid, owner_data, tenant_updates):
+    """
+    Return (writes, owner_fields, order_data) that give an owner's tenants their product_ids
+
+    writes are (method, reference, data) tuples, where method is 'set' or
+    'update'. A migrated owner gets one product_id field update per assigned
+    tenants document. An owner still on the legacy array layout is migrated
+    on the way: every tenants document is written with its assignment applied,
+    and owner_fields drop the array from the owner document. Commit owner_fields
+    with a precondition on the owner's update_time. order_data is the owner as
+    the order listings should now show it.
+    """
+    if has_legacy_tenants(owner_data):
+        tenants = owner_data['tenants']
+        for tenant_index, product_id in product_id_assignments(tenant_updates, len(tenants)).items():
+            if isinstance(tenants[tenant_index], dict):
+                tenants[tenant_index]['product_id'] = product_id
+
+        tenant_sets, owner_fields = legacy_migration(firestore_db, uid, owner_data)
+        writes = [('set', reference, record) for reference, record in tenant_sets]
+        return writes, owner_fields, owner_data
+
+    assignments = product_id_assignments(tenant_updates, int(owner_data.get('tenant_count') or 0))
+    writes = [
+        ('update', tenant_ref(firestore_db, uid, tenant_index), {'product_id': product_id})
+        for tenant_index, product_id in assignments.items()
+    ]
+    return writes, {}, owner_data
+
+
+def _commit_bulk(firestore_db, writes):
+    """
+    Commit (uid, method, reference, data) writes in chunks of FIRESTORE_BATCH_LIMIT
+
+    Uses the non-atomic BatchWrite RPC, so one failing order does not fail the
+    others. Returns (code, message, update_time) for each write, in order.
+    """
+    statuses = []
+    for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+        chunk = writes[start:start + FIRESTORE_BATCH_LIMIT]
+        batch = _bulk_batch(firestore_db)
+        for _, method, reference, data in chunk:
+            getattr(batch, method)(reference, data)
+
+        try:
+            response = batch.commit()
+        except Exception as e:
+            logger.error(f"Bulk order update commit failed: {str(e)}")
+            statuses.extend((code_pb2.UNKNOWN, str(e), None) for _ in chunk)
+            continue
+
+        for status, write_result in zip(response.status, response.write_results):
+            statuses.append((status.code, status.message, write_result.update_time))
+
+    return statuses
+
+
+def bulk_complete_orders(firestore_db, updates):
+    """
+    Mark many orders completed and assign their tenants' product_ids
+
+    updates is a list of (uid, tenant_updates) with unique uids. Orders with no
+    tenant_updates only get order_status and completed_at set, which needs no
+    read. Orders with tenant_updates are read in one get_all for their
+    tenant_count, and each assignment is a single tenants document update;
+    these writes go out in non-atomic bulk batches.
+
+    An owner still on the legacy tenants array is migrated on the way, in its
+    own atomic batch as update_order_status does, with a precondition on the
+    update_time that was read. Its tenants documents are then written only
+    together with the owner update that drops the array, never next to an
+    array that is still there. An owner edited in between is re-read and
+    retried instead of overwriting the concurrent change.
+
+    Returns {uid: error}, where error is None for orders that were updated.
+    """
+    collection = firestore_db.collection('house_owners')
+    completion = {
+        'completed_at': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
+        'order_status': 'completed',
+    }
+
+    outcomes = {}
+    writes = [(uid, 'update', collection.document(uid), dict(completion))
+              for uid, tenant_updates in updates if not tenant_updates]
+    pending = {uid: tenant_updates for uid, tenant_updates in updates if tenant_updates}
+    order_data_by_uid = {}
+
+    for _ in range(MAX_CONFLICT_RETRIES):
+        migrations = []
+        if pending:
+            for snapshot in firestore_db.get_all([collection.document(uid) for uid in pending]):
+                uid = snapshot.id
+                if not snapshot.exists:
+                    outcomes[uid] = f'No house owner found with UID: {uid}'
+                    continue
+
+                tenant_writes, owner_fields, order_data_by_uid[uid] = tenant_assignment_writes(
+                    firestore_db, uid, snapshot.to_dict(), pending[uid])
+                if owner_fields:
+                    migrations.append((snapshot, tenant_writes, {**completion, **owner_fields}))
+                    continue
+                writes.extend((uid, method, reference, data) for method, reference, data in tenant_writes)
+                writes.append((uid, 'update', snapshot.reference, dict(completion)))
+
+        for (uid, _, reference, _), (code, message, update_time) in zip(writes, _commit_bulk(firestore_db, writes)):
+            is_owner_write = reference.id == uid
+            if code == code_pb2.OK:
+                outcomes.setdefault(uid, None)
+                if is_owner_write and uid in order_data_by_uid:
+                    # Write through so this worker's next listing already shows the change
+                    put_order(uid, {**order_data_by_uid[uid], **completion}, update_time)
+            elif outcomes.get(uid) is None:
+                if code == code_pb2.NOT_FOUND:
+                    outcomes[uid] = f'No house owner found with UID: {uid}' if is_owner_write else \
+                        f'A tenant of house owner {uid} is missing'
+                else:
+                    outcomes[uid] = message or 'Update failed'
+
+        conflicts = {}
+        for snapshot, tenant_writes, owner_update in migrations:
+            uid = snapshot.id
+            try:
+                update_time = _commit_migration(firestore_db, snapshot, tenant_writes, owner_update)
+            except FailedPrecondition:
+                conflicts[uid] = pending[uid]
+                continue
+            except Exception as e:
+                logger.error(f"Bulk order update: migrating house owner {uid} failed: {str(e)}")
+                outcomes[uid] = str(e)
+                continue
+            outcomes[uid] = None
+            put_order(uid, {**order_data_by_uid[uid], **completion}, update_time)
+
+        for uid in {write[0] for write in writes} | {snapshot.id for snapshot, _, _ in migrations}:
+            invalidate_profile(uid)
+
+        writes = []
+        pending = conflicts
+        if not pending:
+            break
+
+    for uid in pending:
+        outcomes[uid] = 'Order was modified concurrently; retry the update'
+
+    return outcomes
+
+
+def _commit_migration(firestore_db, snapshot, tenant_writes, owner_update):
+    """Commit a legacy owner's tenants documents and owner update atomically; returns the owner's update_time"""
+    batch = firestore_db.batch()
+    for method, reference, data in tenant_writes:
+        getattr(batch, method)(reference, data)
+    batch.update(snapshot.reference, owner_update,
+                 option=firestore_db.write_option(last_update_time=snapshot.update_time))
+    return batch.commit()[-1].update_time
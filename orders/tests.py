@@ -0,0 +1,310 @@
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from benchmarks.memory_firestore import AsyncMemoryClient, MemoryClient, MemoryStore
+from orders import order_updates, views
+from orders.management.commands import migrate_tenants
+from orders.order_index import OrderIndex
+from orders.order_queries import OrderFilter
+from orders.order_updates import bulk_complete_orders
+
+
+class BulkCompleteOrdersTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.owners = self.db.collection('house_owners')
+        self.tenants = self.db.collection('tenants')
+
+    def add_legacy_owner(self, uid, tenants=2):
+        self.owners.document(uid).set({
+            'first_name': 'Owner', 'last_name': uid, 'address': '1 Main St', 'order_status': 'pending',
+            'tenants': [{'name': f'Tenant {i}', 'email': f't{i}@example.com'} for i in range(tenants)],
+        })
+
+    def add_migrated_owner(self, uid, tenants=2):
+        self.owners.document(uid).set({'first_name': 'Owner', 'order_status': 'pending', 'tenant_count': tenants})
+        for i in range(tenants):
+            self.tenants.document(f'{uid}_{i}').set({'name': f'Tenant {i}', 'owner_uid': uid, 'tenant_index': i})
+
+    def owner(self, uid):
+        return self.owners.document(uid).get().to_dict()
+
+    def tenant_ids(self):
+        return sorted(snapshot.id for snapshot in self.tenants.stream())
+
+    def test_migrated_owner_gets_its_product_ids(self):
+        self.add_migrated_owner('m1')
+        outcomes = bulk_complete_orders(self.db, [('m1', [{'tenant_index': 1, 'product_id': '1112'}]), ('none', [])])
+        self.assertIsNone(outcomes['m1'])
+        self.assertEqual(self.owner('m1')['order_status'], 'completed')
+        self.assertEqual(self.tenants.document('m1_1').get().get('product_id'), '1112')
+        self.assertEqual(outcomes['none'], 'No house owner found with UID: none')
+
+    def test_legacy_owner_is_migrated_with_its_assignments(self):
+        self.add_legacy_owner('l1')
+        outcomes = bulk_complete_orders(self.db, [('l1', [{'tenant_index': 0, 'product_id': '2221'}])])
+        self.assertIsNone(outcomes['l1'])
+        owner = self.owner('l1')
+        self.assertNotIn('tenants', owner)
+        self.assertEqual((owner['tenant_count'], owner['order_status']), (2, 'completed'))
+        self.assertEqual(self.tenant_ids(), ['l1_0', 'l1_1'])
+        self.assertEqual(self.tenants.document('l1_0').get().get('product_id'), '2221')
+
+    def test_legacy_owner_edited_once_is_re_read_and_retried(self):
+        self.add_legacy_owner('l1')
+        assignment_writes = order_updates.tenant_assignment_writes
+        edits = []
+
+        def edited_once(firestore_db, uid, owner_data, tenant_updates):
+            writes = assignment_writes(firestore_db, uid, owner_data, tenant_updates)
+            if not edits:
+                edits.append(uid)
+                self.owners.document(uid).update({'address': '2 Side St'})
+            return writes
+
+        with mock.patch.object(order_updates, 'tenant_assignment_writes', edited_once):
+            outcomes = bulk_complete_orders(self.db, [('l1', [{'tenant_index': 1, 'product_id': '2222'}])])
+        self.assertIsNone(outcomes['l1'])
+        self.assertEqual(self.tenants.document('l1_1').get().get('owner_address'), '2 Side St')
+        self.assertEqual(self.tenants.document('l1_1').get().get('product_id'), '2222')
+
+    def test_legacy_owner_that_keeps_changing_writes_no_tenants(self):
+        self.add_legacy_owner('l1')
+        self.add_migrated_owner('m1')
+        assignment_writes = order_updates.tenant_assignment_writes
+
+        def always_edited(firestore_db, uid, owner_data, tenant_updates):
+            writes = assignment_writes(firestore_db, uid, owner_data, tenant_updates)
+            if uid == 'l1':
+                self.owners.document(uid).update({'address': '2 Side St'})
+            return writes
+
+        with mock.patch.object(order_updates, 'tenant_assignment_writes', always_edited):
+            outcomes = bulk_complete_orders(self.db, [
+                ('l1', [{'tenant_index': 0, 'product_id': '2221'}]),
+                ('m1', [{'tenant_index': 0, 'product_id': '1111'}]),
+            ])
+        self.assertEqual(outcomes['l1'], 'Order was modified concurrently; retry the update')
+        self.assertIsNone(outcomes['m1'])
+        # No tenants documents next to the array that is still there
+        self.assertEqual(self.tenant_ids(), ['m1_0', 'm1_1'])
+        self.assertEqual(len(self.owner('l1')['tenants']), 2)
+        self.assertEqual(self.owner('l1')['order_status'], 'pending')
+
+
+class MigrateTenantsTests(SimpleTestCase):
+    def setUp(self):
+        self.db = MemoryClient(MemoryStore())
+        self.owners = self.db.collection('house_owners')
+        self.state = self.db.collection('migrations').document('tenants')
+        patcher = mock.patch.object(migrate_tenants, 'initialize_firebase', return_value=(None, self.db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_legacy_owner(self, uid):
+        self.owners.document(uid).set({
+            'first_name': 'Owner', 'address': '1 Main St', 'tenants': [{'name': 'Tenant', 'product_id': f'{uid}1'}],
+        })
+
+    def migrate(self, **options):
+        call_command('migrate_tenants', stdout=StringIO(), stderr=StringIO(), **options)
+        return self.state.get().to_dict()
+
+    def is_legacy(self, uid):
+        return 'tenants' in self.owners.document(uid).get().to_dict()
+
+    def test_run_resumes_after_its_checkpoint(self):
+        for uid in ('a', 'b', 'c'):
+            self.add_legacy_owner(uid)
+        self.state.set({'last_uid': 'b', 'migrated': 2, 'skipped': 1, 'complete': False})
+
+        state = self.migrate(page_size=1)
+        self.assertEqual([self.is_legacy(uid) for uid in ('a', 'b', 'c')], [True, True, False])
+        self.assertEqual((state['migrated'], state['skipped'], state['complete']), (3, 1, False))
+
+    def test_owner_edited_during_its_migration_is_re_read(self):
+        self.add_legacy_owner('a')
+        legacy_migration = migrate_tenants.legacy_migration
+        edits = []
+
+        def edited_once(firestore_db, owner_uid, owner_data):
+            writes = legacy_migration(firestore_db, owner_uid, owner_data)
+            if not edits:
+                edits.append(owner_uid)
+                self.owners.document(owner_uid).update({'address': '2 Side St'})
+            return writes
+
+        with mock.patch.object(migrate_tenants, 'legacy_migration', edited_once):
+            state = self.migrate()
+        self.assertFalse(self.is_legacy('a'))
+        self.assertEqual(self.db.collection('tenants').document('a_0').get().get('owner_address'), '2 Side St')
+        self.assertEqual((state['migrated'], state['complete']), (1, True))
+
+    def test_migration_is_complete_only_without_skipped_owners(self):
+        self.add_legacy_owner('a')
+        self.add_legacy_owner('b')
+        legacy_migration = migrate_tenants.legacy_migration
+
+        def always_edited(firestore_db, owner_uid, owner_data):
+            writes = legacy_migration(firestore_db, owner_uid, owner_data)
+            if owner_uid == 'a':
+                self.owners.document(owner_uid).update({'address': '2 Side St'})
+            return writes
+
+        with mock.patch.object(migrate_tenants, 'legacy_migration', always_edited):
+            state = self.migrate(page_size=1)
+        self.assertEqual((state['migrated'], state['skipped'], state['complete']), (1, 1, False))
+        self.assertTrue(self.is_legacy('a'))
+
+        state = self.migrate()
+        self.assertFalse(self.is_legacy('a'))
+        self.assertEqual((state['migrated'], state['skipped'], state['complete']), (2, 0, True))
+
+
+class OrderListingTests(SimpleTestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+        self.db = MemoryClient(self.store)
+        self.owners = self.db.collection('house_owners')
+        patcher = mock.patch.object(views, 'get_async_firestore', side_effect=lambda: AsyncMemoryClient(self.store))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.use_firestore()
+
+    def use_firestore(self):
+        unhealthy = mock.Mock()
+        unhealthy.page.return_value = None
+        self.use_index(unhealthy)
+
+    def use_index(self, index):
+        patcher = mock.patch.object(views, 'get_order_index', return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_index(self):
+        index = OrderIndex(MemoryClient(self.store))
+        index.start()
+        self.addCleanup(index.stop)
+        for _ in range(100):
+            if index.healthy:
+                break
+            time.sleep(0.01)
+        self.use_index(index)
+        return index
+
+    def add_owner(self, uid, order_status='pending', tenants=1, legacy=False, order_date_time='2025-02-01 10:00:00'):
+        owner = {'first_name': 'Owner', 'last_name': uid, 'order_status': order_status,
+                 'order_date_time': order_date_time}
+        if legacy:
+            owner['tenants'] = [{'name': f'Tenant {i}', 'email': f't{i}@example.com'} for i in range(tenants)]
+        else:
+            owner['tenant_count'] = tenants
+            for i in range(tenants):
+                self.db.collection('tenants').document(f'{uid}_{i}').set(
+                    {'name': f'Tenant {i}', 'email': f't{i}@example.com', 'owner_uid': uid, 'tenant_index': i})
+        self.owners.document(uid).set(owner)
+
+    async def get(self, url, etag=None):
+        return await self.async_client.get(url, headers={'If-None-Match': etag} if etag else {})
+
+    def test_cursor_round_trips_for_each_sort(self):
+        self.add_owner('a')
+        doc = self.owners.document('a').get()
+        for sort in ('uid', 'order_date_time', '-order_date_time'):
+            order_filter = OrderFilter(sort=sort)
+            position = order_filter.decode_cursor(order_filter.cursor_for(doc))
+            self.assertEqual(position['__name__'], 'a')
+        self.assertEqual(position['order_date_time'], '2025-02-01 10:00:00')
+        with self.assertRaises(ValueError):
+            OrderFilter(sort='order_date_time').decode_cursor('not-a-cursor')
+
+    async def test_invalid_cursor_and_limit_are_rejected(self):
+        response = await self.get('/api/orders/?sort=order_date_time&cursor=not-a-cursor')
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'Invalid cursor'))
+        response = await self.get('/api/orders/pending/?limit=501')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_pages_default_to_100_orders_with_a_next_cursor(self):
+        for i in range(101):
+            self.add_owner(f'o{i:03}', tenants=0)
+        first = (await self.get('/api/orders/pending/')).json()
+        self.assertEqual((first['count'], first['next_cursor']), (100, 'o099'))
+        rest = (await self.get(f"/api/orders/pending/?cursor={first['next_cursor']}")).json()
+        self.assertEqual(([order['uid'] for order in rest['orders']], rest['next_cursor']), (['o100'], None))
+
+    async def test_date_sorted_pages_follow_their_cursor(self):
+        for i in range(3):
+            self.add_owner(f'o{i}', order_date_time=f'2025-02-0{i + 1} 10:00:00')
+        first = (await self.get('/api/orders/?sort=-order_date_time&limit=2')).json()
+        self.assertEqual([order['uid'] for order in first['orders']], ['o2', 'o1'])
+        rest = (await self.get(f"/api/orders/?sort=-order_date_time&limit=2&cursor={first['next_cursor']}")).json()
+        self.assertEqual(([order['uid'] for order in rest['orders']], rest['next_cursor']), (['o0'], None))
+
+    async def test_unchanged_page_is_not_modified(self):
+        self.add_owner('a')
+        self.add_owner('b', legacy=True)
+        response = await self.get('/api/orders/pending/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        not_modified = await self.get('/api/orders/pending/', etag=etag)
+        self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, etag))
+
+        self.db.collection('tenants').document('a_0').update({'name': 'Renamed'})
+        changed = await self.get('/api/orders/pending/', etag=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['orders'][0]['tenants'][0]['name'], 'Renamed')
+
+    async def test_index_pages_match_the_firestore_query(self):
+        for i in range(5):
+            self.add_owner(f'o{i}', tenants=2, legacy=i == 3)
+        self.add_owner('done', order_status='completed')
+        self.db.collection('tenants').document('o1_1').update({'name': 'Renamed'})
+
+        from_firestore = [await self.get('/api/orders/pending/?limit=2'),
+                          await self.get('/api/orders/pending/?limit=2&cursor=o1')]
+        index = await sync_to_async(self.start_index)()
+        with mock.patch.object(index, 'page', wraps=index.page) as page:
+            from_index = [await self.get('/api/orders/pending/?limit=2'),
+                          await self.get('/api/orders/pending/?limit=2&cursor=o1')]
+        self.assertEqual(page.call_count, 2)
+
+        for firestore_page, index_page in zip(from_firestore, from_index):
+            self.assertEqual(index_page.json(), firestore_page.json())
+            self.assertEqual(index_page['ETag'], firestore_page['ETag'])
+            self.assertEqual(index_page['Last-Modified'], firestore_page['Last-Modified'])
+        not_modified = await self.get('/api/orders/pending/?limit=2', etag=from_firestore[0]['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class UpdateOrderStatusTests(SimpleTestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+        self.db = MemoryClient(self.store)
+        self.db.collection('house_owners').document('m1').set({'order_status': 'pending', 'tenant_count': 1})
+        self.db.collection('tenants').document('m1_0').set({'name': 'Tenant', 'owner_uid': 'm1', 'tenant_index': 0})
+        patcher = mock.patch.object(views, 'get_async_firestore', side_effect=lambda: AsyncMemoryClient(self.store))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, body):
+        return await self.async_client.post('/api/orders/update-status/', body, content_type='application/json')
+
+    async def test_tenants_must_be_a_list_of_objects(self):
+        for tenants in ('1112', [1112], {'tenant_index': 0}):
+            response = await self.post({'uid': 'm1', 'tenants': tenants})
+            self.assertEqual((response.status_code, response.json()['message']),
+                             (400, 'tenants must be a list of objects'))
+        self.assertEqual(self.db.collection('house_owners').document('m1').get().get('order_status'), 'pending')
+
+    async def test_order_is_completed_with_its_product_ids(self):
+        response = await self.post({'uid': 'm1', 'tenants': [{'tenant_index': 0, 'product_id': '1112'}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.collection('house_owners').document('m1').get().get('order_status'), 'completed')
+        self.assertEqual(self.db.collection('tenants').document('m1_0').get().get('product_id'), '1112')
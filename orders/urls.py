@@ -3,7 +3,10 @@ from orders import views
 
 # Define URL patterns for orders
 urlpatterns = [
+    path('', views.list_orders, name='list_orders'),
+    path('counts/', views.get_order_counts, name='get_order_counts'),
     path('pending/', views.get_pending_orders, name='get_pending_orders'),
     path('update-status/', views.update_order_status, name='update_order_status'),
+    path('update-status/batch/', views.update_order_status_batch, name='update_order_status_batch'),
     path('completed/', views.get_completed_orders, name='get_completed_orders'),
 ]
\ No newline at end of file
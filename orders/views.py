@@ -2,8 +2,18 @@ from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
+from google.api_core.exceptions import FailedPrecondition
+from TenantVoltAPI.firebase_async import get_async_firestore
 from TenantVoltAPI.firebase_config import initialize_firebase
+from TenantVoltAPI.profile_cache import invalidate_profile
+from TenantVoltAPI.tenant_store import aget_many_owner_tenants
+from orders.order_index import get_order_index, put_order, serialize_order
+from orders.order_queries import OrderFilter, ORDER_STATUSES
+from orders.order_updates import bulk_complete_orders, tenant_assignment_writes
+import hashlib
 import json
 import logging
 
@@ -11,11 +21,259 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Orders returned per page when no limit is given, and the most a client may ask for
+DEFAULT_ORDERS_PAGE_SIZE = 100
+MAX_ORDERS_PAGE_SIZE = 500
+
+# Upper bound on orders in one bulk update-status request
+MAX_BULK_ORDERS = 2000
+
+
+def _parse_page_params(request, order_filter):
+    """Return (limit, cursor, error) from the limit/cursor query parameters"""
+    cursor = request.GET.get('cursor') or None
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_ORDERS_PAGE_SIZE))
+    except ValueError:
+        return None, None, 'limit must be an integer'
+    if not 1 <= limit <= MAX_ORDERS_PAGE_SIZE:
+        return None, None, f'limit must be between 1 and {MAX_ORDERS_PAGE_SIZE}'
+    if cursor:
+        try:
+            order_filter.decode_cursor(cursor)
+        except ValueError:
+            return None, None, 'Invalid cursor'
+    return limit, cursor, None
+
+
+def _page_version(listing_key, limit, docs, tenant_versions=None):
+    """
+    Return (etag, last_modified) for a page of orders
+
+    docs are house_owners snapshots or OrderIndex entries. The ETag hashes every
+    order ID with its version, so it changes when an order on the page is edited
+    or an order joins or leaves the page. The version is the newest update_time
+    of the owner and its tenants documents: an entry's update_time already is,
+    and for snapshots tenant_versions holds the tenants' side. Both paths give
+    the same page the same ETag.
+    """
+    digest = hashlib.sha1(f"{listing_key}:{limit}".encode())
+    last_modified = None
+    for doc in docs:
+        update_time = doc.update_time
+        tenants_update_time = (tenant_versions or {}).get(doc.id)
+        if tenants_update_time is not None and tenants_update_time > update_time:
+            update_time = tenants_update_time
+        digest.update(f"|{doc.id}:{update_time.isoformat()}".encode())
+        updated = update_time.timestamp()
+        if last_modified is None or updated > last_modified:
+            last_modified = updated
+    return f'"{digest.hexdigest()}"', last_modified
+
+
+def _set_version_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Let clients keep the page but revalidate it on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def _not_modified_orders_page(request, firestore_db, order_filter, limit, cursor):
+    """
+    Return a 304 response if the client's If-None-Match still matches the page, else None
+
+    Only the fields that locate the tenants documents are read, plus the
+    tenants themselves for their update times, so an unchanged page costs no
+    serialization.
+    """
+    if not request.META.get('HTTP_IF_NONE_MATCH'):
+        return None
+    # A date-sorted page needs its order_date_time values to be ordered
+    fields = ['tenant_count', 'tenants'] if order_filter.by_uid else ['tenant_count', 'tenants', 'order_date_time']
+    docs = [doc async for doc in order_filter.page_query(firestore_db, limit, cursor, fields=fields).stream()]
+    tenant_versions = {}
+    await aget_many_owner_tenants(firestore_db, {doc.id: doc.to_dict() for doc in docs}, tenant_versions)
+    etag, last_modified = _page_version(order_filter.key, limit, docs, tenant_versions)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        _set_version_headers(response, etag, last_modified)
+    return response
+
+
+async def _orders_page_response(request, order_filter, limit, docs, serialize_page, tenant_versions=None):
+    """
+    Build the listing response for a page of up to limit + 1 documents
+
+    A matching If-None-Match is answered with 304 before anything is serialized.
+    """
+    etag, last_modified = _page_version(order_filter.key, limit, docs, tenant_versions)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        next_cursor = order_filter.cursor_for(docs[limit - 1]) if len(docs) > limit else None
+        orders = await serialize_page(docs[:limit])
+        response = JsonResponse({
+            'success': True,
+            'count': len(orders),
+            'orders': orders,
+            'next_cursor': next_cursor,
+        })
+    return _set_version_headers(response, etag, last_modified)
+
+
+async def _index_orders(page):
+    return [entry.order for entry in page]
+
+
+async def _list_orders(request, order_filter, limit, cursor):
+    """Answer an order listing from this worker's OrderIndex, or from Firestore when it cannot"""
+    # The index keeps each status in uid order, with no date range
+    if order_filter.order_status is not None and order_filter.by_uid:
+        entries = get_order_index().page(order_filter.order_status, limit, cursor)
+        if entries is not None:
+            return await _orders_page_response(request, order_filter, limit, entries, _index_orders)
+
+    firestore_db = get_async_firestore()
+
+    # Nothing changed since the client's copy: skip building the payload
+    not_modified = await _not_modified_orders_page(request, firestore_db, order_filter, limit, cursor)
+    if not_modified is not None:
+        return not_modified
+
+    default_status = order_filter.order_status or ''
+
+    docs = [doc async for doc in order_filter.page_query(firestore_db, limit, cursor).stream()]
+    # Every tenant on the page comes back in one get_all, with the update times the ETag needs
+    owners = {doc.id: doc.to_dict() for doc in docs}
+    tenant_versions = {}
+    tenants_by_owner = await aget_many_owner_tenants(firestore_db, owners, tenant_versions)
+
+    async def serialize_page(page):
+        return [serialize_order(doc.id, owners[doc.id], tenants_by_owner[doc.id], default_status) for doc in page]
+
+    return await _orders_page_response(request, order_filter, limit, docs, serialize_page, tenant_versions)
+
+
+@csrf_exempt
+async def list_orders(request):
+    """
+    Get a page of house_owners orders, filtered by status and order date
+
+    Query parameters:
+        status: "pending" or "completed"; omit for every order
+        from, to: inclusive order_date_time range, YYYY-MM-DD
+        sort: "uid" (default), "order_date_time" or "-order_date_time" (newest first);
+              a date range defaults to "-order_date_time" and cannot be sorted by uid
+        limit: orders per page, default 100, at most 500
+        cursor: next_cursor from the previous page; omit for the first page
+
+    Status listings sorted by uid come from the per-worker OrderIndex while its
+    listener is healthy, and every other listing from a Firestore query.
+    Responses carry an ETag and Last-Modified for the page. A request whose
+    If-None-Match matches the current ETag gets 304 Not Modified.
+
+    Expected Response: as for /api/orders/pending/
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    order_filter, error = OrderFilter.from_params(request.GET)
+    if not error:
+        limit, cursor, error = _parse_page_params(request, order_filter)
+    if error:
+        return JsonResponse({'success': False, 'error': error}, status=400)
+
+    try:
+        return await _list_orders(request, order_filter, limit, cursor)
+
+    except Exception as e:
+        logger.error(f"Error listing orders: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+async def get_order_counts(request):
+    """
+    Count orders per status without listing them
+
+    Each count is answered by the per-worker OrderIndex while its listener is
+    healthy and no date range is given. Otherwise it is one Firestore count()
+    aggregation, which never reads the documents themselves.
+
+    Query parameters:
+        status: comma-separated statuses to count; default "pending,completed"
+        from, to: inclusive order_date_time range, YYYY-MM-DD
+
+    Expected Response:
+    {
+        "success": true,
+        "counts": {
+            "pending": 12,
+            "completed": 48
+        }
+    }
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    statuses = [status for status in request.GET.get('status', ','.join(ORDER_STATUSES)).split(',') if status]
+    filters = []
+    for order_status in dict.fromkeys(statuses):
+        order_filter, error = OrderFilter.from_params(
+            {'status': order_status, 'from': request.GET.get('from'), 'to': request.GET.get('to')})
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        filters.append(order_filter)
+
+    if not filters:
+        return JsonResponse({'success': False, 'error': 'status must name at least one status'}, status=400)
+
+    try:
+        counts = {}
+        firestore_db = None
+        for order_filter in filters:
+            if order_filter.date_from is None and order_filter.date_to is None:
+                counts[order_filter.order_status] = get_order_index().count(order_filter.order_status)
+                if counts[order_filter.order_status] is not None:
+                    continue
+
+            if firestore_db is None:
+                firestore_db = get_async_firestore()
+            counts[order_filter.order_status] = await order_filter.acount(firestore_db)
+
+        return JsonResponse({
+            'success': True,
+            'counts': counts,
+        })
+
+    except Exception as e:
+        logger.error(f"Error counting orders: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
+
 
 @csrf_exempt
-def get_pending_orders(request):
+async def get_pending_orders(request):
     """
-    Get all house_owners documents with order_status = "pending"
+    Get a page of house_owners documents with order_status = "pending"
+
+    Query parameters:
+        limit: orders per page, default 100, at most 500
+        cursor: next_cursor from the previous page; omit for the first page
+
+    Same as GET /api/orders/?status=pending. Pages come from the per-worker
+    OrderIndex, kept current by a Firestore listener, and from a direct query
+    while the listener is unavailable.
+    Responses carry an ETag and Last-Modified for the page. A request whose
+    If-None-Match matches the current ETag gets 304 Not Modified.
 
     Expected Response:
     {
@@ -53,62 +311,21 @@ def get_pending_orders(request):
                     "last_name": "Doe",
                 }
             }
-        ]
+        ],
+        "next_cursor": "EtrTQxBuBlRh7OJgzVdhOy04cD83"
     }
     """
     if request.method != 'GET':
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
-    try:
-        # Initialize Firebase
-        _, firestore_db = initialize_firebase()
-
-        # Query house_owners where order_status is "Pending"
-        pending_orders = firestore_db.collection('house_owners').where('order_status', '==', 'pending').stream()
-
-        # Format the results for UI use
-        results = []
-        for order in pending_orders:
-            # Get the document data
-            order_data = order.to_dict()
-            uid = order.id
-
-            # Create a structured object for the UI
-            ui_order = {
-                'uid': uid,
-                'owner': {
-                    'first_name': order_data.get('first_name', ''),
-                    'last_name': order_data.get('last_name', ''),
-                    'email': order_data.get('email', ''),
-                    'mobile_number': order_data.get('mobile_number', ''),
-                    'address': order_data.get('address', '')
-                },
-                'order_info': {
-                    'order_status': order_data.get('order_status', 'pending'),
-                    'order_date_time': order_data.get('order_date_time', '')
-                },
-                'tenants': []
-            }
-
-            # Process tenants with editable product_ids
-            if 'tenants' in order_data and isinstance(order_data['tenants'], list):
-                for i, tenant in enumerate(order_data['tenants']):
-                    ui_tenant = {
-                        'tenant_index': i,  # For tracking which tenant is updated
-                        'name': tenant.get('name', ''),
-                        'email': tenant.get('email', ''),
-                        'address': tenant.get('address', '')
-                    }
-                    ui_order['tenants'].append(ui_tenant)
-
-            results.append(ui_order)
+    order_filter = OrderFilter('pending')
+    limit, cursor, error = _parse_page_params(request, order_filter)
+    if error:
+        return JsonResponse({'success': False, 'error': error}, status=400)
 
-        # Return the UI-friendly pending orders
-        return JsonResponse({
-            'success': True,
-            'count': len(results),
-            'orders': results,
-        })
+    try:
+        # Serve the page from memory, falling back to a Firestore query
+        return await _list_orders(request, order_filter, limit, cursor)
 
     except Exception as e:
         logger.error(f"Error getting pending orders: {str(e)}")
@@ -118,10 +335,14 @@ def get_pending_orders(request):
             'message': str(e)
         }, status=500)
 @csrf_exempt
-def update_order_status(request):
+async def update_order_status(request):
     """
     Update the order_status to "completed" and tenant product_ids
 
+    Each product_id assignment is a single write to tenants/{uid}_{tenant_index},
+    committed in one batch with the owner's status. An owner still holding a
+    legacy tenants array is migrated in that batch.
+
     Expected request body:
     {
         "uid": "firebase-user-id",
@@ -141,16 +362,15 @@ def update_order_status(request):
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
     try:
-        # Initialize Firebase
-        _, firestore_db = initialize_firebase()
+        firestore_db = get_async_firestore()
 
         # Read request body
         body_data = request.body
         data = json.loads(body_data.decode('utf-8'))
 
         # Get required fields
-        uid = data.get('uid')
-        tenant_updates = data.get('tenants', [])
+        uid = data.get('uid') if isinstance(data, dict) else None
+        tenant_updates = data.get('tenants', []) if isinstance(data, dict) else None
 
         # Validate inputs
         if not uid:
@@ -160,9 +380,16 @@ def update_order_status(request):
                 'message': 'uid is required'
             }, status=400)
 
+        if not isinstance(tenant_updates, list) or not all(isinstance(tenant, dict) for tenant in tenant_updates):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid tenants',
+                'message': 'tenants must be a list of objects'
+            }, status=400)
+
         # Check if user exists
         house_owner_ref = firestore_db.collection('house_owners').document(uid)
-        house_owner_doc = house_owner_ref.get()
+        house_owner_doc = await house_owner_ref.get()
 
         if not house_owner_doc.exists:
             return JsonResponse({
@@ -178,48 +405,175 @@ def update_order_status(request):
         update_data = {'completed_at': datetime.now(ZoneInfo("Asia/Colombo")).strftime("%Y-%m-%d %H:%M:%S"),
                        'order_status': 'completed'}
 
-        # Process tenant updates if tenants exist in the document
-        if tenant_updates and 'tenants' in current_data and isinstance(current_data['tenants'], list):
-            tenants = current_data['tenants']
+        # Each assigned product_id is a single tenants document update
+        tenant_writes, owner_fields, order_data = [], {}, current_data
+        if tenant_updates:
+            tenant_writes, owner_fields, order_data = tenant_assignment_writes(
+                firestore_db, uid, current_data, tenant_updates)
+
+        # Commit the owner and its tenants together; a legacy owner being
+        # migrated must not have changed since it was read
+        batch = firestore_db.batch()
+        for method, reference, write_data in tenant_writes:
+            getattr(batch, method)(reference, write_data)
+        option = firestore_db.write_option(last_update_time=house_owner_doc.update_time) if owner_fields else None
+        batch.update(house_owner_ref, {**update_data, **owner_fields}, option=option)
+        write_results = await batch.commit()
+
+        # Write through so this worker's next listing already shows the change
+        put_order(uid, {**order_data, **update_data}, write_results[-1].update_time)
+        invalidate_profile(uid)
 
-            # Update each tenant's product_id
-            for update in tenant_updates:
-                tenant_index = update.get('tenant_index')
-                product_id = update.get('product_id')
+        # Return success response with updated data
+        return JsonResponse({
+            'success': True,
+            'message': 'Order updated successfully'
+        })
 
-                # Validate index and product_id
-                if tenant_index is not None and product_id is not None:
-                    # Check if the index is valid
-                    if 0 <= tenant_index < len(tenants):
-                        # Update the product_id
-                        tenants[tenant_index]['product_id'] = product_id
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except FailedPrecondition:
+        return JsonResponse({
+            'success': False,
+            'error': 'Conflict',
+            'message': 'Order was modified concurrently; retry the update'
+        }, status=409)
+    except Exception as e:
+        logger.error(f"Error updating order: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': 'Server error',
+            'message': str(e)
+        }, status=500)
 
-            # Add updated tenants to the update data
-            update_data['tenants'] = tenants
+@csrf_exempt
+def update_order_status_batch(request):
+    """
+    Mark many orders completed and assign their tenant product_ids in one request
 
-        # Update the document in Firestore
-        house_owner_ref.update(update_data)
+    Orders without tenant updates are written without being read. Orders with
+    tenant updates are read together, and each assignment is a single tenants
+    document update. These writes go out in non-atomic batches of up to 500,
+    and each uid gets its own outcome. Owners still holding a legacy tenants
+    array are migrated in their own atomic batch with an update_time
+    precondition, so a concurrent edit is retried rather than overwritten.
+
+    Expected request body:
+    {
+        "orders": [
+            {
+                "uid": "624PPp7PXnf3zzjBxtFHntSZcOq1",
+                "tenants": [
+                    {"tenant_index": 0, "product_id": "1112"},
+                    {"tenant_index": 1, "product_id": "1113"}
+                ]
+            },
+            {"uid": "EtrTQxBuBlRh7OJgzVdhOy04cD83"}
+        ]
+    }
+
+    Response body:
+    {
+        "success": true,
+        "count": 2,
+        "updated": 1,
+        "failed": 1,
+        "results": [
+            {"index": 0, "uid": "624PPp7PXnf3zzjBxtFHntSZcOq1", "success": true},
+            {"index": 1, "uid": "EtrTQxBuBlRh7OJgzVdhOy04cD83", "success": false, "error": "No house owner found with UID: EtrTQxBuBlRh7OJgzVdhOy04cD83"}
+        ]
+    }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    try:
+        # Read request body
+        body_data = request.body
+        data = json.loads(body_data.decode('utf-8'))
+
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(orders, list) or not orders:
+            return JsonResponse({
+                'success': False,
+                'error': 'orders must be a non-empty list'
+            }, status=400)
+
+        if len(orders) > MAX_BULK_ORDERS:
+            return JsonResponse({
+                'success': False,
+                'error': f'At most {MAX_BULK_ORDERS} orders can be updated per request'
+            }, status=400)
+
+        # Validate every item; each uid may appear only once
+        results = []
+        updates = []
+        seen = set()
+        for index, item in enumerate(orders):
+            uid = item.get('uid') if isinstance(item, dict) else None
+            result = {'index': index, 'uid': uid, 'success': False}
+            results.append(result)
+
+            tenant_updates = item.get('tenants', []) if isinstance(item, dict) else None
+            if not uid or not isinstance(uid, str):
+                result['error'] = 'uid is required'
+            elif not isinstance(tenant_updates, list) or not all(isinstance(t, dict) for t in tenant_updates):
+                result['error'] = 'tenants must be a list of objects'
+            elif uid in seen:
+                result['error'] = 'Duplicate uid in request'
+            else:
+                seen.add(uid)
+                updates.append((uid, tenant_updates))
+
+        # Initialize Firebase
+        _, firestore_db = initialize_firebase()
+
+        outcomes = bulk_complete_orders(firestore_db, updates) if updates else {}
+        for result in results:
+            if 'error' in result:
+                continue
+            error = outcomes.get(result['uid'], 'Update failed')
+            if error is None:
+                result['success'] = True
+            else:
+                result['error'] = error
+
+        updated_count = sum(1 for result in results if result['success'])
+        logger.info(f"Bulk order update: {updated_count} of {len(orders)} orders completed")
 
-        # Return success response with updated data
         return JsonResponse({
             'success': True,
-            'message': 'Order updated successfully'
+            'count': len(results),
+            'updated': updated_count,
+            'failed': len(results) - updated_count,
+            'results': results,
         })
 
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except Exception as e:
-        logger.error(f"Error updating order: {str(e)}")
+        logger.error(f"Error updating orders in bulk: {str(e)}")
         return JsonResponse({
             'success': False,
             'error': 'Server error',
             'message': str(e)
         }, status=500)
 
+
 @csrf_exempt
-def get_completed_orders(request):
+async def get_completed_orders(request):
     """
-    Get all house_owners documents with order_status = "completed"
+    Get a page of house_owners documents with order_status = "completed"
+
+    Query parameters:
+        limit: orders per page, default 100, at most 500
+        cursor: next_cursor from the previous page; omit for the first page
+
+    Same as GET /api/orders/?status=completed. Pages come from the per-worker
+    OrderIndex, kept current by a Firestore listener, and from a direct query
+    while the listener is unavailable.
+    Responses carry an ETag and Last-Modified for the page. A request whose
+    If-None-Match matches the current ETag gets 304 Not Modified.
 
     Expected Response:
     {
@@ -257,62 +611,21 @@ def get_completed_orders(request):
                     "last_name": "Doe",
                 }
             }
-        ]
+        ],
+        "next_cursor": "EtrTQxBuBlRh7OJgzVdhOy04cD83"
     }
     """
     if request.method != 'GET':
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
-    try:
-        # Initialize Firebase
-        _, firestore_db = initialize_firebase()
-
-        # Query house_owners where order_status is "completed"
-        completed_orders = firestore_db.collection('house_owners').where('order_status', '==', 'completed').stream()
-
-        # Format the results for UI use
-        results = []
-        for order in completed_orders:
-            # Get the document data
-            order_data = order.to_dict()
-            uid = order.id
-
-            # Create a structured object for the UI
-            ui_order = {
-                'uid': uid,
-                'owner': {
-                    'first_name': order_data.get('first_name', ''),
-                    'last_name': order_data.get('last_name', ''),
-                    'email': order_data.get('email', ''),
-                    'mobile_number': order_data.get('mobile_number', ''),
-                    'address': order_data.get('address', '')
-                },
-                'order_info': {
-                    'order_status': order_data.get('order_status', ''),
-                    'order_date_time': order_data.get('order_date_time', '')
-                },
-                'tenants': []
-            }
-
-            # Process tenants with editable product_ids
-            if 'tenants' in order_data and isinstance(order_data['tenants'], list):
-                for i, tenant in enumerate(order_data['tenants']):
-                    ui_tenant = {
-                        'tenant_index': i,  # For tracking which tenant is updated
-                        'name': tenant.get('name', ''),
-                        'email': tenant.get('email', ''),
-                        'address': tenant.get('address', '')
-                    }
-                    ui_order['tenants'].append(ui_tenant)
-
-            results.append(ui_order)
+    order_filter = OrderFilter('completed')
+    limit, cursor, error = _parse_page_params(request, order_filter)
+    if error:
+        return JsonResponse({'success': False, 'error': error}, status=400)
 
-        # Return the UI-friendly completed orders
-        return JsonResponse({
-            'success': True,
-            'count': len(results),
-            'orders': results,
-        })
+    try:
+        # Serve the page from memory, falling back to a Firestore query
+        return await _list_orders(request, order_filter, limit, cursor)
 
     except Exception as e:
         logger.error(f"Error getting completed orders: {str(e)}")